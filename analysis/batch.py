@@ -0,0 +1,156 @@
+import asyncio
+import logging
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from analysis.jobs import get_executor, requeue_stale_jobs, _worker_loop
+from analysis.models import ReportJob
+from analysis.pipeline import aprepare_report, build_snapshot, build_report_context, LocationNotFound
+from analysis.utils import aget_ai_analysis
+from archive.models import Location, LocationRollup, LocationSummary, ReportSnapshot
+from archive.page_cache import ARCHIVE_SCOPE, bump_versions, location_scope
+from archive.rollups import period_start
+from core.ratelimit import rate_limit_patience
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_batch(batch: str, entries) -> int:
+    """
+    Queue a ReportJob per (location, country) in entries under the batch name.
+
+    Entries already in the batch are skipped, so queueing the same list again
+    only adds what is new and leaves finished work alone.
+    """
+    existing = set(ReportJob.objects.filter(batch=batch).values_list('location', 'country'))
+    jobs = []
+    for location, country in entries:
+        location, country = location.strip(), country.strip()
+        if location and (location, country) not in existing:
+            existing.add((location, country))
+            jobs.append(ReportJob(batch=batch, location=location, country=country))
+
+    ReportJob.objects.bulk_create(jobs)
+    return len(jobs)
+
+def batch_status(batch: str) -> dict:
+    counts = {status: 0 for status, _ in ReportJob.STATUS_CHOICES}
+    for job in ReportJob.objects.filter(batch=batch).only('status'):
+        counts[job.status] += 1
+    return counts
+
+def _claim_next(batch: str):
+    while True:
+        job = ReportJob.objects.filter(batch=batch, status=ReportJob.PENDING).order_by('created_at').first()
+        if job is None:
+            return None
+        if ReportJob.objects.filter(pk=job.pk, status=ReportJob.PENDING).update(
+            status=ReportJob.RUNNING, started_at=timezone.now()
+        ):
+            job.status = ReportJob.RUNNING
+            return job
+
+def _finish_job(job, status, error=''):
+    job.status = status
+    job.error = error
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at'])
+
+def _store_reports(rows) -> None:
+    # bulk_create skips ReportSnapshot.save() and its post_save signal, so the
+    # slug, location, location summaries, rollups and page versions are filled in here.
+    now = timezone.now()
+    slugs = set()
+    snapshots = []
+    for job, report, ai_result in rows:
+        snapshot = build_snapshot(report, ai_result)
+        snapshot.location = Location.resolve(
+            report['location_name'], report['country'], report['latitude'], report['longitude']
+        )
+        snapshot.slug = ReportSnapshot.unique_slug(report['location_name'], now, slugs)
+        slugs.add(snapshot.slug)
+        snapshots.append(snapshot)
+
+    locations = {snapshot.location for snapshot in snapshots}
+    with transaction.atomic():
+        ReportSnapshot.objects.bulk_create(snapshots)
+        for location in locations:
+            LocationSummary.rebuild(location)
+        # One rebuild per location and day; the week holding that day is rebuilt with it.
+        days = {(snapshot.location, period_start(snapshot.timestamp, 'day')): snapshot.timestamp for snapshot in snapshots}
+        for (location, _), timestamp in days.items():
+            LocationRollup.rebuild_periods(location, timestamp)
+
+        jobs = []
+        for (job, report, ai_result), snapshot in zip(rows, snapshots):
+            job.status = ReportJob.DONE
+            job.snapshot = snapshot
+            job.result = build_report_context(
+                report, snapshot.risk_scores['land_health'], ai_result.get('professional_analysis', {}), snapshot
+            )
+            job.finished_at = now
+            jobs.append(job)
+        ReportJob.objects.bulk_update(jobs, ['status', 'snapshot', 'result', 'finished_at'])
+
+    # As archive.signals.invalidate_snapshot_pages does for a single save.
+    bump_versions(ARCHIVE_SCOPE, *(location_scope(location.id) for location in locations))
+
+async def arun_batch(batch: str, concurrency: int = 4, flush_size: int = 25, on_result=None) -> dict:
+    """
+    Work through the pending jobs of a batch with at most `concurrency`
+    reports in flight, writing finished snapshots in bulk every `flush_size`
+    reports. Upstream calls wait for each provider's rate limit.
+    """
+    finished = []
+
+    async def flush():
+        rows = finished[:]
+        del finished[:]
+        if rows:
+            await sync_to_async(_store_reports)(rows)
+
+    async def worker():
+        while True:
+            job = await sync_to_async(_claim_next)(batch)
+            if job is None:
+                return
+            try:
+                report = await aprepare_report(job.location, job.country)
+                ai_result = await aget_ai_analysis(job.location, report['country'], report['raw_data'])
+            except LocationNotFound:
+                await sync_to_async(_finish_job)(job, ReportJob.NOT_FOUND)
+                status = ReportJob.NOT_FOUND
+            except Exception as e:
+                logger.exception("Batch report error for %s: %s", job.location, e)
+                await sync_to_async(_finish_job)(job, ReportJob.FAILED, str(e))
+                status = ReportJob.FAILED
+            else:
+                finished.append((job, report, ai_result))
+                if len(finished) >= flush_size:
+                    await flush()
+                status = ReportJob.DONE
+
+            if on_result:
+                on_result(job, status)
+
+    # Batch runs have no user waiting on them, so they queue for provider quota
+    # instead of failing over to fallback values after max_wait.
+    with rate_limit_patience(None):
+        await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    await flush()
+    return await sync_to_async(batch_status)(batch)
+
+def run_batch(batch: str, **kwargs) -> dict:
+    # Jobs whose worker died mid-report (e.g. a killed nightly run) are picked up again.
+    try:
+        requeue_stale_jobs(timedelta(seconds=getattr(settings, 'REPORT_JOB_STALE_AFTER', 300)), batch=batch)
+        return _worker_loop().run_until_complete(arun_batch(batch, **kwargs))
+    finally:
+        close_old_connections()
+
+def submit_batch(batch: str) -> None:
+    # With the 'queue' backend, process_report_jobs runs batch jobs like any other job.
+    if getattr(settings, 'REPORT_JOB_BACKEND', 'thread') == 'thread':
+        get_executor().submit(run_batch, batch, concurrency=getattr(settings, 'BATCH_CONCURRENCY', 4))
@@ -0,0 +1,274 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import httpx
+import requests
+from django.conf import settings
+from google import genai
+from google.genai import types
+from requests.adapters import HTTPAdapter
+from core import metrics
+from core.circuit import CircuitBreaker, CircuitOpen, get_breaker
+from core.ratelimit import RateLimited, TokenBucket, get_bucket
+
+USER_AGENT = 'ASASE-Environmental-Platform/1.0'
+
+DEFAULT_PROVIDER_CONFIG = {
+    'base_url': '',
+    'timeout': 10,
+    'retries': 2,
+    'backoff': 0.5,
+    'max_backoff': 4,
+    'pool_size': 10,
+    'rate_limit': None,
+    'burst': 1,
+    'max_wait': 5,
+    'failure_threshold': 5,
+    'reset_timeout': 30,
+}
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def provider_config(provider: str) -> dict:
+    config = dict(DEFAULT_PROVIDER_CONFIG)
+    config.update(getattr(settings, 'UPSTREAM_PROVIDERS', {}).get(provider, {}))
+    return config
+
+def provider_url(provider: str, url: str) -> str:
+    # Paths are resolved against the provider's base_url, which can point at a local stand-in.
+    if url.startswith('/'):
+        return provider_config(provider)['base_url'].rstrip('/') + url
+    return url
+
+def backoff_delay(config: dict, attempt: int) -> float:
+    # Full jitter: spreads retries from concurrent workers instead of synchronising them.
+    cap = min(config['max_backoff'], config['backoff'] * (2 ** attempt))
+    return random.uniform(0, cap)
+
+def provider_bucket(provider: str) -> TokenBucket | None:
+    config = provider_config(provider)
+    if not config['rate_limit']:
+        return None
+    return get_bucket(provider, config['rate_limit'], config['burst'])
+
+def pace_provider(provider: str) -> None:
+    # Queues the caller for the provider's next token; raises RateLimited past max_wait.
+    bucket = provider_bucket(provider)
+    if bucket:
+        bucket.acquire(provider_config(provider)['max_wait'])
+
+async def apace_provider(provider: str) -> None:
+    bucket = provider_bucket(provider)
+    if bucket:
+        await bucket.aacquire(provider_config(provider)['max_wait'])
+
+def provider_breaker(provider: str) -> CircuitBreaker:
+    config = provider_config(provider)
+    return get_breaker(provider, config['failure_threshold'], config['reset_timeout'])
+
+def _record_upstream_error(provider: str, error: Exception) -> None:
+    metrics.inc('asase_upstream_errors_total', help_text='Failed upstream calls by provider and error type.',
+                provider=provider, error=type(error).__name__)
+
+@contextmanager
+def provider_circuit(provider: str):
+    """
+    Run the enclosed upstream call through the provider's circuit breaker:
+    raises CircuitOpen up front while the provider is failing, and counts an
+    exception raised by the block as a failure. Latency and errors are
+    recorded in core.metrics.
+    """
+    breaker = provider_breaker(provider)
+    try:
+        breaker.before_call()
+    except CircuitOpen as e:
+        _record_upstream_error(provider, e)
+        raise
+
+    start = time.perf_counter()
+    try:
+        yield
+    except RateLimited as e:
+        breaker.record(None)
+        _record_upstream_error(provider, e)
+        raise
+    except Exception as e:
+        breaker.record(False)
+        _record_upstream_error(provider, e)
+        raise
+    except BaseException:
+        # Cancelled before the upstream answered; says nothing about its health.
+        breaker.record(None)
+        raise
+    finally:
+        metrics.observe('asase_upstream_seconds', time.perf_counter() - start,
+                        help_text='Upstream call latency, including retries.', provider=provider)
+    breaker.record(True)
+
+def retry_after_seconds(response) -> float | None:
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+def _honour_retry_after(provider: str, config: dict, response) -> float | None:
+    """
+    Apply the Retry-After of a throttled response. Returns how long this caller
+    should sleep before retrying (0 when the provider's bucket will hold it),
+    or None when there is no usable Retry-After or it exceeds max_wait.
+    """
+    retry_after = retry_after_seconds(response)
+    if retry_after is None:
+        return None
+    # The provider said how long to back off: hold every caller, not just this one.
+    bucket = provider_bucket(provider)
+    if bucket:
+        bucket.penalize(retry_after)
+    if retry_after > config['max_wait']:
+        return None
+    return 0.0 if bucket else retry_after
+
+def get_session(provider: str) -> requests.Session:
+    session = _sessions.get(provider)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(provider)
+            if session is None:
+                pool_size = provider_config(provider)['pool_size']
+                session = requests.Session()
+                session.headers['User-Agent'] = USER_AGENT
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _sessions[provider] = session
+    return session
+
+def get_async_client(provider: str) -> httpx.AsyncClient:
+    # httpx connection pools are bound to the event loop that opened them, so keep one per loop.
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    client = clients.get(provider)
+    if client is None:
+        config = provider_config(provider)
+        client = httpx.AsyncClient(
+            headers={'User-Agent': USER_AGENT},
+            timeout=config['timeout'],
+            limits=httpx.Limits(
+                max_connections=config['pool_size'],
+                max_keepalive_connections=config['pool_size'],
+            ),
+        )
+        clients[provider] = client
+    return client
+
+def _get_with_retries(provider: str, url: str, **kwargs) -> requests.Response:
+    config = provider_config(provider)
+    session = get_session(provider)
+    url = provider_url(provider, url)
+    kwargs.setdefault('timeout', config['timeout'])
+
+    for attempt in range(config['retries'] + 1):
+        last_attempt = attempt == config['retries']
+        pace_provider(provider)
+        try:
+            response = session.get(url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if last_attempt:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUS_CODES or last_attempt:
+                return response
+            if retry_after_seconds(response) is not None:
+                delay = _honour_retry_after(provider, config, response)
+                if delay is None:
+                    return response
+                time.sleep(delay)
+                continue
+        time.sleep(backoff_delay(config, attempt))
+
+def provider_get(provider: str, url: str, **kwargs) -> requests.Response:
+    with provider_circuit(provider):
+        response = _get_with_retries(provider, url, **kwargs)
+        if response.status_code in RETRY_STATUS_CODES:
+            response.raise_for_status()
+    return response
+
+async def _aget_with_retries(provider: str, url: str, **kwargs) -> httpx.Response:
+    config = provider_config(provider)
+    client = get_async_client(provider)
+    url = provider_url(provider, url)
+
+    for attempt in range(config['retries'] + 1):
+        last_attempt = attempt == config['retries']
+        await apace_provider(provider)
+        try:
+            response = await client.get(url, **kwargs)
+        except httpx.TransportError:
+            if last_attempt:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUS_CODES or last_attempt:
+                return response
+            if retry_after_seconds(response) is not None:
+                delay = _honour_retry_after(provider, config, response)
+                if delay is None:
+                    return response
+                await asyncio.sleep(delay)
+                continue
+        await asyncio.sleep(backoff_delay(config, attempt))
+
+async def aprovider_get(provider: str, url: str, **kwargs) -> httpx.Response:
+    with provider_circuit(provider):
+        response = await _aget_with_retries(provider, url, **kwargs)
+        if response.status_code in RETRY_STATUS_CODES:
+            response.raise_for_status()
+    return response
+
+def _gemini_http_options() -> types.HttpOptions:
+    config = provider_config('gemini')
+    return types.HttpOptions(
+        base_url=config['base_url'] or None,
+        timeout=int(config['timeout'] * 1000),
+        retry_options=types.HttpRetryOptions(
+            attempts=config['retries'] + 1,
+            initial_delay=config['backoff'],
+            max_delay=config['max_backoff'],
+            jitter=1,
+            http_status_codes=sorted(RETRY_STATUS_CODES),
+        ),
+    )
+
+_async_gemini_clients = weakref.WeakKeyDictionary()
+
+def get_async_gemini_client():
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if not api_key:
+        return None
+
+    loop = asyncio.get_running_loop()
+    clients = _async_gemini_clients.setdefault(loop, {})
+    client_key = (api_key, provider_config('gemini')['base_url'])
+    client = clients.get(client_key)
+    if client is None:
+        client = genai.Client(api_key=api_key, http_options=_gemini_http_options())
+        clients[client_key] = client
+    return client.aio
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import re
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from analysis.ndvi import PNG_SIGNATURE, TILE_SIZE
+
+# Providers served by FakeUpstreams; each answers under /<provider>/.
+FAKE_PROVIDERS = ('nominatim', 'openweather', 'open_meteo', 'gibs', 'gemini')
+
+# A coarse stand-in for the GIBS NDVI colormap: the range and colour of each palette entry.
+FAKE_NDVI_COLORMAP = [
+    ('[-0.2,0)', (5, 24, 82)),
+    ('[0,0.1)', (255, 255, 255)),
+    ('[0.1,0.2)', (206, 126, 69)),
+    ('[0.2,0.3)', (223, 146, 63)),
+    ('[0.3,0.4)', (253, 185, 56)),
+    ('[0.4,0.5)', (255, 229, 0)),
+    ('[0.5,0.6)', (203, 220, 0)),
+    ('[0.6,0.7)', (102, 194, 0)),
+    ('[0.7,0.8)', (40, 161, 5)),
+    ('[0.8,0.9)', (16, 124, 12)),
+    ('[0.9,1]', (5, 89, 13)),
+]
+
+FAKE_ANALYSIS = {
+    'assessment': "Moderate flood exposure from recent cloud cover and humidity; no acute hazards detected.",
+    'sdg_15_compliance': "Vegetation cover is within the expected range, consistent with SDG 15.3 neutrality.",
+    'recommendations': "Immediate: clear drainage channels. Long-term: restore riparian vegetation.",
+}
+
+
+def _digest(*parts) -> int:
+    # Deterministic pseudo-random value per request, so repeated runs see the same data.
+    return int.from_bytes(hashlib.sha256('|'.join(map(str, parts)).encode()).digest()[:8], 'big')
+
+def _png_chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return (struct.pack('>I', len(data)) + chunk_type + data
+            + struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff))
+
+def ndvi_colormap_xml() -> bytes:
+    entries = ''.join(
+        f'<ColorMapEntry rgb="{",".join(map(str, rgb))}" transparent="false" value="{value}"/>'
+        for value, rgb in FAKE_NDVI_COLORMAP
+    )
+    return f'<ColorMaps><ColorMap title="NDVI"><Entries>{entries}</Entries></ColorMap></ColorMaps>'.encode()
+
+def ndvi_tile_png() -> bytes:
+    """A GIBS-style palette PNG striped with every colour of the NDVI colormap."""
+    palette = b''.join(bytes(rgb) for _, rgb in FAKE_NDVI_COLORMAP)
+    stripe = TILE_SIZE // len(FAKE_NDVI_COLORMAP) + 1
+    row = b'\x00' + bytes(min(x // stripe, len(FAKE_NDVI_COLORMAP) - 1) for x in range(TILE_SIZE))
+    header = struct.pack('>IIBBBBB', TILE_SIZE, TILE_SIZE, 8, 3, 0, 0, 0)
+    return (PNG_SIGNATURE + _png_chunk(b'IHDR', header) + _png_chunk(b'PLTE', palette)
+            + _png_chunk(b'IDAT', zlib.compress(row * TILE_SIZE)) + _png_chunk(b'IEND', b''))
+
+def _gemini_text(stream: bool, seed: int) -> str:
+    score = 3 + seed % 6
+    if stream:
+        return (f"LAND_HEALTH_SCORE: {score}\n[[ASSESSMENT]]\n{FAKE_ANALYSIS['assessment']}\n"
+                f"[[SDG_15_COMPLIANCE]]\n{FAKE_ANALYSIS['sdg_15_compliance']}\n"
+                f"[[RECOMMENDATIONS]]\n{FAKE_ANALYSIS['recommendations']}")
+    return json.dumps({
+        'inferred_land_health_score': score,
+        'professional_analysis': {
+            'title': 'ENVIRONMENTAL ANALYSIS', 'timestamp': '', 'subject': 'ASSESSMENT (SDG 15)',
+            **FAKE_ANALYSIS,
+        },
+    })
+
+def _gemini_response(text: str) -> dict:
+    return {
+        'candidates': [{'content': {'role': 'model', 'parts': [{'text': text}]}, 'finishReason': 'STOP'}],
+        'usageMetadata': {'promptTokenCount': 400, 'candidatesTokenCount': 120, 'totalTokenCount': 520},
+    }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'AsaseFakeUpstream/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type='application/json'):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self):
+        # Each provider is mounted under /<provider>/, matching the base_url FakeUpstreams hands out.
+        parts = urlsplit(self.path)
+        provider, _, path = parts.path.lstrip('/').partition('/')
+        if provider not in FAKE_PROVIDERS:
+            return None, None, None
+        self.server.fakes.count(provider)
+        time.sleep(self.server.fakes.latency.get(provider, 0))
+        return provider, '/' + path, {key: values[0] for key, values in parse_qs(parts.query).items()}
+
+    def do_GET(self):
+        provider, path, query = self._route()
+        if provider == 'nominatim' and path == '/search':
+            seed = _digest(query.get('q', ''))
+            return self._send(200, [{
+                'lat': str(round(-30 + (seed % 6000) / 100, 4)),
+                'lon': str(round(-15 + (seed // 6000 % 6000) / 100, 4)),
+                'display_name': f"{query.get('q', '')}, Ghana",
+            }])
+        if provider == 'nominatim' and path == '/reverse':
+            seed = _digest(query.get('lat'), query.get('lon'))
+            return self._send(200, {'address': {'village': f"Village {seed % 10000}", 'country': 'Ghana'}})
+        if provider == 'openweather' and path == '/data/2.5/weather':
+            seed = _digest(query.get('lat'), query.get('lon'))
+            return self._send(200, {
+                'clouds': {'all': seed % 100},
+                'main': {'humidity': 40 + seed % 60},
+                'rain': {'1h': (seed % 50) / 10},
+            })
+        if provider == 'open_meteo' and path == '/v1/elevation':
+            return self._send(200, {'elevation': [float(_digest(query.get('latitude'), query.get('longitude')) % 1500)]})
+        if provider == 'gibs' and path.endswith('.png'):
+            return self._send(200, self.server.fakes.tile, 'image/png')
+        if provider == 'gibs' and path.endswith('.xml'):
+            return self._send(200, self.server.fakes.colormap, 'text/xml')
+        self._send(404, {'error': 'not found'})
+
+    def do_POST(self):
+        provider, path, query = self._route()
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        match = re.search(r'/models/[^/:]+:(generateContent|streamGenerateContent)$', path or '')
+        if provider != 'gemini' or not match:
+            return self._send(404, {'error': 'not found'})
+
+        seed = _digest(body)
+        if match.group(1) == 'generateContent':
+            return self._send(200, _gemini_response(_gemini_text(False, seed)))
+
+        # Server-sent events, one small chunk of text per event like the real API.
+        text = _gemini_text(True, seed)
+        events = b''.join(
+            b'data: ' + json.dumps(_gemini_response(text[i:i + 64])).encode() + b'\r\n\r\n'
+            for i in range(0, len(text), 64)
+        )
+        self._send(200, events, 'text/event-stream')
+
+
+class FakeUpstreams:
+    """
+    Local stand-ins for Nominatim, OpenWeather, Open-Meteo, GIBS and Gemini,
+    served from one threaded HTTP server. Responses are deterministic for a
+    given request, and latency (seconds per request) can be set per provider.
+    """
+
+    def __init__(self, latency=None, host='127.0.0.1', port=0):
+        self.latency = dict(latency or {})
+        self.tile = ndvi_tile_png()
+        self.colormap = ndvi_colormap_xml()
+        self.requests = {provider: 0 for provider in FAKE_PROVIDERS}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.fakes = self
+        self._thread = None
+
+    def count(self, provider):
+        with self._lock:
+            self.requests[provider] += 1
+
+    def base_url(self, provider):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/{provider}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-upstreams', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from analysis.models import ReportJob
+from analysis.pipeline import arun_live_report, LocationNotFound
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_worker_state = threading.local()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'REPORT_JOB_WORKERS', 4),
+                thread_name_prefix='report-job',
+            )
+        return _executor
+
+def _worker_loop() -> asyncio.AbstractEventLoop:
+    # Each worker thread keeps one event loop, so the per-loop HTTP and Gemini
+    # clients (and their connection pools) are reused across jobs.
+    loop = getattr(_worker_state, 'loop', None)
+    if loop is None or loop.is_closed():
+        loop = _worker_state.loop = asyncio.new_event_loop()
+    return loop
+
+def submit_job(job_id) -> None:
+    # With the 'queue' backend jobs stay pending until `manage.py process_report_jobs` claims them.
+    if getattr(settings, 'REPORT_JOB_BACKEND', 'thread') == 'thread':
+        get_executor().submit(run_job, job_id)
+
+def claim_job(job_id) -> bool:
+    return ReportJob.objects.filter(pk=job_id, status=ReportJob.PENDING).update(
+        status=ReportJob.RUNNING, started_at=timezone.now()
+    ) == 1
+
+def run_job(job_id) -> bool:
+    """Run a pending job to completion; returns False if another worker already claimed it."""
+    try:
+        if not claim_job(job_id):
+            return False
+
+        job = ReportJob.objects.get(pk=job_id)
+        try:
+            result = _worker_loop().run_until_complete(
+                arun_live_report(job.location, job.country, job.latitude, job.longitude)
+            )
+            job.status = ReportJob.DONE
+            job.result = result
+            job.snapshot_id = result.get('snapshot_id')
+        except LocationNotFound:
+            job.status = ReportJob.NOT_FOUND
+        except Exception as e:
+            logger.exception("Report job error: %s", e)
+            job.status = ReportJob.FAILED
+            job.error = str(e)
+
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'result', 'snapshot', 'error', 'finished_at'])
+        return True
+    finally:
+        close_old_connections()
+
+def requeue_stale_jobs(older_than: timedelta, batch: str = None) -> int:
+    # Jobs left running by a worker that died mid-report go back to the queue.
+    jobs = ReportJob.objects.filter(status=ReportJob.RUNNING, started_at__lt=timezone.now() - older_than)
+    if batch is not None:
+        jobs = jobs.filter(batch=batch)
+    return jobs.update(status=ReportJob.PENDING, started_at=None)
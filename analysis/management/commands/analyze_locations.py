@@ -0,0 +1,66 @@
+import csv
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from analysis.batch import enqueue_batch, run_batch
+from analysis.models import ReportJob
+from core.african_countries import AFRICAN_COUNTRIES
+
+
+class Command(BaseCommand):
+    help = (
+        'Run live reports for many locations concurrently. Re-running with the same '
+        '--batch resumes it: finished locations are skipped and interrupted ones retried.'
+    )
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group()
+        source.add_argument('--csv', help='CSV file with location,country columns.')
+        source.add_argument('--countries', action='store_true',
+                            help='Analyze every country in AFRICAN_COUNTRIES.')
+        parser.add_argument('--batch', help='Batch name (default: analyze-<today>).')
+        parser.add_argument('--concurrency', type=int, default=None,
+                            help='Reports in flight at once (default: BATCH_CONCURRENCY).')
+        parser.add_argument('--flush-size', type=int, default=25,
+                            help='Snapshots written per bulk insert.')
+        parser.add_argument('--retry-failed', action='store_true',
+                            help='Queue failed locations in the batch again.')
+
+    def _read_csv(self, path):
+        try:
+            with open(path, newline='', encoding='utf-8') as f:
+                rows = [row for row in csv.reader(f) if row and row[0].strip()]
+        except OSError as e:
+            raise CommandError(f"Cannot read {path}: {e}")
+
+        if rows and rows[0][0].strip().lower() == 'location':
+            rows = rows[1:]
+        return [(row[0], row[1] if len(row) > 1 else '') for row in rows]
+
+    def handle(self, *args, **options):
+        batch = options['batch'] or f"analyze-{timezone.localdate().isoformat()}"
+
+        if options['csv']:
+            entries = self._read_csv(options['csv'])
+        elif options['countries']:
+            entries = [(country, country) for country in AFRICAN_COUNTRIES]
+        else:
+            entries = []
+
+        if not entries and not ReportJob.objects.filter(batch=batch).exists():
+            raise CommandError('Nothing to analyze: pass --csv or --countries, or an existing --batch.')
+
+        queued = enqueue_batch(batch, entries)
+        if options['retry_failed']:
+            queued += ReportJob.objects.filter(batch=batch, status=ReportJob.FAILED).update(
+                status=ReportJob.PENDING, error='', started_at=None, finished_at=None
+            )
+        self.stdout.write(f"Batch {batch}: {queued} location(s) queued")
+
+        def on_result(job, status):
+            self.stdout.write(f"  {job.location}, {job.country}: {status}")
+
+        concurrency = options['concurrency'] or getattr(settings, 'BATCH_CONCURRENCY', 4)
+        counts = run_batch(batch, concurrency=concurrency, flush_size=options['flush_size'], on_result=on_result)
+        summary = ', '.join(f"{count} {status}" for status, count in counts.items() if count)
+        self.stdout.write(self.style.SUCCESS(f"Batch {batch}: {summary or 'empty'}"))
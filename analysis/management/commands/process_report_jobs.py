@@ -0,0 +1,46 @@
+import time
+from concurrent.futures import wait
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from analysis.jobs import get_executor, run_job, requeue_stale_jobs
+from analysis.models import ReportJob
+
+
+class Command(BaseCommand):
+    help = 'Process queued live report jobs (for REPORT_JOB_BACKEND = "queue").'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Process the current queue and exit.')
+        parser.add_argument('--batch-size', type=int, default=8)
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument('--stale-after', type=int, default=None,
+                            help='Requeue jobs that have been running for this many seconds '
+                                 '(default: REPORT_JOB_STALE_AFTER).')
+
+    def handle(self, *args, **options):
+        executor = get_executor()
+        stale_after = options['stale_after']
+        if stale_after is None:
+            stale_after = getattr(settings, 'REPORT_JOB_STALE_AFTER', 300)
+        stale_after = timedelta(seconds=stale_after)
+
+        while True:
+            requeued = requeue_stale_jobs(stale_after)
+            if requeued:
+                self.stdout.write(f"Requeued {requeued} stale job(s)")
+
+            job_ids = list(
+                ReportJob.objects.filter(status=ReportJob.PENDING)
+                .order_by('created_at')
+                .values_list('id', flat=True)[:options['batch_size']]
+            )
+            if job_ids:
+                futures = [executor.submit(run_job, job_id) for job_id in job_ids]
+                wait(futures)
+                processed = sum(1 for future in futures if future.result())
+                self.stdout.write(f"Processed {processed} job(s)")
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['poll_interval'])
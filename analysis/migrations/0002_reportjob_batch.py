@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportjob',
+            name='batch',
+            field=models.CharField(blank=True, db_index=True, max_length=100),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0002_reportjob_batch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportjob',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='reportjob',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
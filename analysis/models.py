@@ -1,3 +1,50 @@
+import uuid
 from django.db import models
 
-# Create your models here.
+
+class ReportJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    NOT_FOUND = 'not_found'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (NOT_FOUND, 'Location not found'),
+        (FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    location = models.CharField(max_length=255)
+    country = models.CharField(max_length=100, blank=True)
+    # Set when the report was started from a map click.
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    # Jobs created by `manage.py analyze_locations` or the batch API share a batch name.
+    batch = models.CharField(max_length=100, blank=True, db_index=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    snapshot = models.ForeignKey(
+        'archive.ReportSnapshot', null=True, blank=True, on_delete=models.SET_NULL, related_name='+'
+    )
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def is_finished(self):
+        return self.status in (self.DONE, self.NOT_FOUND, self.FAILED)
+
+    def __str__(self):
+        return f"Report job for {self.location} ({self.status})"
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='reportjob_status_idx'),
+        ]
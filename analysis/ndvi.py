@@ -0,0 +1,405 @@
+import asyncio
+import hashlib
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import date, timedelta
+from pathlib import Path
+from xml.etree import ElementTree
+from django.conf import settings
+from analysis.clients import provider_get, aprovider_get
+from django.core.cache import cache
+from core.cache import cache_get_or_compute, acache_get_or_compute
+
+# Path on the gibs provider's base_url.
+GIBS_NDVI_TILE_URL = (
+    "/wmts/epsg4326/best/MODIS_Terra_NDVI_8Day/default/"
+    "{date}/250m/{level}/{row}/{col}.png"
+)
+# The layer's published colormap: one entry per tile palette colour with the NDVI range it stands for.
+GIBS_NDVI_COLORMAP_URL = "/colormaps/v1.3/MODIS_Terra_NDVI_8Day.xml"
+COLORMAP_CACHE_KEY = "ndvi_colormap"
+COLORMAP_TIMEOUT = 30 * 86400
+
+# GIBS EPSG:4326 tile matrices: 512px tiles anchored at (90N, 180W), level 0
+# is 0.5625 degrees per pixel and each level halves it (the 250m set stops at 8).
+TILE_SIZE = 512
+LEVEL0_RESOLUTION = 0.5625
+MAX_LEVEL = 8
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+RASTER_MAGIC = b'NDV2'
+RASTER_HEADER = struct.Struct('>4sII')
+
+# Rasters store one byte per pixel: 0-250 spans NDVI_RANGE linearly, 255 is no data.
+NDVI_RANGE = (-0.2, 1.0)
+NODATA = 255
+
+class TileUnavailable(Exception):
+    pass
+
+
+def tile_level():
+    return min(MAX_LEVEL, getattr(settings, 'NDVI_TILE_LEVEL', 7))
+
+def composite_date(on_date=None, periods_back=0):
+    # MODIS 8-day composites start on day-of-year 1, 9, 17, ... and are
+    # published a couple of weeks after they close.
+    lag = getattr(settings, 'NDVI_LAG_DAYS', 16)
+    target = (on_date or date.today()) - timedelta(days=lag + 8 * periods_back)
+    start_of_year = date(target.year, 1, 1)
+    day_of_year = (target - start_of_year).days
+    return start_of_year + timedelta(days=(day_of_year // 8) * 8)
+
+def tile_for(lat, lon, level):
+    span = TILE_SIZE * LEVEL0_RESOLUTION / (2 ** level)
+    resolution = span / TILE_SIZE
+    columns = int(-(-360 // span))
+    rows = int(-(-180 // span))
+
+    col = min(columns - 1, max(0, int((lon + 180) // span)))
+    row = min(rows - 1, max(0, int((90 - lat) // span)))
+    x = min(TILE_SIZE - 1, max(0, int(((lon + 180) - col * span) / resolution)))
+    y = min(TILE_SIZE - 1, max(0, int(((90 - lat) - row * span) / resolution)))
+    return row, col, x, y
+
+def tile_url(tile_date, level, row, col):
+    return GIBS_NDVI_TILE_URL.format(date=tile_date.isoformat(), level=level, row=row, col=col)
+
+
+def _unfilter(filter_type, line, previous, bpp):
+    length = len(line)
+    if filter_type == 0:
+        return
+    if filter_type == 1:
+        for i in range(bpp, length):
+            line[i] = (line[i] + line[i - bpp]) & 0xFF
+    elif filter_type == 2:
+        for i in range(length):
+            line[i] = (line[i] + previous[i]) & 0xFF
+    elif filter_type == 3:
+        for i in range(length):
+            left = line[i - bpp] if i >= bpp else 0
+            line[i] = (line[i] + ((left + previous[i]) >> 1)) & 0xFF
+    elif filter_type == 4:
+        for i in range(length):
+            a = line[i - bpp] if i >= bpp else 0
+            b = previous[i]
+            c = previous[i - bpp] if i >= bpp else 0
+            p = a + b - c
+            pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+            if pa <= pb and pa <= pc:
+                predictor = a
+            elif pb <= pc:
+                predictor = b
+            else:
+                predictor = c
+            line[i] = (line[i] + predictor) & 0xFF
+    else:
+        raise ValueError(f"Unknown PNG filter type {filter_type}")
+
+def decode_png(data):
+    """
+    Decode an 8-bit, non-interlaced PNG into (width, height, channels,
+    color_type, pixels, palette, transparency). GIBS serves its NDVI tiles in
+    that form, so this avoids an imaging dependency.
+    """
+    if not data.startswith(PNG_SIGNATURE):
+        raise ValueError("Not a PNG file")
+
+    position = len(PNG_SIGNATURE)
+    header = None
+    palette = None
+    transparency = None
+    compressed = []
+
+    while position < len(data):
+        length, chunk_type = struct.unpack('>I4s', data[position:position + 8])
+        chunk = data[position + 8:position + 8 + length]
+        position += 12 + length
+
+        if chunk_type == b'IHDR':
+            header = struct.unpack('>IIBBBBB', chunk)
+        elif chunk_type == b'PLTE':
+            palette = [tuple(chunk[i:i + 3]) for i in range(0, len(chunk), 3)]
+        elif chunk_type == b'tRNS':
+            transparency = chunk
+        elif chunk_type == b'IDAT':
+            compressed.append(chunk)
+        elif chunk_type == b'IEND':
+            break
+
+    if header is None:
+        raise ValueError("PNG has no IHDR chunk")
+    width, height, bit_depth, color_type, _, _, interlace = header
+    if bit_depth != 8 or interlace:
+        raise ValueError("Only 8-bit, non-interlaced PNG tiles are supported")
+
+    channels = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}[color_type]
+    stride = width * channels
+    raw = zlib.decompress(b''.join(compressed))
+    pixels = bytearray(height * stride)
+    previous = bytearray(stride)
+
+    for y in range(height):
+        offset = y * (stride + 1)
+        line = bytearray(raw[offset + 1:offset + 1 + stride])
+        _unfilter(raw[offset], line, previous, channels)
+        pixels[y * stride:(y + 1) * stride] = line
+        previous = line
+
+    return width, height, channels, color_type, bytes(pixels), palette, transparency
+
+
+def _entry_ndvi(value):
+    # Entries give the data range they cover, e.g. "[0.1,0.105)", "[1]" or "[0.99,+INF)".
+    bounds = [float(bound) for bound in value.strip('[]()').split(',')]
+    finite = [bound for bound in bounds if math.isfinite(bound)]
+    return round(sum(finite) / len(finite), 6) if finite else None
+
+def parse_colormap(xml):
+    """
+    The entries of a GIBS colormap document, in order, as (rgb, ndvi) pairs.
+    ndvi is the middle of the entry's range, or None for no-data entries.
+    """
+    entries = []
+    for element in ElementTree.fromstring(xml).iter():
+        if not element.tag.endswith('ColorMapEntry'):
+            continue
+        rgb = tuple(int(part) for part in element.get('rgb').split(','))
+        value = element.get('value')
+        if element.get('nodata') == 'true' or element.get('transparent') == 'true' or not value:
+            entries.append((rgb, None))
+        else:
+            entries.append((rgb, _entry_ndvi(value)))
+    return entries
+
+def ndvi_to_code(value):
+    low, high = NDVI_RANGE
+    value = max(low, min(high, value))
+    return round((value - low) / (high - low) * 250)
+
+def code_to_ndvi(code):
+    if code == NODATA:
+        return None
+    low, high = NDVI_RANGE
+    return round(low + code / 250 * (high - low), 3)
+
+def palette_codes(palette, colormap):
+    """
+    The raster code for each palette index. GIBS builds tile palettes from the
+    colormap, so index i is colormap entry i; a palette in any other order is
+    matched on exact colour, and colours the colormap lacks are no data.
+    """
+    by_color = {}
+    for rgb, value in colormap:
+        by_color.setdefault(rgb, value)
+
+    codes = []
+    for index, rgb in enumerate(palette):
+        if index < len(colormap) and colormap[index][0] == rgb:
+            value = colormap[index][1]
+        else:
+            value = by_color.get(rgb)
+        codes.append(NODATA if value is None else ndvi_to_code(value))
+    return codes
+
+def png_to_raster(data, colormap):
+    width, height, channels, color_type, pixels, palette, transparency = decode_png(data)
+
+    if color_type == 3:
+        table = bytearray([NODATA] * 256)
+        for index, code in enumerate(palette_codes(palette or [], colormap)):
+            alpha = transparency[index] if transparency and index < len(transparency) else 255
+            table[index] = NODATA if alpha == 0 else code
+        codes = pixels.translate(bytes(table))
+    else:
+        by_color = {}
+        for rgb, value in colormap:
+            by_color.setdefault(rgb, NODATA if value is None else ndvi_to_code(value))
+        memo = {}
+        codes = bytearray(width * height)
+        for i in range(width * height):
+            pixel = pixels[i * channels:(i + 1) * channels]
+            code = memo.get(pixel)
+            if code is None:
+                alpha = pixel[-1] if channels in (2, 4) else 255
+                rgb = tuple(pixel[:3]) if channels >= 3 else (pixel[0],) * 3
+                code = memo[pixel] = NODATA if alpha == 0 else by_color.get(rgb, NODATA)
+            codes[i] = code
+        codes = bytes(codes)
+
+    return RASTER_HEADER.pack(RASTER_MAGIC, width, height) + codes
+
+
+class TileStore:
+    """
+    Content-addressed on-disk tile cache.
+
+    objects/ holds decoded rasters named by the SHA-256 of the source PNG
+    (identical tiles, e.g. open ocean, are stored once); index/ maps a
+    date/level/row/col tile key to its object. Rasters are read through
+    mmap, so sampling a point touches a single page.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self._maps = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _index_path(self, tile_key):
+        return self.directory / 'index' / f"{tile_key}.ref"
+
+    def _object_path(self, digest):
+        # Named for the raster format, so rasters decoded by an older version are downloaded again.
+        return self.directory / 'objects' / digest[:2] / f"{digest}.{RASTER_MAGIC.decode().lower()}"
+
+    def _write_atomic(self, path, content):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=path.parent)
+        with os.fdopen(handle, 'wb') as output:
+            output.write(content)
+        os.replace(temporary, path)
+
+    def has_object(self, digest):
+        return self._object_path(digest).exists()
+
+    def lookup(self, tile_key):
+        try:
+            digest = self._index_path(tile_key).read_text().strip()
+        except FileNotFoundError:
+            return None
+        return digest if digest and self.has_object(digest) else None
+
+    def put_tile(self, tile_key, png_bytes, colormap):
+        digest = hashlib.sha256(png_bytes).hexdigest()
+        object_path = self._object_path(digest)
+        if not object_path.exists():
+            self._write_atomic(object_path, png_to_raster(png_bytes, colormap))
+        self._write_atomic(self._index_path(tile_key), digest.encode())
+        return digest
+
+    def _raster(self, digest):
+        mapped = self._maps.get(digest)
+        if mapped is not None:
+            self._maps.move_to_end(digest)
+            return mapped
+
+        with open(self._object_path(digest), 'rb') as raster_file:
+            mapped = mmap.mmap(raster_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps[digest] = mapped
+        if len(self._maps) > 32:
+            _, evicted = self._maps.popitem(last=False)
+            evicted.close()
+        return mapped
+
+    def sample(self, digest, x, y):
+        with self._lock:
+            mapped = self._raster(digest)
+            magic, width, height = RASTER_HEADER.unpack_from(mapped, 0)
+            if magic != RASTER_MAGIC:
+                raise ValueError(f"Corrupt NDVI raster {digest}")
+            x = min(x, width - 1)
+            y = min(y, height - 1)
+            return code_to_ndvi(mapped[RASTER_HEADER.size + y * width + x])
+
+
+_store = None
+
+def get_tile_store():
+    global _store
+    directory = settings.NDVI_TILE_CACHE_DIR
+    if _store is None or _store.directory != Path(directory):
+        _store = TileStore(directory)
+    return _store
+
+
+def _candidate_tiles(lat, lon, on_date):
+    level = tile_level()
+    row, col, x, y = tile_for(lat, lon, level)
+    # Fall back one period in case the newest composite is not published yet.
+    for periods_back in range(2):
+        tile_date = composite_date(on_date, periods_back)
+        yield f"{tile_date.isoformat()}/{level}/{row}/{col}", tile_url(tile_date, level, row, col), x, y
+
+def _fetch_colormap():
+    response = provider_get('gibs', GIBS_NDVI_COLORMAP_URL)
+    response.raise_for_status()
+    return parse_colormap(response.content)
+
+async def _afetch_colormap():
+    response = await aprovider_get('gibs', GIBS_NDVI_COLORMAP_URL)
+    response.raise_for_status()
+    return parse_colormap(response.content)
+
+def ndvi_colormap():
+    return cache_get_or_compute(COLORMAP_CACHE_KEY, _fetch_colormap, COLORMAP_TIMEOUT)
+
+async def andvi_colormap():
+    return await acache_get_or_compute(COLORMAP_CACHE_KEY, _afetch_colormap, COLORMAP_TIMEOUT)
+
+def _download_tile(store, tile_key, url):
+    digest = store.lookup(tile_key)
+    if digest:
+        return digest
+
+    response = provider_get('gibs', url)
+    if response.status_code in (400, 404):
+        return None
+    response.raise_for_status()
+    return store.put_tile(tile_key, response.content, ndvi_colormap())
+
+async def _adownload_tile(store, tile_key, url):
+    digest = store.lookup(tile_key)
+    if digest:
+        return digest
+
+    response = await aprovider_get('gibs', url)
+    if response.status_code in (400, 404):
+        return None
+    response.raise_for_status()
+    colormap = await andvi_colormap()
+    # Decoding a tile is CPU-bound, so keep it off the event loop.
+    return await asyncio.to_thread(store.put_tile, tile_key, response.content, colormap)
+
+def _tile_cache_key(tile_key):
+    return f"ndvi_tile_{tile_key}"
+
+def _tile_digest(store, tile_key, url):
+    key = _tile_cache_key(tile_key)
+    digest = cache_get_or_compute(key, lambda: _download_tile(store, tile_key, url), 8 * 86400)
+    if digest and not store.has_object(digest):
+        # Digests are shared by every host but rasters live on local disk, which a
+        # redeploy or another host does not have: download the tile again.
+        cache.delete(key)
+        digest = cache_get_or_compute(key, lambda: _download_tile(store, tile_key, url), 8 * 86400)
+    return digest
+
+async def _atile_digest(store, tile_key, url):
+    key = _tile_cache_key(tile_key)
+    digest = await acache_get_or_compute(key, lambda: _adownload_tile(store, tile_key, url), 8 * 86400)
+    if digest and not store.has_object(digest):
+        await cache.adelete(key)
+        digest = await acache_get_or_compute(key, lambda: _adownload_tile(store, tile_key, url), 8 * 86400)
+    return digest
+
+def sample_ndvi(lat, lon, on_date=None, store=None):
+    store = store or get_tile_store()
+    for tile_key, url, x, y in _candidate_tiles(lat, lon, on_date):
+        digest = _tile_digest(store, tile_key, url)
+        if digest:
+            return store.sample(digest, x, y)
+    raise TileUnavailable(f"No NDVI composite available for {lat}, {lon}")
+
+async def asample_ndvi(lat, lon, on_date=None, store=None):
+    store = store or get_tile_store()
+    for tile_key, url, x, y in _candidate_tiles(lat, lon, on_date):
+        digest = await _atile_digest(store, tile_key, url)
+        if digest:
+            return store.sample(digest, x, y)
+    raise TileUnavailable(f"No NDVI composite available for {lat}, {lon}")
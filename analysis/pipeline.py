@@ -0,0 +1,264 @@
+import asyncio
+import hashlib
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from analysis.utils import (
+    aget_coords_from_location, areverse_geocode, aget_weather_data,
+    aget_elevation_data, aget_real_ndvi, aget_ai_analysis
+)
+from archive.models import GEOHASH_PRECISION, ReportSnapshot, location_key
+from archive.nearby import snapshots_near
+from core.cache import acache_get_or_compute
+from core.geo import geohash_encode
+from core.metrics import inc, stage
+
+INPUT_LABELS = {'weather': 'Weather', 'elevation': 'Elevation', 'ndvi': 'NDVI'}
+ANALYSIS_FIELDS = ('title', 'timestamp', 'subject', 'assessment', 'sdg_15_compliance', 'recommendations')
+
+
+class LocationNotFound(Exception):
+    pass
+
+
+def get_risk_color(score):
+    if score <= 3:
+        return '#7cb342'
+    elif score <= 6:
+        return '#FFA726'
+    else:
+        return '#EF5350'
+
+def compute_risk_scores(weather: dict, elevation: int) -> tuple:
+    flood_risk = min(10, int((weather['precipitation_forecast'] / 10) + (1 if elevation < 50 else 0)))
+    air_quality = max(1, min(10, 10 - int(weather['precipitation_forecast'] / 15)))
+    return flood_risk, air_quality
+
+def build_analysis_fields(analysis: dict) -> dict:
+    return {field: analysis.get(field, '') for field in ANALYSIS_FIELDS}
+
+async def _timed(stage_name: str, awaitable):
+    with stage(stage_name):
+        return await awaitable
+
+async def agather_environmental_data(lat: float, lon: float, freshness: dict = None) -> tuple:
+    # The three providers are independent, so the report only waits on the slowest one.
+    return await asyncio.gather(
+        _timed('weather', aget_weather_data(lat, lon, freshness)),
+        _timed('elevation', aget_elevation_data(lat, lon, freshness)),
+        _timed('ndvi', aget_real_ndvi(lat, lon, freshness)),
+    )
+
+async def alocate_report(location: str, country: str = '', lat: float = None, lon: float = None) -> dict:
+    """The {'lat', 'lon', 'country'} a report is for. Raises LocationNotFound."""
+    if lat is not None and lon is not None:
+        # Map clicks already know where they are, so the name is never geocoded.
+        if not country:
+            with stage('geocode'):
+                place = await areverse_geocode(lat, lon)
+            country = place['country'] if place else ''
+        coords = {'lat': lat, 'lon': lon, 'country': country}
+    else:
+        full_location = f"{location}, {country}" if country else location
+        with stage('geocode'):
+            coords = await aget_coords_from_location(full_location)
+
+        if not coords or coords.get('lat') == 6.5244:
+            raise LocationNotFound(full_location)
+    return coords
+
+async def aprepare_report(
+    location: str, country: str = '', lat: float = None, lon: float = None, coords: dict = None
+) -> dict:
+    # `coords` from alocate_report() saves geocoding twice.
+    if coords is None:
+        coords = await alocate_report(location, country, lat, lon)
+
+    freshness = {}
+    weather, elevation, ndvi = await agather_environmental_data(coords['lat'], coords['lon'], freshness)
+
+    raw_data = {
+        'precipitation_forecast': weather['precipitation_forecast'],
+        'recent_rain': weather['recent_rain_trend'],
+        'elevation': elevation,
+        'ndvi': ndvi
+    }
+
+    flood_risk, air_quality = compute_risk_scores(weather, elevation)
+
+    return {
+        'location_name': location,
+        'country': coords['country'],
+        'latitude': coords['lat'],
+        'longitude': coords['lon'],
+        'raw_data': raw_data,
+        'freshness': freshness,
+        'flood_risk': flood_risk,
+        'air_quality': air_quality,
+    }
+
+def degraded_inputs(freshness: dict) -> list:
+    # Inputs served from a stale cache entry or the built-in fallback, for the report header.
+    return [
+        {'name': INPUT_LABELS.get(source, source), 'status': info['status']}
+        for source, info in sorted(freshness.items()) if info['status'] != 'fresh'
+    ]
+
+def build_report_context(report: dict, land_health, analysis: dict, snapshot=None) -> dict:
+    # land_health and snapshot are None while the analysis is still being streamed.
+    return {
+        'location_name': report['location_name'],
+        'country': report['country'],
+        'latitude': report['latitude'],
+        'longitude': report['longitude'],
+        'location_slug': snapshot.location.slug if snapshot else '',
+        'snapshot_slug': snapshot.slug if snapshot else '',
+        'snapshot_id': snapshot.pk if snapshot else None,
+        'flood_risk': report['flood_risk'],
+        'air_quality': report['air_quality'],
+        'land_health': land_health,
+        'flood_color': get_risk_color(report['flood_risk']),
+        'air_color': get_risk_color(report['air_quality']),
+        'land_color': get_risk_color(land_health) if land_health is not None else '#9ca3af',
+        'analysis': analysis,
+        'degraded_inputs': degraded_inputs(report.get('freshness', {})),
+        'timestamp': analysis.get('timestamp', '')
+    }
+
+def build_snapshot(report: dict, ai_result: dict) -> ReportSnapshot:
+    land_health = ai_result.get('inferred_land_health_score', 6)
+    analysis = ai_result.get('professional_analysis', {})
+
+    risk_scores = {
+        'flood': report['flood_risk'],
+        'air': report['air_quality'],
+        'land_health': land_health
+    }
+
+    return ReportSnapshot(
+        location_name=report['location_name'],
+        country=report['country'],
+        latitude=report['latitude'],
+        longitude=report['longitude'],
+        # Set here as well as in save(), since batches store snapshots with bulk_create.
+        geohash=geohash_encode(report['latitude'], report['longitude'], GEOHASH_PRECISION),
+        risk_scores=risk_scores,
+        analysis=build_analysis_fields(analysis),
+        # Freshness is kept out of raw_data until now so it never reaches the analysis prompt or its cache key.
+        raw_data={**report['raw_data'], 'freshness': report.get('freshness', {})}
+    )
+
+async def asave_report(report: dict, ai_result: dict) -> dict:
+    snapshot = build_snapshot(report, ai_result)
+    with stage('db'):
+        await snapshot.asave()
+
+    return build_report_context(
+        report, snapshot.risk_scores['land_health'], ai_result.get('professional_analysis', {}), snapshot
+    )
+
+def snapshot_report_context(snapshot: ReportSnapshot) -> dict:
+    # The context asave_report() returned when the snapshot was written.
+    report = {
+        'location_name': snapshot.location_name,
+        'country': snapshot.country,
+        'latitude': snapshot.latitude,
+        'longitude': snapshot.longitude,
+        'flood_risk': snapshot.risk_scores['flood'],
+        'air_quality': snapshot.risk_scores['air'],
+        'freshness': snapshot.raw_data.get('freshness', {}),
+    }
+    return build_report_context(report, snapshot.risk_scores['land_health'], snapshot.analysis, snapshot)
+
+def _reuse(snapshot: ReportSnapshot) -> dict:
+    inc('asase_live_report_reused_total', help_text='Live reports answered with a recent snapshot.')
+    return snapshot_report_context(snapshot)
+
+async def arecent_report_near(lat: float, lon: float) -> dict:
+    """
+    The context of the nearest snapshot within LIVE_REPORT_REUSE_RADIUS_M
+    metres of (lat, lon) saved within LIVE_REPORT_REUSE_SECONDS, or None.
+    """
+    window = settings.LIVE_REPORT_REUSE_SECONDS
+    radius = settings.LIVE_REPORT_REUSE_RADIUS_M
+    if not window or not radius:
+        return None
+
+    found = await sync_to_async(snapshots_near)(
+        lat, lon, radius / 1000,
+        since=timezone.now() - timedelta(seconds=window),
+        limit=1,
+        snapshots=ReportSnapshot.objects.select_related('location'),
+    )
+    return _reuse(found[0][1]) if found else None
+
+async def arecent_report(location: str, country: str = '', lat: float = None, lon: float = None) -> dict:
+    """
+    The context of a snapshot of the same location saved within
+    LIVE_REPORT_REUSE_SECONDS, or None. Without a country, any country's
+    location of that name counts. With coordinates, the place is matched by
+    distance instead, since the name is only a label for them.
+    """
+    if lat is not None and lon is not None:
+        return await arecent_report_near(lat, lon)
+
+    window = settings.LIVE_REPORT_REUSE_SECONDS
+    if not window:
+        return None
+
+    snapshots = ReportSnapshot.objects.select_related('location').filter(
+        timestamp__gte=timezone.now() - timedelta(seconds=window)
+    )
+    if country:
+        snapshots = snapshots.filter(location__key=location_key(location, country))
+    else:
+        snapshots = snapshots.filter(location__key__startswith=location_key(location, ''))
+    snapshot = await snapshots.order_by('-timestamp').afirst()
+    return _reuse(snapshot) if snapshot is not None else None
+
+def live_report_key(location: str, country: str, lat: float, lon: float) -> str:
+    # Shared by every path that runs a live report, so identical requests coalesce across them.
+    identity = f"{location_key(location, country)}|{lat}|{lon}"
+    return f"live_report_{hashlib.md5(identity.encode()).hexdigest()}"
+
+def live_report_timeout() -> int:
+    # Kept for the reuse window, and at least long enough for waiting workers to pick it up.
+    return max(settings.LIVE_REPORT_REUSE_SECONDS, 1)
+
+async def arecent_report_located(location: str, country: str, lat: float, lon: float) -> tuple:
+    """
+    (coords, recent): where the report is for, and the context of a snapshot
+    to reuse near there, if any. A name that matched no recent snapshot may
+    still geocode next to one, found here before any provider data is fetched.
+    """
+    coords = await alocate_report(location, country, lat, lon)
+    recent = None
+    if lat is None or lon is None:
+        recent = await arecent_report_near(coords['lat'], coords['lon'])
+    return coords, recent
+
+async def _arun_pipeline(location: str, country: str, lat: float, lon: float) -> dict:
+    coords, recent = await arecent_report_located(location, country, lat, lon)
+    if recent is not None:
+        return recent
+    report = await aprepare_report(location, country, coords=coords)
+    with stage('ai'):
+        ai_result = await aget_ai_analysis(location, report['country'], report['raw_data'])
+    return await asave_report(report, ai_result)
+
+async def arun_live_report(location: str, country: str = '', lat: float = None, lon: float = None) -> dict:
+    """
+    Analyse a location and save the snapshot, unless one was saved within the
+    reuse window. Identical requests arriving while a report runs wait for it
+    instead of running the pipeline again, in this process or another worker.
+    """
+    recent = await arecent_report(location, country, lat, lon)
+    if recent is not None:
+        return recent
+
+    return await acache_get_or_compute(
+        live_report_key(location, country, lat, lon),
+        lambda: _arun_pipeline(location, country, lat, lon),
+        live_report_timeout(),
+    )
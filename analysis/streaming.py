@@ -0,0 +1,292 @@
+import asyncio
+import json
+import logging
+import re
+import weakref
+from datetime import datetime
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from analysis.clients import apace_provider, get_async_gemini_client, provider_circuit
+from analysis.pipeline import (
+    aprepare_report, arecent_report, arecent_report_located, asave_report, build_report_context,
+    live_report_key, live_report_timeout
+)
+from analysis.utils import GEMINI_MODEL, analysis_cache_key, analysis_fallback, fresh_timestamp
+from core.cache import acache_get_or_compute
+from core.metrics import record_cache_lookup, stage
+
+ANALYSIS_SECTIONS = ('assessment', 'sdg_15_compliance', 'recommendations')
+SECTION_MARKER = re.compile(r'\[\[([A-Z0-9_]+)\]\]', re.IGNORECASE)
+# Longest marker we may need to hold back while waiting for its closing brackets.
+MAX_MARKER_LENGTH = 32
+
+logger = logging.getLogger(__name__)
+
+
+def _analysis_stream_prompt(location_name: str, country: str, all_data: dict) -> str:
+    current_time = datetime.now().strftime('%H:%M')
+
+    return f"""You are an expert Environmental Geo-Analyst providing a professional risk assessment.
+The current time is Friday, October 10, 2025 at {current_time} WAT.
+Analyze the following data for {location_name}, {country}:
+{json.dumps(all_data, indent=2)}
+
+Respond in plain text (no JSON, no markdown) using exactly this layout:
+LAND_HEALTH_SCORE: <integer from 1-10, based on fusing the provided data>
+[[ASSESSMENT]]
+<Your detailed assessment of all risks, starting with the most severe. Be direct and data-driven.>
+[[SDG_15_COMPLIANCE]]
+<Your analysis of the Land Health score, its causes based on the data, and how it relates to SDG 15.3 goals like land degradation neutrality.>
+[[RECOMMENDATIONS]]
+<Provide one immediate-term safety/mitigation action and one long-term recommendation related to improving land health.>"""
+
+class AnalysisStreamParser:
+    """
+    Split streamed model text into the sections of the analysis.
+
+    feed() returns (section, text) deltas as soon as they can be attributed;
+    text that might be the start of a [[MARKER]] is held back until the next
+    chunk shows whether it is one.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.preamble = ''
+        self.section = None
+        self.sections = {section: '' for section in ANALYSIS_SECTIONS}
+        self._section_start = False
+
+    def _emit(self, text, deltas):
+        if not text:
+            return
+        if self.section is None:
+            self.preamble += text
+            return
+        if self._section_start:
+            text = text.lstrip()
+            if not text:
+                return
+            self._section_start = False
+        self.sections[self.section] += text
+        deltas.append((self.section, text))
+
+    def feed(self, text: str) -> list:
+        self.buffer += text
+        deltas = []
+
+        while True:
+            match = SECTION_MARKER.search(self.buffer)
+            if match:
+                self._emit(self.buffer[:match.start()], deltas)
+                name = match.group(1).lower()
+                if name in self.sections:
+                    self.section = name
+                    self._section_start = True
+                else:
+                    self._emit(match.group(0), deltas)
+                self.buffer = self.buffer[match.end():]
+                continue
+
+            start = self.buffer.rfind('[')
+            if start != -1 and len(self.buffer) - start < MAX_MARKER_LENGTH:
+                if start > 0 and self.buffer[start - 1] == '[':
+                    start -= 1
+                self._emit(self.buffer[:start], deltas)
+                self.buffer = self.buffer[start:]
+            else:
+                self._emit(self.buffer, deltas)
+                self.buffer = ''
+            return deltas
+
+    def close(self) -> list:
+        deltas = []
+        self._emit(self.buffer, deltas)
+        self.buffer = ''
+        return deltas
+
+    def land_health_score(self) -> int:
+        match = re.search(r'LAND_HEALTH_SCORE:\s*(\d+)', self.preamble)
+        if not match:
+            return 6
+        return max(1, min(10, int(match.group(1))))
+
+
+def _analysis_header(location_name: str, country: str) -> dict:
+    return {
+        'title': f"ENVIRONMENTAL ANALYSIS FOR: {location_name}, {country}",
+        'timestamp': datetime.now().strftime('%B %d, %Y at %H:%M WAT'),
+        'subject': "ASSESSMENT OF IMMINENT RISKS AND LAND HEALTH (SDG 15)",
+    }
+
+async def astream_ai_analysis(location_name: str, country: str, all_data: dict):
+    """
+    Async generator yielding (section, text) deltas of the analysis as Gemini
+    writes them, followed by (None, result) with the complete analysis dict
+    in the same shape aget_ai_analysis() returns.
+    """
+    cache = caches['ai']
+    key = analysis_cache_key(location_name, country, all_data)
+
+    cached = await cache.aget(key)
+    record_cache_lookup(key, 'hit' if cached is not None else 'miss')
+    if cached is not None:
+        result = fresh_timestamp(cached)
+        for section in ANALYSIS_SECTIONS:
+            yield section, result['professional_analysis'].get(section, '')
+        yield None, result
+        return
+
+    parser = AnalysisStreamParser()
+    complete = False
+    try:
+        client = get_async_gemini_client()
+        if not client:
+            raise ValueError("Gemini API key not configured")
+
+        with provider_circuit('gemini'):
+            await apace_provider('gemini')
+            stream = await client.models.generate_content_stream(
+                model=GEMINI_MODEL,
+                contents=_analysis_stream_prompt(location_name, country, all_data),
+            )
+            async for chunk in stream:
+                for delta in parser.feed(chunk.text or ''):
+                    yield delta
+        for delta in parser.close():
+            yield delta
+        complete = all(parser.sections.values())
+    except Exception as e:
+        logger.warning("AI Analysis stream error: %s", e)
+
+    analysis = _analysis_header(location_name, country)
+    if complete:
+        land_health = parser.land_health_score()
+    else:
+        # Fill whatever the model did not get to with the standard fallback text.
+        fallback = analysis_fallback(location_name, country)
+        land_health = fallback['inferred_land_health_score']
+        for section in ANALYSIS_SECTIONS:
+            if not parser.sections[section].strip():
+                text = fallback['professional_analysis'][section]
+                parser.sections[section] = text
+                yield section, text
+
+    analysis.update({section: parser.sections[section].strip() for section in ANALYSIS_SECTIONS})
+    result = {'inferred_land_health_score': land_health, 'professional_analysis': analysis}
+    if complete:
+        await cache.aset(key, result)
+    yield None, result
+
+class _ReportBroadcast:
+    """
+    The events of one streamed report, kept so that every request following
+    it gets them all, however late it joins.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.error = None
+        self.closed = False
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def publish(self, event, data):
+        self.events.append((event, data))
+        self._notify()
+
+    def close(self, error=None):
+        self.error = error
+        self.closed = True
+        self._notify()
+
+    async def follow(self):
+        position = 0
+        while True:
+            changed = self._changed
+            while position < len(self.events):
+                yield self.events[position]
+                position += 1
+            if self.closed:
+                if self.error is not None:
+                    raise self.error
+                return
+            await changed.wait()
+
+
+# Streams running in this process by live report key, per event loop.
+_broadcasts = weakref.WeakKeyDictionary()
+_stream_tasks = set()
+
+
+async def _astream_pipeline(broadcast, location, country, lat, lon) -> dict:
+    coords, recent = await arecent_report_located(location, country, lat, lon)
+    if recent is not None:
+        return recent
+    report = await aprepare_report(location, country, coords=coords)
+
+    header = _analysis_header(location, report['country'])
+    context = build_report_context(report, None, header)
+    broadcast.publish('scores', {
+        'html': render_to_string('analysis/live_report.html', {**context, 'streaming': True}),
+    })
+
+    result = None
+    with stage('ai'):
+        async for section, delta in astream_ai_analysis(location, report['country'], report['raw_data']):
+            if section is None:
+                result = delta
+            else:
+                broadcast.publish('section', {'section': section, 'text': delta})
+
+    return await asave_report(report, result)
+
+async def _alead_stream(streams, key, broadcast, location, country, lat, lon):
+    # Runs apart from the request that started it, so followers still get the
+    # report (and it is still saved) if that request disconnects.
+    try:
+        # Another worker streaming the same report makes this wait for its result instead.
+        context = await acache_get_or_compute(
+            key, lambda: _astream_pipeline(broadcast, location, country, lat, lon), live_report_timeout()
+        )
+        with stage('render'):
+            html = render_to_string('analysis/live_report.html', context)
+        broadcast.publish('done', {'html': html})
+        broadcast.close()
+    except Exception as e:
+        broadcast.close(e)
+    finally:
+        streams.pop(key, None)
+
+async def astream_live_report(location: str, country: str = '', lat: float = None, lon: float = None):
+    """
+    Async generator of (event, data) pairs for a streamed report: 'scores'
+    once the provider data is in, 'section' deltas of the analysis, then
+    'done' with the saved report. LocationNotFound and provider errors are
+    raised before the first event.
+
+    A recent snapshot (see arecent_report()) is sent as 'done' straight away,
+    and identical requests share one stream, as arun_live_report() does.
+    """
+    recent = await arecent_report(location, country, lat, lon)
+    if recent is not None:
+        with stage('render'):
+            html = render_to_string('analysis/live_report.html', recent)
+        yield 'done', {'html': html}
+        return
+
+    key = live_report_key(location, country, lat, lon)
+    streams = _broadcasts.setdefault(asyncio.get_running_loop(), {})
+    broadcast = streams.get(key)
+    if broadcast is None:
+        broadcast = streams[key] = _ReportBroadcast()
+        task = asyncio.get_running_loop().create_task(
+            _alead_stream(streams, key, broadcast, location, country, lat, lon)
+        )
+        _stream_tasks.add(task)
+        task.add_done_callback(_stream_tasks.discard)
+
+    async for event, data in broadcast.follow():
+        yield event, data
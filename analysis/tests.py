@@ -1,3 +1,755 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import shutil
+import tempfile
+from datetime import date, datetime, timedelta, timezone
+from email.utils import format_datetime
+from pathlib import Path
+from unittest import mock
+import requests
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from analysis.batch import _store_reports
+from analysis.jobs import run_job
+from analysis.clients import backoff_delay, provider_circuit, provider_get, retry_after_seconds
+from analysis.models import ReportJob
+from analysis.pipeline import LocationNotFound, arecent_report, arun_live_report, build_snapshot
+from analysis.streaming import AnalysisStreamParser, astream_live_report
+from analysis.ndvi import (
+    COLORMAP_CACHE_KEY, GIBS_NDVI_COLORMAP_URL, TileStore, TileUnavailable, asample_ndvi, code_to_ndvi, decode_png,
+    ndvi_colormap, palette_codes, parse_colormap, png_to_raster, sample_ndvi, tile_for, tile_level,
+)
+from analysis.utils import (
+    aget_ai_analysis, aget_weather_data, analysis_cache_key, areverse_geocode, bucket_analysis_inputs, quantize_coords,
+)
+from archive.models import Location, LocationRollup, LocationSummary
+from archive.page_cache import ARCHIVE_SCOPE, location_scope, page_version
+from core.circuit import CircuitOpen
+from core.gazetteer import Gazetteer, Place
+from core.geo import geohash_center, geohash_encode
+from core.ratelimit import RateLimited
 
-# Create your tests here.
+TESTDATA = Path(__file__).resolve().parent / 'testdata'
+# An 8x5 palette tile whose rows use PNG filters 0-4 in turn, and a colormap in
+# the GIBS format for its palette: index 0 is NDVI 0.95-1 green, 1 is 0.4-0.45
+# yellow, 2 is 0.1-0.15 brown and 3 is no data (also transparent in the tile).
+FIXTURE_PIXELS = [[(x + y) % 4 for x in range(8)] for y in range(5)]
+FIXTURE_NDVI = {0: 0.976, 1: 0.424, 2: 0.126, 3: None}
+SAMPLE_COORDS = {'lat': 6.69, 'lon': -1.62, 'country': 'Ghana'}
+STREAMED_ANALYSIS = (
+    'LAND_HEALTH_SCORE: 7\n[[ASSESSMENT]]\nHeavy rain [expected] tonight.\n'
+    '[[SDG_15_COMPLIANCE]]\nStable cover. [[NOTE]] kept\n[[RECOMMENDATIONS]]\nClear drains.'
+)
+
+
+def fixture_tile() -> bytes:
+    return (TESTDATA / 'ndvi_tile.png').read_bytes()
+
+def fixture_colormap() -> list:
+    return parse_colormap((TESTDATA / 'ndvi_colormap.xml').read_bytes())
+
+def sample_report(name='Kumasi', country='Ghana', latitude=6.69, longitude=-1.62, flood=4, air=3) -> dict:
+    return {
+        'location_name': name,
+        'country': country,
+        'latitude': latitude,
+        'longitude': longitude,
+        'flood_risk': flood,
+        'air_quality': air,
+        'raw_data': {'precipitation_forecast': 40, 'recent_rain': 1.2, 'elevation': 270, 'ndvi': 0.55},
+        'freshness': {},
+    }
+
+def sample_ai_result(land_health=6) -> dict:
+    return {'inferred_land_health_score': land_health, 'professional_analysis': {'title': 'ANALYSIS'}}
+
+def http_response(status_code, headers=None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    return response
+
+def tile_response(status_code=200, content=b''):
+    return mock.Mock(status_code=status_code, content=content, raise_for_status=mock.Mock())
+
+
+class DecodePngTests(SimpleTestCase):
+    def test_decodes_every_filter_type(self):
+        width, height, channels, color_type, pixels, palette, transparency = decode_png(fixture_tile())
+
+        self.assertEqual((width, height, channels, color_type), (8, 5, 1, 3))
+        self.assertEqual([list(pixels[y * 8:(y + 1) * 8]) for y in range(5)], FIXTURE_PIXELS)
+        self.assertEqual(palette[1], (255, 229, 0))
+        self.assertEqual(transparency, b'\xff\xff\xff\x00')
+
+    def test_rejects_other_files(self):
+        with self.assertRaises(ValueError):
+            decode_png(b'GIF89a')
+
+    def test_parses_gibs_colormap(self):
+        self.assertEqual(fixture_colormap(), [
+            ((1, 50, 11), 0.975), ((255, 229, 0), 0.425), ((206, 126, 69), 0.125), ((0, 0, 0), None),
+        ])
+
+    def test_raster_maps_palette_to_ndvi(self):
+        raster = png_to_raster(fixture_tile(), fixture_colormap())
+        codes = raster[12:]
+
+        self.assertEqual(len(codes), 8 * 5)
+        self.assertEqual([code_to_ndvi(code) for code in codes[:8]], [FIXTURE_NDVI[index] for index in FIXTURE_PIXELS[0]])
+
+    def test_palette_in_another_order_is_matched_on_colour(self):
+        codes = palette_codes([(206, 126, 69), (1, 50, 11), (1, 51, 11)], fixture_colormap())
+
+        self.assertEqual([code_to_ndvi(code) for code in codes], [FIXTURE_NDVI[2], FIXTURE_NDVI[0], None])
+
+
+class SampleNdviTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.store = TileStore(self.directory)
+        cache.set(COLORMAP_CACHE_KEY, fixture_colormap())
+        # Close enough to the north-west corner to land inside the small fixture tile.
+        self.lat, self.lon = 89.99, -179.99
+        _, _, x, y = tile_for(self.lat, self.lon, tile_level())
+        self.expected = FIXTURE_NDVI[FIXTURE_PIXELS[y][x]]
+
+    def test_store_samples_put_tile(self):
+        digest = self.store.put_tile('2025-01-01/7/0/0', fixture_tile(), fixture_colormap())
+
+        self.assertEqual(self.store.lookup('2025-01-01/7/0/0'), digest)
+        self.assertEqual(self.store.sample(digest, 2, 0), FIXTURE_NDVI[2])
+        self.assertIsNone(self.store.sample(digest, 3, 0))
+        # Points past the edge of a small tile read its last pixel.
+        self.assertEqual(self.store.sample(digest, 100, 100), FIXTURE_NDVI[FIXTURE_PIXELS[4][7]])
+
+    def test_samples_downloaded_tile_once(self):
+        with mock.patch('analysis.ndvi.provider_get', return_value=tile_response(content=fixture_tile())) as get:
+            first = sample_ndvi(self.lat, self.lon, date(2025, 6, 1), self.store)
+            second = sample_ndvi(self.lat, self.lon, date(2025, 6, 1), self.store)
+
+        self.assertEqual(first, self.expected)
+        self.assertEqual(second, self.expected)
+        self.assertEqual(get.call_count, 1)
+
+    def test_cached_digest_without_raster_downloads_again(self):
+        with mock.patch('analysis.ndvi.provider_get', return_value=tile_response(content=fixture_tile())) as get:
+            sample_ndvi(self.lat, self.lon, date(2025, 6, 1), self.store)
+            # A fresh disk on another host or after a redeploy, with the shared cache intact.
+            shutil.rmtree(self.directory)
+            value = sample_ndvi(self.lat, self.lon, date(2025, 6, 1), TileStore(self.directory))
+
+        self.assertEqual(value, self.expected)
+        self.assertEqual(get.call_count, 2)
+
+    def test_falls_back_to_previous_composite(self):
+        responses = [tile_response(404), tile_response(content=fixture_tile())]
+        with mock.patch('analysis.ndvi.provider_get', side_effect=responses) as get:
+            value = sample_ndvi(self.lat, self.lon, date(2025, 6, 1), self.store)
+
+        self.assertEqual(value, self.expected)
+        self.assertEqual(get.call_count, 2)
+
+    def test_colormap_is_fetched_once_from_gibs(self):
+        cache.clear()
+        colormap = (TESTDATA / 'ndvi_colormap.xml').read_bytes()
+        with mock.patch('analysis.ndvi.provider_get', return_value=tile_response(content=colormap)) as get:
+            first = ndvi_colormap()
+            second = ndvi_colormap()
+
+        self.assertEqual(first, fixture_colormap())
+        self.assertEqual(second, first)
+        get.assert_called_once_with('gibs', GIBS_NDVI_COLORMAP_URL)
+
+    def test_unavailable_when_no_composite_is_published(self):
+        with mock.patch('analysis.ndvi.provider_get', return_value=tile_response(404)):
+            with self.assertRaises(TileUnavailable):
+                sample_ndvi(self.lat, self.lon, date(2025, 6, 1), self.store)
+
+    async def test_async_cached_digest_without_raster_downloads_again(self):
+        response = tile_response(content=fixture_tile())
+        with mock.patch('analysis.ndvi.aprovider_get', new=mock.AsyncMock(return_value=response)) as get:
+            await asample_ndvi(self.lat, self.lon, date(2025, 6, 1), self.store)
+            shutil.rmtree(self.directory)
+            value = await asample_ndvi(self.lat, self.lon, date(2025, 6, 1), TileStore(self.directory))
+
+        self.assertEqual(value, self.expected)
+        self.assertEqual(get.await_count, 2)
+
+
+class StoreReportsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def store(self, *reports):
+        rows = []
+        for report in reports:
+            job = ReportJob.objects.create(location=report['location_name'], country=report['country'], batch='test')
+            rows.append((job, report, sample_ai_result()))
+        _store_reports(rows)
+
+    def test_stores_snapshots_and_summaries(self):
+        self.store(sample_report(flood=4), sample_report(flood=8))
+
+        summary = LocationSummary.objects.get()
+        self.assertEqual(summary.report_count, 2)
+        self.assertEqual(set(ReportJob.objects.values_list('status', flat=True)), {ReportJob.DONE})
+
+    def test_updates_rollups(self):
+        self.store(sample_report(flood=4), sample_report(flood=8), sample_report('Tamale', flood=2))
+
+        day = LocationRollup.objects.get(location__name='Kumasi', period='day')
+        self.assertEqual((day.report_count, day.flood_min, day.flood_max, day.flood_sum), (2, 4, 8, 12))
+        week = LocationRollup.objects.get(location__name='Kumasi', period='week')
+        self.assertEqual(week.report_count, 2)
+        self.assertEqual(LocationRollup.objects.get(location__name='Tamale', period='day').flood_sum, 2)
+
+    def test_bumps_page_versions(self):
+        self.store(sample_report())
+        location = Location.objects.get()
+        before = page_version(ARCHIVE_SCOPE), page_version(location_scope(location.id))
+
+        with mock.patch('archive.page_cache.time.time', return_value=before[0] + 60):
+            self.store(sample_report())
+
+        self.assertEqual(page_version(ARCHIVE_SCOPE), before[0] + 60)
+        self.assertEqual(page_version(location_scope(location.id)), before[0] + 60)
+
+    def test_location_hubs_of_one_batch_render_their_own_reports(self):
+        self.store(sample_report('Accra', latitude=5.56, longitude=-0.2), sample_report('Kumasi'))
+
+        accra = self.client.get('/location/accra/')
+        kumasi = self.client.get('/location/kumasi/')
+
+        self.assertContains(accra, 'Accra')
+        self.assertContains(kumasi, 'Kumasi')
+        self.assertNotContains(kumasi, 'Accra')
+
+
+class StreamLiveReportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    async def collect(self, *args):
+        return [event async for event, _ in astream_live_report(*args)]
+
+    async def fake_analysis(self, location, country, data):
+        yield 'assessment', 'Dry.'
+        yield None, sample_ai_result()
+
+    async def test_identical_streams_share_one_report(self):
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def locate(*args):
+            started.set()
+            await release.wait()
+            return SAMPLE_COORDS
+
+        with mock.patch('analysis.pipeline.alocate_report', side_effect=locate) as locate_report, \
+                mock.patch('analysis.streaming.aprepare_report', return_value=sample_report()), \
+                mock.patch('analysis.streaming.astream_ai_analysis', new=self.fake_analysis):
+            first = asyncio.create_task(self.collect('Kumasi', 'Ghana'))
+            await started.wait()
+            second = asyncio.create_task(self.collect('Kumasi', 'Ghana'))
+            await asyncio.sleep(0)
+            release.set()
+            events = await asyncio.gather(first, second)
+
+        self.assertEqual(locate_report.call_count, 1)
+        self.assertEqual(events[0], ['scores', 'section', 'done'])
+        self.assertEqual(events[1], events[0])
+
+    async def test_recent_snapshot_is_sent_without_running_the_pipeline(self):
+        await build_snapshot(sample_report(), sample_ai_result()).asave()
+
+        with mock.patch('analysis.pipeline.alocate_report') as locate_report:
+            events = await self.collect('Kumasi', 'Ghana')
+
+        self.assertEqual(events, ['done'])
+        locate_report.assert_not_called()
+
+    async def test_nearby_snapshot_is_reused_before_provider_data(self):
+        # Saved under another name 100 m away, so only the distance check can match it.
+        await build_snapshot(sample_report('Adum', latitude=6.6909), sample_ai_result()).asave()
+
+        with mock.patch('analysis.pipeline.alocate_report', return_value=SAMPLE_COORDS), \
+                mock.patch('analysis.streaming.aprepare_report') as prepare_report:
+            events = await self.collect('Kumasi', 'Ghana')
+
+        self.assertEqual(events, ['done'])
+        prepare_report.assert_not_called()
+
+    async def test_errors_reach_every_follower(self):
+        with mock.patch('analysis.pipeline.alocate_report', side_effect=LocationNotFound('Nowhere')):
+            results = await asyncio.gather(
+                self.collect('Nowhere', ''), self.collect('Nowhere', ''), return_exceptions=True
+            )
+
+        self.assertTrue(all(isinstance(result, LocationNotFound) for result in results))
+
+
+class StreamReportTokenTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    async def events_url(self, **data):
+        response = await self.async_client.post('/analysis/stream/', {'location': 'Kumasi', 'country': 'Ghana', **data})
+        return response.context['events_url']
+
+    async def stream(self, url):
+        response = await self.async_client.get(url)
+        if response.status_code != 200:
+            return response.status_code, None
+        return response.status_code, b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+    async def fake_stream(self, *args):
+        yield 'done', {'html': '<p>Kumasi</p>'}
+
+    async def test_events_url_carries_only_a_token(self):
+        url = await self.events_url(lat='6.69', lon='-1.62')
+
+        self.assertRegex(url, r'^/analysis/stream/events/\?token=[\w-]+$')
+
+    async def test_token_starts_one_report_for_the_posted_location(self):
+        url = await self.events_url(lat='6.69', lon='-1.62')
+
+        with mock.patch('analysis.views.astream_live_report', side_effect=self.fake_stream) as stream_live_report:
+            status, body = await self.stream(url)
+            replayed, _ = await self.stream(url)
+
+        self.assertEqual(status, 200)
+        self.assertIn('event: done', body)
+        self.assertEqual(replayed, 403)
+        stream_live_report.assert_called_once_with('Kumasi', 'Ghana', 6.69, -1.62)
+
+    async def test_events_without_a_valid_token_are_refused(self):
+        with mock.patch('analysis.views.astream_live_report', side_effect=self.fake_stream) as stream_live_report:
+            for url in ['/analysis/stream/events/?location=Kumasi&country=Ghana',
+                        '/analysis/stream/events/?token=made-up']:
+                self.assertEqual((await self.stream(url))[0], 403, url)
+
+        stream_live_report.assert_not_called()
+
+
+class LiveReportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    async def test_nearby_snapshot_is_reused_before_provider_data(self):
+        await build_snapshot(sample_report('Adum', latitude=6.6909), sample_ai_result()).asave()
+
+        with mock.patch('analysis.pipeline.alocate_report', return_value=SAMPLE_COORDS), \
+                mock.patch('analysis.pipeline.agather_environmental_data') as gather:
+            context = await arun_live_report('Kumasi', 'Ghana')
+
+        self.assertEqual(context['location_name'], 'Adum')
+        gather.assert_not_called()
+
+    async def test_map_point_reuses_snapshot_within_radius_only(self):
+        snapshot = build_snapshot(sample_report(), sample_ai_result())
+        await snapshot.asave()
+
+        near = await arecent_report('Somewhere', '', 6.692, -1.62)
+        far = await arecent_report('Somewhere', '', 6.695, -1.62)
+
+        self.assertEqual(near['snapshot_slug'], snapshot.slug)
+        self.assertIsNone(far)
+
+
+@override_settings(REPORT_JOB_BACKEND='queue')
+class ReportJobTests(TestCase):
+    def start(self, target='map-results', **data):
+        data = {'location': 'Kumasi', 'country': 'Ghana', 'lat': '6.69', 'lon': '-1.62', **data}
+        return self.client.post('/analysis/jobs/', data, headers={'HX-Target': target})
+
+    def poll(self, job):
+        return self.client.get(f"/analysis/jobs/{job.pk}/")
+
+    def test_post_queues_a_job_that_polls_into_the_form_target(self):
+        response = self.start()
+
+        job = ReportJob.objects.get()
+        self.assertEqual((job.status, job.location, job.latitude, job.longitude),
+                         (ReportJob.PENDING, 'Kumasi', 6.69, -1.62))
+        self.assertContains(response, f'hx-get="/analysis/jobs/{job.pk}/"')
+        self.assertContains(response, 'hx-target="#map-results"')
+        self.assertEqual(self.poll(job).status_code, 204)
+
+    def test_untrusted_target_falls_back_to_the_results_panel(self):
+        self.assertContains(self.start(target='x" onclick="alert(1)'), 'hx-target="#analysis-results"')
+
+    def test_location_is_required(self):
+        self.assertContains(self.start(location=''), 'Please provide a location')
+        self.assertFalse(ReportJob.objects.exists())
+
+    def test_finished_jobs_store_their_outcome(self):
+        self.start()
+        job = ReportJob.objects.get()
+
+        with mock.patch('analysis.jobs.arun_live_report', return_value={'location_name': 'Kumasi'}) as run:
+            self.assertTrue(run_job(job.pk))
+            # Already claimed, so a second worker leaves it alone.
+            self.assertFalse(run_job(job.pk))
+
+        run.assert_called_once_with('Kumasi', 'Ghana', 6.69, -1.62)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), (ReportJob.DONE, {'location_name': 'Kumasi'}))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_poll_reports_failures(self):
+        for error, message in [(LocationNotFound('Nowhere'), 'Location not found'), (RuntimeError('quota'), 'quota')]:
+            self.start()
+            job = ReportJob.objects.get(status=ReportJob.PENDING)
+            with mock.patch('analysis.jobs.arun_live_report', side_effect=error), mock.patch('analysis.jobs.logger'):
+                run_job(job.pk)
+
+            self.assertContains(self.poll(job), message)
+
+        self.assertContains(self.client.get('/analysis/jobs/00000000-0000-0000-0000-000000000000/'), 'expired')
+
+
+@override_settings(BATCH_API_TOKEN='secret')
+class BatchApiTests(TestCase):
+    def post(self, payload, token='secret'):
+        body = payload if isinstance(payload, str) else json.dumps(payload)
+        return self.client.post('/analysis/batches/', body, content_type='application/json',
+                                headers={'Authorization': f"Bearer {token}"})
+
+    def test_requires_the_token(self):
+        self.assertEqual(self.post({'locations': []}, token='wrong').status_code, 401)
+        self.assertEqual(self.client.get('/analysis/batches/nightly/').status_code, 401)
+        with override_settings(BATCH_API_TOKEN=''):
+            self.assertEqual(self.post({'locations': []}, token='').status_code, 401)
+
+    def test_queues_a_batch_and_reports_its_status(self):
+        locations = [{'location': 'Kumasi', 'country': 'Ghana'}, {'location': ' Kumasi ', 'country': 'Ghana'},
+                     {'location': 'Tamale', 'country': None}]
+        with mock.patch('analysis.views.submit_batch') as submit:
+            response = self.post({'batch': 'nightly', 'locations': locations})
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {'batch': 'nightly', 'queued': 2, 'status_url': '/analysis/batches/nightly/'})
+        submit.assert_called_once_with('nightly')
+        status = self.client.get('/analysis/batches/nightly/', headers={'Authorization': 'Bearer secret'}).json()
+        self.assertEqual(status['counts'][ReportJob.PENDING], 2)
+        self.assertEqual([job['location'] for job in status['jobs']], ['Kumasi', 'Tamale'])
+
+    def test_rejects_bad_input_before_queueing(self):
+        bodies = [
+            'not json',
+            {'locations': 'Kumasi'},
+            {'locations': [{'country': 'Ghana'}]},
+            {'locations': [{'location': 42}]},
+            {'locations': [{'location': 'Kumasi', 'country': ['Ghana']}]},
+            {'batch': 'nightly/2025', 'locations': [{'location': 'Kumasi'}]},
+            {'batch': 7, 'locations': [{'location': 'Kumasi'}]},
+            {'batch': 'x' * 101, 'locations': [{'location': 'Kumasi'}]},
+        ]
+        with mock.patch('analysis.views.submit_batch') as submit:
+            for body in bodies:
+                self.assertEqual(self.post(body).status_code, 400, body)
+
+        submit.assert_not_called()
+        self.assertFalse(ReportJob.objects.exists())
+
+
+class AnalyzeLocationsCommandTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        handle, self.csv = tempfile.mkstemp(suffix='.csv')
+        self.addCleanup(Path(self.csv).unlink)
+        with open(handle, 'w') as f:
+            f.write('location,country\nKumasi,Ghana\n\nAtlantis,\nTamale,Ghana\nKumasi,Ghana\n')
+
+    async def prepare(self, location, country):
+        if location == 'Atlantis':
+            raise LocationNotFound(location)
+        if location in self.failing:
+            raise RuntimeError('upstream down')
+        return sample_report(location, country)
+
+    def analyze(self, *args, failing=(), **options):
+        self.failing = failing
+        out = io.StringIO()
+        with mock.patch('analysis.batch.aprepare_report', side_effect=self.prepare) as prepare, \
+                mock.patch('analysis.batch.aget_ai_analysis', return_value=sample_ai_result()), \
+                mock.patch('analysis.batch.logger'):
+            call_command('analyze_locations', *args, batch='nightly', stdout=out, **options)
+        return out.getvalue(), prepare
+
+    def statuses(self):
+        return dict(ReportJob.objects.values_list('location', 'status'))
+
+    def test_runs_every_location_in_the_csv_once(self):
+        output, prepare = self.analyze(csv=self.csv, failing=['Tamale'])
+
+        self.assertIn('Batch nightly: 3 location(s) queued', output)
+        self.assertEqual(prepare.call_count, 3)
+        self.assertEqual(self.statuses(), {
+            'Kumasi': ReportJob.DONE, 'Atlantis': ReportJob.NOT_FOUND, 'Tamale': ReportJob.FAILED,
+        })
+        self.assertEqual(list(LocationSummary.objects.values_list('location_name', flat=True)), ['Kumasi'])
+
+    def test_rerunning_a_batch_only_retries_what_was_asked(self):
+        self.analyze(csv=self.csv, failing=['Tamale'])
+
+        output, prepare = self.analyze(csv=self.csv)
+        self.assertIn('Batch nightly: 0 location(s) queued', output)
+        prepare.assert_not_called()
+
+        output, prepare = self.analyze('--retry-failed')
+        self.assertIn('Batch nightly: 1 location(s) queued', output)
+        prepare.assert_called_once_with('Tamale', 'Ghana')
+        self.assertEqual(self.statuses()['Tamale'], ReportJob.DONE)
+
+    def test_requires_something_to_analyze(self):
+        with self.assertRaises(CommandError):
+            self.analyze()
+
+
+class AnalysisStreamParserTests(SimpleTestCase):
+    def parse(self, chunks):
+        parser = AnalysisStreamParser()
+        deltas = [delta for chunk in chunks for delta in parser.feed(chunk)] + parser.close()
+        return parser, deltas
+
+    def test_sections_are_the_same_however_the_text_is_split(self):
+        whole, _ = self.parse([STREAMED_ANALYSIS])
+        for size in (1, 2, 3, 7):
+            chunks = [STREAMED_ANALYSIS[start:start + size] for start in range(0, len(STREAMED_ANALYSIS), size)]
+            parser, deltas = self.parse(chunks)
+            self.assertEqual(parser.sections, whole.sections, size)
+            for section in parser.sections:
+                self.assertEqual(''.join(text for name, text in deltas if name == section), parser.sections[section])
+
+        self.assertEqual(whole.sections, {
+            'assessment': 'Heavy rain [expected] tonight.\n',
+            'sdg_15_compliance': 'Stable cover. [[NOTE]] kept\n',
+            'recommendations': 'Clear drains.',
+        })
+        self.assertEqual(whole.land_health_score(), 7)
+
+    def test_possible_marker_is_held_back(self):
+        parser = AnalysisStreamParser()
+        parser.feed('[[ASSESSMENT]]\nRain ')
+
+        self.assertEqual(parser.feed('[[SDG'), [])
+        self.assertEqual(parser.feed('_15_COMPLIANCE]] Fine'), [('sdg_15_compliance', 'Fine')])
+
+    def test_no_empty_deltas(self):
+        for size in (1, 2, 5):
+            chunks = [STREAMED_ANALYSIS[start:start + size] for start in range(0, len(STREAMED_ANALYSIS), size)]
+            _, deltas = self.parse(chunks)
+            self.assertTrue(all(text for _, text in deltas), size)
+
+    def test_land_health_score_defaults_and_clamps(self):
+        self.assertEqual(self.parse(['[[ASSESSMENT]] no score'])[0].land_health_score(), 6)
+        self.assertEqual(self.parse(['LAND_HEALTH_SCORE: 42\n[[ASSESSMENT]]'])[0].land_health_score(), 10)
+
+
+@override_settings(UPSTREAM_PROVIDERS={'flaky': {'failure_threshold': 2, 'reset_timeout': 30}})
+class ProviderCircuitTests(SimpleTestCase):
+    def fail(self, error):
+        with self.assertRaises(type(error)):
+            with provider_circuit('flaky'):
+                raise error
+
+    def test_opens_after_failures_and_fails_fast(self):
+        self.fail(ConnectionError('reset'))
+        self.fail(ConnectionError('reset'))
+        call = mock.Mock()
+
+        with self.assertRaises(CircuitOpen):
+            with provider_circuit('flaky'):
+                call()
+        call.assert_not_called()
+
+    def test_local_rate_limits_are_not_upstream_failures(self):
+        for _ in range(3):
+            self.fail(RateLimited('flaky', 1))
+
+        with provider_circuit('flaky'):
+            pass
+
+
+@override_settings(UPSTREAM_PROVIDERS={'slow': {
+    'base_url': 'https://slow.example', 'retries': 2, 'backoff': 0.5, 'max_backoff': 0.75, 'max_wait': 5,
+    'failure_threshold': 100,
+}})
+class ProviderGetTests(SimpleTestCase):
+    def get(self, *responses):
+        session = mock.Mock()
+        session.get.side_effect = responses
+        with mock.patch('analysis.clients.get_session', return_value=session), \
+                mock.patch('analysis.clients.random.uniform', side_effect=lambda low, high: high), \
+                mock.patch('analysis.clients.time.sleep') as sleep:
+            try:
+                return provider_get('slow', '/v1/data', params={'q': 'x'}), session, sleep
+            except requests.HTTPError as e:
+                return e, session, sleep
+
+    def test_retries_server_errors_with_capped_backoff(self):
+        response, session, sleep = self.get(http_response(503), requests.ConnectionError(), http_response(200))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(session.get.call_count, 3)
+        session.get.assert_called_with('https://slow.example/v1/data', params={'q': 'x'}, timeout=10)
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [0.5, 0.75])
+
+    def test_raises_once_retries_are_exhausted(self):
+        error, session, sleep = self.get(*[http_response(502)] * 3)
+
+        self.assertIsInstance(error, requests.HTTPError)
+        self.assertEqual(session.get.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_client_errors_are_not_retried(self):
+        response, session, sleep = self.get(http_response(404))
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(session.get.call_count, 1)
+        sleep.assert_not_called()
+
+    def test_waits_for_retry_after_instead_of_backing_off(self):
+        response, session, sleep = self.get(http_response(429, {'Retry-After': '2'}), http_response(200))
+
+        self.assertEqual(response.status_code, 200)
+        sleep.assert_called_once_with(2.0)
+
+    def test_retry_after_past_max_wait_fails_without_waiting(self):
+        error, session, sleep = self.get(http_response(429, {'Retry-After': '60'}), http_response(200))
+
+        self.assertEqual(error.response.status_code, 429)
+        self.assertEqual(session.get.call_count, 1)
+        sleep.assert_not_called()
+
+    def test_retry_after_accepts_http_dates(self):
+        retry_at = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30))
+
+        self.assertAlmostEqual(retry_after_seconds(http_response(503, {'Retry-After': retry_at})), 30, delta=1.5)
+        self.assertEqual(retry_after_seconds(http_response(503, {'Retry-After': 'soon'})), None)
+        self.assertEqual(retry_after_seconds(http_response(503, {'Retry-After': '-5'})), 0.0)
+
+    def test_backoff_delay_is_jittered_up_to_a_cap(self):
+        config = {'backoff': 0.5, 'max_backoff': 3}
+        with mock.patch('analysis.clients.random.uniform', side_effect=lambda low, high: (low, high)):
+            delays = [backoff_delay(config, attempt) for attempt in range(4)]
+
+        self.assertEqual(delays, [(0, 0.5), (0, 1.0), (0, 2.0), (0, 3)])
+
+
+class QuantizeCoordsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Two points 300 m apart, either side of the middle of a weather (precision 5) cell.
+        center_lat, center_lon = geohash_center(geohash_encode(6.69, -1.62, 5))
+        self.points = [(center_lat - 0.001, center_lon - 0.001), (center_lat + 0.001, center_lon + 0.001)]
+        self.center = (round(center_lat, 6), round(center_lon, 6))
+
+    def test_nearby_points_snap_to_their_cell_centre(self):
+        keys = [quantize_coords('weather', lat, lon) for lat, lon in self.points]
+
+        self.assertEqual(keys[0], keys[1])
+        self.assertEqual(keys[0], (f"weather_{geohash_encode(6.69, -1.62, 5)}", *self.center))
+
+    def test_precision_is_per_family(self):
+        # Elevation varies over short distances, so its cells are much smaller.
+        keys = [quantize_coords('elevation', lat, lon) for lat, lon in self.points]
+
+        self.assertNotEqual(keys[0], keys[1])
+        self.assertTrue(all(len(key.split('_')[1]) == 7 for key, _, _ in keys))
+
+    async def test_nearby_lookups_share_one_upstream_fetch(self):
+        weather = {'precipitation_forecast': 55, 'recent_rain_trend': 0.4}
+        with mock.patch('analysis.utils._afetch_weather', new=mock.AsyncMock(return_value=weather)) as fetch:
+            results = [await aget_weather_data(lat, lon) for lat, lon in self.points]
+
+        self.assertEqual(results, [weather, weather])
+        fetch.assert_awaited_once_with(*self.center)
+
+
+class AnalysisCacheKeyTests(TestCase):
+    readings = {'precipitation_forecast': 41, 'recent_rain': 1.2, 'elevation': 271, 'ndvi': 0.551,
+                'land_cover': 'forest'}
+    # Every reading moved, but none by enough to leave its bucket.
+    nearby_readings = {'precipitation_forecast': 42, 'recent_rain': 0.8, 'elevation': 268, 'ndvi': 0.549,
+                       'land_cover': 'forest'}
+
+    def setUp(self):
+        caches['ai'].clear()
+
+    def test_readings_are_rounded_to_their_bucket(self):
+        self.assertEqual(bucket_analysis_inputs(self.readings), {
+            'elevation': 270, 'land_cover': 'forest', 'ndvi': 0.55, 'precipitation_forecast': 40, 'recent_rain': 1,
+        })
+
+    def test_readings_within_a_bucket_share_a_key(self):
+        self.assertEqual(analysis_cache_key('Kumasi', 'Ghana', self.readings),
+                         analysis_cache_key(' kumasi', 'GHANA ', self.nearby_readings))
+
+    def test_readings_across_a_bucket_change_the_key(self):
+        key = analysis_cache_key('Kumasi', 'Ghana', self.readings)
+
+        self.assertNotEqual(key, analysis_cache_key('Kumasi', 'Ghana', {**self.readings, 'precipitation_forecast': 48}))
+        self.assertNotEqual(key, analysis_cache_key('Kumasi', 'Ghana', {**self.readings, 'land_cover': 'savanna'}))
+        self.assertNotEqual(key, analysis_cache_key('Tamale', 'Ghana', self.readings))
+
+    async def test_nearby_readings_reuse_the_cached_analysis(self):
+        generate = mock.AsyncMock(return_value=sample_ai_result())
+        with mock.patch('analysis.utils._agenerate_analysis', new=generate):
+            first = await aget_ai_analysis('Kumasi', 'Ghana', self.readings)
+            second = await aget_ai_analysis('Kumasi', 'Ghana', self.nearby_readings)
+
+        generate.assert_awaited_once()
+        self.assertEqual(first['inferred_land_health_score'], second['inferred_land_health_score'])
+
+
+class ReverseGeocodeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('analysis.utils.get_gazetteer',
+                             return_value=Gazetteer([Place('Kumasi', 'Ghana', 6.69, -1.62, 2000000)]))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def nominatim(self, address):
+        response = mock.Mock(json=mock.Mock(return_value={'address': address}))
+        return mock.patch('analysis.utils.aprovider_get', new=mock.AsyncMock(return_value=response))
+
+    async def test_nearby_town_answers_without_nominatim(self):
+        with self.nominatim({}) as get:
+            place = await areverse_geocode(6.75, -1.6)
+
+        self.assertEqual(place, {'name': 'Kumasi', 'country': 'Ghana'})
+        get.assert_not_awaited()
+
+    async def test_points_past_the_gazetteer_radius_ask_nominatim_once_per_cell(self):
+        with self.nominatim({'town': 'Techiman', 'country': "Côte d'Ivoire"}) as get:
+            first = await areverse_geocode(7.5, -1.62)
+            second = await areverse_geocode(7.5001, -1.6201)
+
+        self.assertEqual(first, {'name': 'Techiman', 'country': 'Ivory Coast'})
+        self.assertEqual(second, first)
+        _, q_lat, q_lon = quantize_coords('reverse', 7.5, -1.62)
+        get.assert_awaited_once()
+        params = get.await_args.kwargs['params']
+        self.assertEqual((params['lat'], params['lon']), (q_lat, q_lon))
+
+    async def test_failed_lookups_fall_back_to_the_nearest_known_town(self):
+        with mock.patch('analysis.utils.aprovider_get', side_effect=ConnectionError('reset')), \
+                mock.patch('analysis.utils.logger'):
+            self.assertEqual(await areverse_geocode(7.5, -1.62), {'name': 'Kumasi', 'country': 'Ghana'})
+            self.assertIsNone(await areverse_geocode(0.0, -30.0))
+
+    def test_view_returns_the_place_and_point(self):
+        with self.nominatim({}):
+            response = self.client.get('/analysis/reverse-geocode/', {'lat': 6.75, 'lon': -1.6})
+            self.assertEqual(response.json(), {'name': 'Kumasi', 'country': 'Ghana', 'lat': 6.75, 'lon': -1.6})
+
+            self.assertEqual(self.client.get('/analysis/reverse-geocode/', {'lat': 95, 'lon': 0}).status_code, 400)
+            self.assertEqual(self.client.get('/analysis/reverse-geocode/', {'lat': 0, 'lon': -30}).status_code, 404)
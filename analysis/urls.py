@@ -5,4 +5,11 @@ app_name = 'analysis'
 
 urlpatterns = [
     path('live-report/', views.live_report, name='live_report'),
+    path('jobs/', views.start_report_job, name='start_report_job'),
+    path('jobs/<uuid:job_id>/', views.report_job_status, name='report_job_status'),
+    path('stream/', views.stream_report, name='stream_report'),
+    path('stream/events/', views.stream_report_events, name='stream_report_events'),
+    path('reverse-geocode/', views.reverse_geocode, name='reverse_geocode'),
+    path('batches/', views.create_batch, name='create_batch'),
+    path('batches/<str:batch>/', views.batch_detail, name='batch_detail'),
 ]
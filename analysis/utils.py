@@ -1,152 +1,251 @@
+import hashlib
 import json
+import logging
 import os
-import requests
-from datetime import datetime
-from django.core.cache import cache
-from google import genai
+import time
+from datetime import datetime, timezone
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
 from google.genai import types
+from analysis.clients import aprovider_get, apace_provider, provider_circuit, get_async_gemini_client
+from analysis.ndvi import asample_ndvi
+from core.cache import acache_get_or_compute, acache_get_or_refresh
+from core.gazetteer import get_gazetteer, lookup_place, resolve_country
+from core.geo import geohash_encode, geohash_center
 
-def get_gemini_client():
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if api_key:
-        return genai.Client(api_key=api_key)
-    return None
+# Paths on each provider's base_url (settings.UPSTREAM_PROVIDERS).
+NOMINATIM_SEARCH_URL = "/search"
+NOMINATIM_REVERSE_URL = "/reverse"
+OPENWEATHER_URL = "/data/2.5/weather"
+OPEN_METEO_ELEVATION_URL = "/v1/elevation"
+GEMINI_MODEL = "gemini-2.5-flash"
 
-def get_coords_from_location(location_name: str) -> dict:
-    cache_key = f"geocode_{location_name}"
-    cached_result = cache.get(cache_key)
-    
-    if cached_result:
-        return cached_result
-    
-    try:
-        url = "https://nominatim.openstreetmap.org/search"
-        params = {
-            'q': location_name,
-            'format': 'json',
-            'limit': 1
+# A map click names the nearest gazetteer town within this distance before asking Nominatim.
+REVERSE_GEOCODE_RADIUS_KM = 15
+# If Nominatim cannot name the spot either, fall back to a town this far away.
+REVERSE_GEOCODE_FALLBACK_KM = 250
+
+# Bucket widths used when keying cached analyses (mm, mm, metres, NDVI units).
+ANALYSIS_INPUT_BUCKETS = {
+    'precipitation_forecast': 5,
+    'recent_rain': 1,
+    'elevation': 10,
+    'ndvi': 0.05,
+}
+
+logger = logging.getLogger(__name__)
+
+def quantize_coords(family: str, lat: float, lon: float) -> tuple:
+    # Snap to the centre of the family's geohash cell so nearby lookups share a
+    # cache entry and the upstream value is the same whichever point missed first.
+    cell = geohash_encode(lat, lon, settings.PROVIDER_CACHE_PRECISION[family])
+    center_lat, center_lon = geohash_center(cell)
+    return f"{family}_{cell}", round(center_lat, 6), round(center_lon, 6)
+
+def _note_freshness(freshness: dict | None, source: str, fetched_at: float = None, stale: bool = False) -> None:
+    # Records where a report input came from: 'fresh' or 'stale' cache data, or the built-in 'fallback'.
+    if freshness is None:
+        return
+    if fetched_at is None:
+        freshness[source] = {'status': 'fallback', 'fetched_at': None, 'age_seconds': None}
+        return
+    freshness[source] = {
+        'status': 'stale' if stale else 'fresh',
+        'fetched_at': datetime.fromtimestamp(fetched_at, timezone.utc).isoformat(timespec='seconds'),
+        'age_seconds': max(0, int(time.time() - fetched_at)),
+    }
+
+def _geocode_params(location_name: str) -> dict:
+    return {
+        'q': location_name,
+        'format': 'json',
+        'limit': 1
+    }
+
+def _parse_geocode(data: list) -> dict | None:
+    if data:
+        return {
+            'lat': float(data[0]['lat']),
+            'lon': float(data[0]['lon']),
+            'country': data[0].get('display_name', '').split(',')[-1].strip()
         }
-        headers = {'User-Agent': 'ASASE-Environmental-Platform/1.0'}
-        
-        response = requests.get(url, params=params, headers=headers, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        if data:
-            result = {
-                'lat': float(data[0]['lat']),
-                'lon': float(data[0]['lon']),
-                'country': data[0].get('display_name', '').split(',')[-1].strip()
-            }
-            cache.set(cache_key, result, timeout=43200)
-            return result
-    except Exception as e:
-        print(f"Geocoding error: {e}")
-    
+    return None
+
+def _geocode_fallback() -> dict:
     return {
         'lat': 6.5244,
         'lon': 3.3792,
         'country': 'Nigeria (Sample Data)'
     }
 
-def get_weather_data(lat: float, lon: float) -> dict:
-    cache_key = f"weather_{lat}_{lon}"
-    cached_result = cache.get(cache_key)
-    
-    if cached_result:
-        return cached_result
-    
-    try:
-        api_key = os.environ.get('OPENWEATHER_API_KEY')
-        if not api_key:
-            raise ValueError("OpenWeather API key not found")
-            
-        url = f"https://api.openweathermap.org/data/2.5/weather"
-        params = {
-            'lat': lat,
-            'lon': lon,
-            'appid': api_key,
-            'units': 'metric'
-        }
-        
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        clouds = data.get('clouds', {}).get('all', 0)
-        humidity = data.get('main', {}).get('humidity', 0)
-        precipitation_forecast = int((clouds + humidity) / 2)
-        recent_rain = data.get('rain', {}).get('1h', 0)
-        
-        result = {
-            'precipitation_forecast': int(precipitation_forecast),
-            'recent_rain_trend': float(recent_rain)
-        }
-        cache.set(cache_key, result, timeout=1800)
+async def _afetch_coords(location_name: str) -> dict | None:
+    response = await aprovider_get('nominatim', NOMINATIM_SEARCH_URL, params=_geocode_params(location_name))
+    response.raise_for_status()
+    return _parse_geocode(response.json())
+
+def _gazetteer_coords(location_name: str) -> dict | None:
+    # Known towns resolve from the bundled gazetteer without a Nominatim round trip.
+    place = lookup_place(location_name)
+    if place is None:
+        return None
+    return {'lat': place.latitude, 'lon': place.longitude, 'country': place.country}
+
+async def aget_coords_from_location(location_name: str) -> dict:
+    result = _gazetteer_coords(location_name)
+    if result:
         return result
+
+    try:
+        result = await acache_get_or_compute(f"geocode_{location_name}", lambda: _afetch_coords(location_name), 43200)
+        if result:
+            return result
+    except Exception as e:
+        logger.warning("Geocoding error: %s", e)
+
+    return _geocode_fallback()
+
+def _nearby_place(lat: float, lon: float, max_km: float) -> dict | None:
+    place, _ = get_gazetteer().nearest(lat, lon, max_km)
+    if place is None:
+        return None
+    return {'name': place.name, 'country': place.country}
+
+def _reverse_params(lat: float, lon: float) -> dict:
+    return {
+        'format': 'json',
+        'lat': lat,
+        'lon': lon,
+        'zoom': 10,
+        'addressdetails': 1,
+    }
+
+def _parse_reverse(data: dict) -> dict | None:
+    address = data.get('address') or {}
+    name = (address.get('city') or address.get('town') or address.get('village')
+            or address.get('county') or address.get('state'))
+    country = address.get('country', '')
+    if not name or not country:
+        return None
+    return {'name': name, 'country': resolve_country(country) or country}
+
+async def _areverse_geocode(lat: float, lon: float) -> dict | None:
+    place = _nearby_place(lat, lon, REVERSE_GEOCODE_RADIUS_KM)
+    if place:
+        return place
+    response = await aprovider_get('nominatim', NOMINATIM_REVERSE_URL, params=_reverse_params(lat, lon))
+    response.raise_for_status()
+    return _parse_reverse(response.json())
+
+async def areverse_geocode(lat: float, lon: float) -> dict | None:
+    key, q_lat, q_lon = quantize_coords('reverse', lat, lon)
+    try:
+        result = await acache_get_or_compute(key, lambda: _areverse_geocode(q_lat, q_lon), 86400)
+        if result:
+            return result
     except Exception as e:
-        print(f"Weather API error: {e}")
-        
+        logger.warning("Reverse geocoding error: %s", e)
+
+    return _nearby_place(lat, lon, REVERSE_GEOCODE_FALLBACK_KM)
+
+def _weather_params(lat: float, lon: float) -> dict:
+    api_key = os.environ.get('OPENWEATHER_API_KEY')
+    if not api_key:
+        raise ValueError("OpenWeather API key not found")
+
+    return {
+        'lat': lat,
+        'lon': lon,
+        'appid': api_key,
+        'units': 'metric'
+    }
+
+def _parse_weather(data: dict) -> dict:
+    clouds = data.get('clouds', {}).get('all', 0)
+    humidity = data.get('main', {}).get('humidity', 0)
+    precipitation_forecast = int((clouds + humidity) / 2)
+    recent_rain = data.get('rain', {}).get('1h', 0)
+
+    return {
+        'precipitation_forecast': int(precipitation_forecast),
+        'recent_rain_trend': float(recent_rain)
+    }
+
+def _weather_fallback() -> dict:
     return {
         'precipitation_forecast': 65,
         'recent_rain_trend': 12.5
     }
 
-def get_elevation_data(lat: float, lon: float) -> int:
-    cache_key = f"elevation_{lat}_{lon}"
-    cached_result = cache.get(cache_key)
-    
-    if cached_result is not None:
-        return cached_result
-    
+async def _afetch_weather(lat: float, lon: float) -> dict:
+    response = await aprovider_get('openweather', OPENWEATHER_URL, params=_weather_params(lat, lon))
+    response.raise_for_status()
+    return _parse_weather(response.json())
+
+async def aget_weather_data(lat: float, lon: float, freshness: dict = None) -> dict:
+    cache_key, lat, lon = quantize_coords('weather', lat, lon)
+
     try:
-        url = "https://api.open-meteo.com/v1/elevation"
-        params = {
-            'latitude': lat,
-            'longitude': lon
-        }
-        
-        response = requests.get(url, params=params, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        result = int(data.get('elevation', [0])[0])
-        cache.set(cache_key, result, timeout=43200)
-        return result
+        value, fetched_at, stale = await acache_get_or_refresh(
+            cache_key, lambda: _afetch_weather(lat, lon), 1800, settings.PROVIDER_CACHE_STALE_FOR['weather']
+        )
+        _note_freshness(freshness, 'weather', fetched_at, stale)
+        return value
     except Exception as e:
-        print(f"Elevation API error: {e}")
-        
+        logger.warning("Weather API error: %s", e)
+
+    _note_freshness(freshness, 'weather')
+    return _weather_fallback()
+
+def _elevation_params(lat: float, lon: float) -> dict:
+    return {
+        'latitude': lat,
+        'longitude': lon
+    }
+
+def _parse_elevation(data: dict) -> int:
+    return int(data.get('elevation', [0])[0])
+
+async def _afetch_elevation(lat: float, lon: float) -> int:
+    response = await aprovider_get('open_meteo', OPEN_METEO_ELEVATION_URL, params=_elevation_params(lat, lon))
+    response.raise_for_status()
+    return _parse_elevation(response.json())
+
+async def aget_elevation_data(lat: float, lon: float, freshness: dict = None) -> int:
+    cache_key, lat, lon = quantize_coords('elevation', lat, lon)
+
+    try:
+        value, fetched_at, stale = await acache_get_or_refresh(
+            cache_key, lambda: _afetch_elevation(lat, lon), 43200, settings.PROVIDER_CACHE_STALE_FOR['elevation']
+        )
+        _note_freshness(freshness, 'elevation', fetched_at, stale)
+        return value
+    except Exception as e:
+        logger.warning("Elevation API error: %s", e)
+
+    _note_freshness(freshness, 'elevation')
     return 125
 
-def get_real_ndvi(lat: float, lon: float) -> float:
-    cache_key = f"ndvi_{lat}_{lon}"
-    cached_result = cache.get(cache_key)
-    
-    if cached_result is not None:
-        return cached_result
-    
+async def aget_real_ndvi(lat: float, lon: float, freshness: dict = None) -> float:
+    cache_key, lat, lon = quantize_coords('ndvi', lat, lon)
+
     try:
-        url = "https://gibs.earthdata.nasa.gov/wmts/epsg4326/best/MODIS_Terra_NDVI_8Day/default/2025-10-01/250m/4/8/5.png"
-        response = requests.get(url, timeout=10)
-        
-        if response.status_code == 200:
-            result = 0.65
-            cache.set(cache_key, result, timeout=43200)
-            return result
+        value, fetched_at, stale = await acache_get_or_refresh(
+            cache_key, lambda: asample_ndvi(lat, lon), 43200, settings.PROVIDER_CACHE_STALE_FOR['ndvi']
+        )
+        if value is not None:
+            _note_freshness(freshness, 'ndvi', fetched_at, stale)
+            return value
     except Exception as e:
-        print(f"NDVI API error: {e}")
-    
+        logger.warning("NDVI API error: %s", e)
+
+    _note_freshness(freshness, 'ndvi')
     return 0.62
 
-def get_ai_analysis(location_name: str, country: str, all_data: dict) -> dict:
-    try:
-        client = get_gemini_client()
-        if not client:
-            raise ValueError("Gemini API key not configured")
-            
-        current_time = datetime.now().strftime('%H:%M')
-        
-        prompt = f"""You are an expert Environmental Geo-Analyst providing a professional risk assessment.
+def _analysis_prompt(location_name: str, country: str, all_data: dict) -> str:
+    current_time = datetime.now().strftime('%H:%M')
+
+    return f"""You are an expert Environmental Geo-Analyst providing a professional risk assessment.
 The current time is Friday, October 10, 2025 at {current_time} WAT.
 Analyze the following data for {location_name}, {country}:
 {json.dumps(all_data, indent=2)}
@@ -168,27 +267,70 @@ Provide a response ONLY in the following JSON format:
   }}
 }}"""
 
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=prompt,
+def analysis_fallback(location_name: str, country: str) -> dict:
+    return {
+        "inferred_land_health_score": 6,
+        "professional_analysis": {
+            "title": f"ENVIRONMENTAL ANALYSIS FOR: {location_name}, {country}",
+            "timestamp": datetime.now().strftime('%B %d, %Y at %H:%M WAT'),
+            "subject": "ASSESSMENT OF IMMINENT RISKS AND LAND HEALTH (SDG 15)",
+            "assessment": f"Based on available data for {location_name}, moderate environmental risks have been detected. Precipitation patterns suggest elevated flood risk, while air quality remains within acceptable parameters. Sample data indicates further analysis recommended.",
+            "sdg_15_compliance": "Land health metrics show moderate compliance with SDG 15.3 targets. Vegetation indices within normal range, though continued monitoring advised.",
+            "recommendations": "Immediate: Monitor weather patterns and prepare flood mitigation measures. Long-term: Implement sustainable land management practices and regular environmental monitoring."
+        }
+    }
+
+def bucket_analysis_inputs(all_data: dict) -> dict:
+    # Readings that differ by less than a bucket would not change the analysis,
+    # so they share one cached result.
+    bucketed = {}
+    for key, value in sorted(all_data.items()):
+        step = ANALYSIS_INPUT_BUCKETS.get(key)
+        if step and isinstance(value, (int, float)):
+            value = round(round(value / step) * step, 4)
+        bucketed[key] = value
+    return bucketed
+
+def analysis_cache_key(location_name: str, country: str, all_data: dict) -> str:
+    canonical = json.dumps({
+        'location': location_name.strip().lower(),
+        'country': country.strip().lower(),
+        'data': bucket_analysis_inputs(all_data),
+        'model': GEMINI_MODEL,
+    }, sort_keys=True, separators=(',', ':'))
+    return f"ai_analysis_{hashlib.sha256(canonical.encode()).hexdigest()}"
+
+def fresh_timestamp(result: dict) -> dict:
+    # A cached analysis is served as of now, not as of when it was generated.
+    analysis = dict(result.get('professional_analysis', {}))
+    analysis['timestamp'] = datetime.now().strftime('%B %d, %Y at %H:%M WAT')
+    return {**result, 'professional_analysis': analysis}
+
+async def _agenerate_analysis(location_name: str, country: str, all_data: dict) -> dict:
+    client = get_async_gemini_client()
+    if not client:
+        raise ValueError("Gemini API key not configured")
+
+    with provider_circuit('gemini'):
+        await apace_provider('gemini')
+        response = await client.models.generate_content(
+            model=GEMINI_MODEL,
+            contents=_analysis_prompt(location_name, country, all_data),
             config=types.GenerateContentConfig(
                 response_mime_type="application/json",
             ),
         )
+    return json.loads(response.text)
 
-        result = json.loads(response.text)
-        return result
+async def aget_ai_analysis(location_name: str, country: str, all_data: dict) -> dict:
+    try:
+        result = await acache_get_or_compute(
+            analysis_cache_key(location_name, country, all_data),
+            lambda: _agenerate_analysis(location_name, country, all_data),
+            DEFAULT_TIMEOUT, cache=caches['ai']
+        )
+        return fresh_timestamp(result)
     except Exception as e:
-        print(f"AI Analysis error: {e}")
-        
-        return {
-            "inferred_land_health_score": 6,
-            "professional_analysis": {
-                "title": f"ENVIRONMENTAL ANALYSIS FOR: {location_name}, {country}",
-                "timestamp": datetime.now().strftime('%B %d, %Y at %H:%M WAT'),
-                "subject": "ASSESSMENT OF IMMINENT RISKS AND LAND HEALTH (SDG 15)",
-                "assessment": f"Based on available data for {location_name}, moderate environmental risks have been detected. Precipitation patterns suggest elevated flood risk, while air quality remains within acceptable parameters. Sample data indicates further analysis recommended.",
-                "sdg_15_compliance": "Land health metrics show moderate compliance with SDG 15.3 targets. Vegetation indices within normal range, though continued monitoring advised.",
-                "recommendations": "Immediate: Monitor weather patterns and prepare flood mitigation measures. Long-term: Implement sustainable land management practices and regular environmental monitoring."
-            }
-        }
+        logger.warning("AI Analysis error: %s", e)
+
+        return analysis_fallback(location_name, country)
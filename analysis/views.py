@@ -1,124 +1,265 @@
+import json
+import re
+import secrets
+import uuid
+from urllib.parse import urlencode
 from django.shortcuts import render
-from django.http import HttpResponse
-from analysis.utils import (
-    get_coords_from_location, get_weather_data, 
-    get_elevation_data, get_real_ndvi, get_ai_analysis
-)
-from archive.models import ReportSnapshot
-
-def get_risk_color(score):
-    if score <= 3:
-        return '#7cb342'
-    elif score <= 6:
-        return '#FFA726'
-    else:
-        return '#EF5350'
-
-def live_report(request):
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
+from analysis.batch import enqueue_batch, batch_status, submit_batch
+from analysis.jobs import submit_job
+from analysis.models import ReportJob
+from analysis.pipeline import arun_live_report, LocationNotFound
+from analysis.streaming import astream_live_report
+from analysis.utils import areverse_geocode
+from core.metrics import stage
+
+BATCH_NAME = re.compile(r'[A-Za-z0-9_-]{1,100}')
+# Long enough for the page to open its EventSource, short enough that a leaked URL is useless.
+STREAM_TOKEN_TIMEOUT = 60
+
+def _parse_coordinates(data):
+    # Map clicks send the clicked point along with the place name.
+    try:
+        lat = float(data.get('lat', ''))
+        lon = float(data.get('lon', ''))
+    except ValueError:
+        return None, None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None, None
+    return lat, lon
+
+def _missing_location_response():
+    return HttpResponse(
+        '<div class="bg-red-100 border border-red-400 text-red-700 px-6 py-4 rounded-xl text-center">'
+        '<i class="bi bi-exclamation-circle text-2xl mr-2"></i>'
+        'Please provide a location to analyze.'
+        '</div>'
+    )
+
+def _not_found_response():
+    return HttpResponse(
+        '<div class="bg-amber-100 border border-amber-400 text-amber-800 px-6 py-4 rounded-xl text-center">'
+        '<i class="bi bi-search text-2xl mr-2"></i>'
+        'Location not found. Please check the spelling and try again, or try a nearby major city.'
+        '</div>'
+    )
+
+def _error_response(error):
+    return HttpResponse(
+        '<div class="bg-red-100 border border-red-400 text-red-700 px-6 py-4 rounded-xl text-center">'
+        '<i class="bi bi-exclamation-triangle text-2xl mr-2"></i>'
+        f'An error occurred while analyzing the location: {error}'
+        '</div>'
+    )
+
+async def live_report(request):
     if request.method == 'POST':
         location = request.POST.get('location', '')
         country = request.POST.get('country', '')
-        
+
         if not location:
-            return HttpResponse(
-                '<div class="bg-red-100 border border-red-400 text-red-700 px-6 py-4 rounded-xl text-center">'
-                '<i class="bi bi-exclamation-circle text-2xl mr-2"></i>'
-                'Please provide a location to analyze.'
-                '</div>'
-            )
-        
+            return _missing_location_response()
+
+        lat, lon = _parse_coordinates(request.POST)
         try:
-            full_location = f"{location}, {country}" if country else location
-            coords = get_coords_from_location(full_location)
-            
-            if not coords or coords.get('lat') == 6.5244:
-                return HttpResponse(
-                    '<div class="bg-amber-100 border border-amber-400 text-amber-800 px-6 py-4 rounded-xl text-center">'
-                    '<i class="bi bi-search text-2xl mr-2"></i>'
-                    'Location not found. Please check the spelling and try again, or try a nearby major city.'
-                    '</div>'
-                )
-            
-            weather = get_weather_data(coords['lat'], coords['lon'])
-            elevation = get_elevation_data(coords['lat'], coords['lon'])
-            ndvi = get_real_ndvi(coords['lat'], coords['lon'])
-            
-            raw_data = {
-                'precipitation_forecast': weather['precipitation_forecast'],
-                'recent_rain': weather['recent_rain_trend'],
-                'elevation': elevation,
-                'ndvi': ndvi
-            }
-            
-            flood_risk = min(10, int((weather['precipitation_forecast'] / 10) + (1 if elevation < 50 else 0)))
-            air_quality = max(1, min(10, 10 - int(weather['precipitation_forecast'] / 15)))
-            
-            ai_result = get_ai_analysis(location, coords['country'], raw_data)
-            land_health = ai_result.get('inferred_land_health_score', 6)
-            analysis = ai_result.get('professional_analysis', {})
-            
-            risk_scores = {
-                'flood': flood_risk,
-                'air': air_quality,
-                'land_health': land_health
-            }
-            
-            analysis_text = f"""
-            <div class="space-y-6">
-                <div>
-                    <h3 class="text-2xl font-bold text-navy mb-4">{analysis.get('title', '')}</h3>
-                    <p class="text-sm text-gray-600 mb-2">{analysis.get('timestamp', '')}</p>
-                    <p class="text-md font-semibold text-gray-800 mb-4">{analysis.get('subject', '')}</p>
-                </div>
-                <div>
-                    <h4 class="font-bold text-lg text-navy mb-2">Risk Assessment</h4>
-                    <p class="text-gray-700 leading-relaxed">{analysis.get('assessment', '')}</p>
-                </div>
-                <div>
-                    <h4 class="font-bold text-lg text-navy mb-2">SDG 15 Compliance Analysis</h4>
-                    <p class="text-gray-700 leading-relaxed">{analysis.get('sdg_15_compliance', '')}</p>
-                </div>
-                <div>
-                    <h4 class="font-bold text-lg text-navy mb-2">Recommendations</h4>
-                    <p class="text-gray-700 leading-relaxed">{analysis.get('recommendations', '')}</p>
-                </div>
-            </div>
-            """
-            
-            snapshot = ReportSnapshot.objects.create(
-                location_name=location,
-                country=coords['country'],
-                latitude=coords['lat'],
-                longitude=coords['lon'],
-                risk_scores=risk_scores,
-                ai_analysis_text=analysis_text,
-                raw_data=raw_data
-            )
-            
-            context = {
-                'location_name': location,
-                'country': coords['country'],
-                'latitude': coords['lat'],
-                'longitude': coords['lon'],
-                'location_slug': snapshot.slug,
-                'flood_risk': flood_risk,
-                'air_quality': air_quality,
-                'land_health': land_health,
-                'flood_color': get_risk_color(flood_risk),
-                'air_color': get_risk_color(air_quality),
-                'land_color': get_risk_color(land_health),
-                'analysis': analysis,
-                'timestamp': analysis.get('timestamp', '')
-            }
-            
-            return render(request, 'analysis/live_report.html', context)
-            
+            context = await arun_live_report(location, country, lat, lon)
+            with stage('render'):
+                return render(request, 'analysis/live_report.html', context)
+        except LocationNotFound:
+            return _not_found_response()
         except Exception as e:
-            return HttpResponse(
-                '<div class="bg-red-100 border border-red-400 text-red-700 px-6 py-4 rounded-xl text-center">'
-                '<i class="bi bi-exclamation-triangle text-2xl mr-2"></i>'
-                f'An error occurred while analyzing the location: {str(e)}'
-                '</div>'
-            )
-    
+            return _error_response(str(e))
+
+    return HttpResponse('Method not allowed')
+
+async def start_report_job(request):
+    if request.method == 'POST':
+        location = request.POST.get('location', '')
+        country = request.POST.get('country', '')
+
+        if not location:
+            return _missing_location_response()
+
+        lat, lon = _parse_coordinates(request.POST)
+        job = await ReportJob.objects.acreate(
+            location=location, country=country, latitude=lat, longitude=lon
+        )
+        submit_job(job.pk)
+
+        # The poll swaps the finished report into whichever element the form targeted.
+        target = request.headers.get('HX-Target', '')
+        if not re.fullmatch(r'[\w-]+', target):
+            target = 'analysis-results'
+
+        return render(request, 'analysis/report_job.html', {
+            'job': job,
+            'target': target,
+            'status_url': reverse('analysis:report_job_status', args=[job.pk]),
+        })
+
+    return HttpResponse('Method not allowed')
+
+async def report_job_status(request, job_id):
+    job = await ReportJob.objects.filter(pk=job_id).afirst()
+    if job is None:
+        return _error_response('this analysis request has expired. Please try again.')
+
+    if not job.is_finished:
+        # 204 tells htmx to leave the progress fragment in place and keep polling.
+        return HttpResponse(status=204)
+
+    if job.status == ReportJob.NOT_FOUND:
+        return _not_found_response()
+    if job.status == ReportJob.FAILED:
+        return _error_response(job.error)
+
+    with stage('render'):
+        return render(request, 'analysis/live_report.html', job.result)
+
+async def stream_report(request):
+    if request.method == 'POST':
+        location = request.POST.get('location', '')
+        country = request.POST.get('country', '')
+
+        if not location:
+            return _missing_location_response()
+
+        params = {'location': location, 'country': country}
+        lat, lon = _parse_coordinates(request.POST)
+        if lat is not None:
+            params.update({'lat': lat, 'lon': lon})
+        # The events URL is a GET, so it carries a one-time token from this (CSRF-checked)
+        # POST instead of the report parameters themselves.
+        token = await sync_to_async(_issue_stream_token)(params)
+        return render(request, 'analysis/live_report_stream.html', {
+            'location': location,
+            'country': country,
+            'events_url': f"{reverse('analysis:stream_report_events')}?{urlencode({'token': token})}",
+        })
+
     return HttpResponse('Method not allowed')
+
+def _stream_token_key(token):
+    return f"stream-token:{token}"
+
+def _issue_stream_token(params):
+    token = secrets.token_urlsafe(16)
+    cache.set(_stream_token_key(token), params, STREAM_TOKEN_TIMEOUT)
+    return token
+
+def _claim_stream_token(token):
+    # Only the request whose delete removed the row gets the parameters, so a replayed
+    # (or concurrently reused) URL never starts a second report.
+    key = _stream_token_key(token)
+    params = cache.get_shared(key)
+    if params is None or not cache.delete(key):
+        return None
+    return params
+
+def _sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _report_events(location, country, lat, lon):
+    try:
+        async for event, data in astream_live_report(location, country, lat, lon):
+            yield _sse_event(event, data)
+    except LocationNotFound:
+        yield _sse_event('failed', {'html': _not_found_response().content.decode()})
+    except Exception as e:
+        yield _sse_event('failed', {'html': _error_response(str(e)).content.decode()})
+
+async def stream_report_events(request):
+    params = await sync_to_async(_claim_stream_token)(request.GET.get('token', ''))
+    if params is None:
+        response = _error_response('this report link has expired. Please try again.')
+        response.status_code = 403
+        return response
+
+    location, country = params['location'], params['country']
+    lat, lon = params.get('lat'), params.get('lon')
+    response = StreamingHttpResponse(
+        _report_events(location, country, lat, lon), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Stop proxies (Render, nginx) from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+async def reverse_geocode(request):
+    lat, lon = _parse_coordinates(request.GET)
+    if lat is None:
+        return JsonResponse({'error': 'lat and lon are required'}, status=400)
+
+    place = await areverse_geocode(lat, lon)
+    if place is None:
+        return JsonResponse({'error': 'No place found near this point'}, status=404)
+    return JsonResponse({**place, 'lat': lat, 'lon': lon})
+
+def _parse_batch_request(body: bytes) -> tuple:
+    """(batch, entries) from a create_batch request body. Raises ValueError with a message fit for the client."""
+    try:
+        payload = json.loads(body)
+        entries = [(item['location'], item.get('country') or '') for item in payload['locations']]
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise ValueError('Expected {"locations": [{"location": ..., "country": ...}, ...]}')
+    if not all(isinstance(location, str) and isinstance(country, str) for location, country in entries):
+        raise ValueError('location and country must be strings')
+
+    # The name becomes part of the status URL, so it is kept to URL-safe characters.
+    batch = payload.get('batch') or f"api-{uuid.uuid4().hex[:12]}"
+    if not isinstance(batch, str) or not BATCH_NAME.fullmatch(batch):
+        raise ValueError('batch must be 1-100 letters, digits, hyphens or underscores')
+    return batch, entries
+
+def _batch_api_authorized(request):
+    token = getattr(settings, 'BATCH_API_TOKEN', '')
+    return bool(token) and request.headers.get('Authorization', '') == f"Bearer {token}"
+
+@csrf_exempt
+async def create_batch(request):
+    if not _batch_api_authorized(request):
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    try:
+        batch, entries = _parse_batch_request(request.body)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    queued = await sync_to_async(enqueue_batch)(batch, entries)
+    submit_batch(batch)
+
+    return JsonResponse({
+        'batch': batch,
+        'queued': queued,
+        'status_url': reverse('analysis:batch_detail', args=[batch]),
+    }, status=202)
+
+async def batch_detail(request, batch):
+    if not _batch_api_authorized(request):
+        return JsonResponse({'error': 'Unauthorized'}, status=401)
+
+    jobs = [
+        {
+            'location': job.location,
+            'country': job.country,
+            'status': job.status,
+            'snapshot_slug': (job.result or {}).get('snapshot_slug'),
+            'error': job.error,
+        }
+        async for job in ReportJob.objects.filter(batch=batch).order_by('created_at')
+    ]
+    if not jobs:
+        return JsonResponse({'error': 'Unknown batch'}, status=404)
+
+    return JsonResponse({
+        'batch': batch,
+        'counts': await sync_to_async(batch_status)(batch),
+        'jobs': jobs,
+    })
@@ -0,0 +1,98 @@
+import math
+from django.core.cache import caches
+from archive.models import LocationSummary
+from archive.page_cache import PAGE_CACHE
+from archive.rollups import DIMENSIONS, score_value
+from core.cache import cache_get_or_compute
+
+TILE_SIZE = 256
+# Points closer than this many pixels at the requested zoom share a cluster.
+CLUSTER_CELL_PX = 64
+MAX_ZOOM = 18
+# Web Mercator stops short of the poles.
+MAX_LATITUDE = 85.05112878
+
+
+def _world_pixels(lat: float, lon: float, zoom: int) -> tuple:
+    scale = TILE_SIZE * 2 ** zoom
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    sin_lat = math.sin(math.radians(lat))
+    x = (lon + 180) / 360 * scale
+    y = (0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * scale
+    return min(x, scale - 1), min(max(y, 0), scale - 1)
+
+def _tile_lat(y: int, zoom: int) -> float:
+    n = math.pi - 2 * math.pi * y / 2 ** zoom
+    return math.degrees(math.atan(math.sinh(n)))
+
+def tile_bounds(zoom: int, x: int, y: int) -> tuple:
+    """(min_lon, min_lat, max_lon, max_lat) of an XYZ tile."""
+    n = 2 ** zoom
+    return x / n * 360 - 180, _tile_lat(y + 1, zoom), (x + 1) / n * 360 - 180, _tile_lat(y, zoom)
+
+def tiles_for_bbox(bbox: tuple, zoom: int) -> list:
+    min_lon, min_lat, max_lon, max_lat = bbox
+    left, bottom = _world_pixels(min_lat, min_lon, zoom)
+    right, top = _world_pixels(max_lat, max_lon, zoom)
+    return [
+        (x, y)
+        for x in range(int(left // TILE_SIZE), int(right // TILE_SIZE) + 1)
+        for y in range(int(top // TILE_SIZE), int(bottom // TILE_SIZE) + 1)
+    ]
+
+def _point_feature(lat, lon, properties) -> dict:
+    return {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [lon, lat]}, 'properties': properties}
+
+def build_tile_features(zoom: int, x: int, y: int) -> list:
+    """
+    GeoJSON features for the latest report of every location in one tile,
+    clustered on a CLUSTER_CELL_PX grid. Cells never straddle tiles, so tiles
+    can be computed and cached independently.
+    """
+    min_lon, min_lat, max_lon, max_lat = tile_bounds(zoom, x, y)
+    rows = LocationSummary.objects.filter(
+        location__latitude__range=(min_lat, max_lat), location__longitude__range=(min_lon, max_lon)
+    ).values_list(
+        'location__latitude', 'location__longitude', 'location_name', 'country', 'slug', 'risk_scores', 'latest_timestamp'
+    )
+
+    cells = {}
+    for lat, lon, name, country, slug, risk_scores, latest in rows.iterator(chunk_size=2000):
+        px, py = _world_pixels(lat, lon, zoom)
+        # Points on a shared edge are matched by both tiles' ranges; keep them in one.
+        if (int(px // TILE_SIZE), int(py // TILE_SIZE)) != (x, y):
+            continue
+        cells.setdefault((int(px // CLUSTER_CELL_PX), int(py // CLUSTER_CELL_PX)), []).append(
+            (lat, lon, name, country, slug, risk_scores, latest)
+        )
+
+    features = []
+    for members in cells.values():
+        if len(members) == 1:
+            lat, lon, name, country, slug, risk_scores, latest = members[0]
+            features.append(_point_feature(lat, lon, {
+                'cluster': False,
+                'name': name,
+                'country': country,
+                'url': f"/location/{slug}/",
+                'timestamp': latest.isoformat(),
+                **{dimension: risk_scores.get(dimension) for dimension in DIMENSIONS},
+            }))
+            continue
+
+        count = len(members)
+        properties = {'cluster': True, 'count': count}
+        for dimension in DIMENSIONS:
+            # Scored the way the rollups score them, so stray non-numeric values count as 0.
+            scores = [score_value(member[5][dimension]) for member in members if member[5].get(dimension) is not None]
+            properties[dimension] = round(sum(scores) / len(scores), 1) if scores else None
+        features.append(_point_feature(
+            sum(member[0] for member in members) / count, sum(member[1] for member in members) / count, properties
+        ))
+    return features
+
+def tile_features(zoom: int, x: int, y: int, version: float) -> list:
+    # `version` is the archive page version, which every saved or deleted snapshot bumps.
+    cache = caches[PAGE_CACHE]
+    key = f"map_tile_{zoom}_{x}_{y}_{version!r}"
+    return cache_get_or_compute(key, lambda: build_tile_features(zoom, x, y), cache.default_timeout, cache=cache)
@@ -0,0 +1,150 @@
+import csv
+import io
+import json
+import math
+from datetime import date
+from archive.models import ReportSnapshot
+from archive.rollups import DIMENSIONS, period_bounds
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'geojson': 'application/geo+json',
+}
+INPUT_COLUMNS = ('precipitation_forecast', 'recent_rain', 'elevation', 'ndvi')
+ANALYSIS_COLUMNS = ('title', 'subject', 'assessment', 'sdg_15_compliance', 'recommendations')
+# Rows fetched per database round trip, and rows sent per chunk of the response.
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FLUSH_ROWS = 500
+
+
+def parse_bbox(value: str) -> tuple:
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(part) for part in value.split(','))
+    except ValueError:
+        raise ValueError('bbox must be min_lon,min_lat,max_lon,max_lat')
+    if not all(math.isfinite(part) for part in (min_lon, min_lat, max_lon, max_lat)):
+        raise ValueError('bbox must be min_lon,min_lat,max_lon,max_lat')
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError('bbox minimums must not exceed its maximums')
+    return min_lon, min_lat, max_lon, max_lat
+
+def parse_export_filters(params) -> dict:
+    """
+    Read country, start, end (YYYY-MM-DD, both inclusive) and bbox
+    (min_lon,min_lat,max_lon,max_lat) from request GET parameters or command
+    options. Raises ValueError with a message fit for the caller.
+    """
+    filters = {'country': (params.get('country') or '').strip()}
+    for name in ('start', 'end'):
+        value = params.get(name)
+        try:
+            filters[name] = date.fromisoformat(value) if value else None
+        except ValueError:
+            raise ValueError(f"{name} must be a YYYY-MM-DD date")
+
+    filters['bbox'] = parse_bbox(params.get('bbox')) if params.get('bbox') else None
+    return filters
+
+def export_queryset(country='', start=None, end=None, bbox=None, analysis=False):
+    fields = ['id', 'slug', 'location_name', 'country', 'latitude', 'longitude', 'timestamp', 'risk_scores', 'raw_data']
+    if analysis:
+        fields.append('analysis')
+
+    snapshots = ReportSnapshot.objects.all()
+    if country:
+        snapshots = snapshots.filter(country__iexact=country)
+    # Dates are whole days in the site's time zone, compared on the indexed timestamp.
+    if start:
+        snapshots = snapshots.filter(timestamp__gte=period_bounds(start, 'day')[0])
+    if end:
+        snapshots = snapshots.filter(timestamp__lt=period_bounds(end, 'day')[1])
+    if bbox:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        snapshots = snapshots.filter(latitude__range=(min_lat, max_lat), longitude__range=(min_lon, max_lon))
+    return snapshots.order_by('id').values(*fields)
+
+def export_record(row: dict, analysis=False) -> dict:
+    record = {
+        'id': row['id'],
+        'slug': row['slug'],
+        'location_name': row['location_name'],
+        'country': row['country'],
+        'latitude': row['latitude'],
+        'longitude': row['longitude'],
+        'timestamp': row['timestamp'].isoformat(),
+    }
+    record.update({dimension: row['risk_scores'].get(dimension) for dimension in DIMENSIONS})
+    record.update({column: row['raw_data'].get(column) for column in INPUT_COLUMNS})
+    if analysis:
+        record.update({column: (row['analysis'] or {}).get(column, '') for column in ANALYSIS_COLUMNS})
+    return record
+
+def _csv_line(values) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+class ExportEncoder:
+    """Turns export rows into text for one format: head(), then row() for each, then tail()."""
+
+    def __init__(self, export_format: str, analysis=False):
+        self.format = export_format
+        self.analysis = analysis
+        self.columns = self._columns()
+        self.rows = 0
+
+    def _columns(self):
+        columns = ['id', 'slug', 'location_name', 'country', 'latitude', 'longitude', 'timestamp']
+        columns += [*DIMENSIONS, *INPUT_COLUMNS]
+        if self.analysis:
+            columns += ANALYSIS_COLUMNS
+        return columns
+
+    def head(self) -> str:
+        if self.format == 'csv':
+            return _csv_line(self.columns)
+        if self.format == 'geojson':
+            return '{"type": "FeatureCollection", "features": [\n'
+        return ''
+
+    def row(self, row: dict) -> str:
+        record = export_record(row, self.analysis)
+        self.rows += 1
+        if self.format == 'csv':
+            return _csv_line(record[column] for column in self.columns)
+        if self.format == 'geojson':
+            feature = {
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': [record['longitude'], record['latitude']]},
+                'properties': record,
+            }
+            return (',\n' if self.rows > 1 else '') + json.dumps(feature, ensure_ascii=False)
+        return json.dumps(record, ensure_ascii=False) + '\n'
+
+    def tail(self) -> str:
+        return '\n]}\n' if self.format == 'geojson' else ''
+
+
+def iter_export(snapshots, encoder: ExportEncoder):
+    """Stream an export of `snapshots` (from export_queryset) with a server-side cursor."""
+    yield encoder.head()
+    lines = []
+    for row in snapshots.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        lines.append(encoder.row(row))
+        if len(lines) >= EXPORT_FLUSH_ROWS:
+            yield ''.join(lines)
+            lines = []
+    yield ''.join(lines) + encoder.tail()
+
+async def aiter_export(snapshots, encoder: ExportEncoder):
+    # Async counterpart of iter_export(): under ASGI a sync iterator would be read whole before sending.
+    yield encoder.head()
+    lines = []
+    async for row in snapshots.aiterator(chunk_size=EXPORT_CHUNK_SIZE):
+        lines.append(encoder.row(row))
+        if len(lines) >= EXPORT_FLUSH_ROWS:
+            yield ''.join(lines)
+            lines = []
+    yield ''.join(lines) + encoder.tail()
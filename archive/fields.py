@@ -0,0 +1,60 @@
+import json
+import zlib
+from django.db import models
+
+PLAIN = b'j'
+COMPRESSED = b'z'
+
+
+def encode_json(value, compress=True) -> bytes:
+    raw = json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode()
+    if compress:
+        packed = zlib.compress(raw, 6)
+        if len(packed) < len(raw):
+            return COMPRESSED + packed
+    return PLAIN + raw
+
+def decode_json(data):
+    data = bytes(data)
+    if not data:
+        return None
+    if data[:1] == COMPRESSED:
+        return json.loads(zlib.decompress(data[1:]))
+    return json.loads(data[1:])
+
+
+class CompressedJSONField(models.BinaryField):
+    """
+    A JSON value stored as bytes, zlib-compressed whenever that is smaller.
+    The first byte records which form the rest is in, so rows written with
+    compress=False (or too short to gain from it) read back the same way.
+    """
+
+    def __init__(self, *args, compress=True, **kwargs):
+        self.compress = compress
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if not self.compress:
+            kwargs['compress'] = False
+        return name, path, args, kwargs
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return decode_json(value)
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return decode_json(value)
+        return value
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if value is not None and not isinstance(value, (bytes, bytearray, memoryview)):
+            value = encode_json(value, self.compress)
+        return super().get_db_prep_value(value, connection, prepared)
+
+    def value_to_string(self, obj):
+        # As JSONField does: serializers write the value itself, which to_python takes back as is.
+        return self.value_from_object(obj)
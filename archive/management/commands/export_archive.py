@@ -0,0 +1,40 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from archive.export import EXPORT_FORMATS, ExportEncoder, export_queryset, iter_export, parse_export_filters
+
+
+class Command(BaseCommand):
+    help = (
+        'Export report snapshots as CSV, NDJSON or GeoJSON, streamed from a database cursor '
+        'so memory use does not grow with the number of rows.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--country', help='Only this country (case-insensitive).')
+        parser.add_argument('--start', help='First day to include, YYYY-MM-DD.')
+        parser.add_argument('--end', help='Last day to include, YYYY-MM-DD.')
+        parser.add_argument('--bbox', help='min_lon,min_lat,max_lon,max_lat')
+        parser.add_argument('--analysis', action='store_true', help='Include the written analysis.')
+        parser.add_argument('--output', help='File to write (default: stdout).')
+
+    def handle(self, *args, **options):
+        try:
+            filters = parse_export_filters(options)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        encoder = ExportEncoder(options['format'], options['analysis'])
+        chunks = iter_export(export_queryset(**filters, analysis=options['analysis']), encoder)
+        try:
+            output = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else sys.stdout
+        except OSError as e:
+            raise CommandError(f"Cannot write {options['output']}: {e}")
+
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        self.stderr.write(f"Exported {encoder.rows} snapshot(s)")
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils.text import slugify
+
+
+def backfill_location_summaries(apps, schema_editor):
+    ReportSnapshot = apps.get_model('archive', 'ReportSnapshot')
+    LocationSummary = apps.get_model('archive', 'LocationSummary')
+
+    summaries = {}
+    for snapshot in ReportSnapshot.objects.order_by('-timestamp').iterator(chunk_size=2000):
+        key = f"{snapshot.location_name.strip().lower()}|{snapshot.country.strip().lower()}"
+        summary = summaries.get(key)
+        if summary is None:
+            summaries[key] = LocationSummary(
+                location_key=key,
+                location_name=snapshot.location_name,
+                country=snapshot.country,
+                slug=slugify(snapshot.location_name),
+                latest_snapshot_id=snapshot.id,
+                latest_timestamp=snapshot.timestamp,
+                risk_scores=snapshot.risk_scores,
+                report_count=1,
+            )
+        else:
+            summary.report_count += 1
+
+    LocationSummary.objects.bulk_create(summaries.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('archive', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location_key', models.CharField(max_length=360, unique=True)),
+                ('location_name', models.CharField(max_length=255)),
+                ('country', models.CharField(max_length=100)),
+                ('slug', models.SlugField(max_length=255)),
+                ('latest_timestamp', models.DateTimeField(db_index=True)),
+                ('risk_scores', models.JSONField()),
+                ('report_count', models.PositiveIntegerField(default=0)),
+                ('latest_snapshot', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='archive.reportsnapshot')),
+            ],
+            options={
+                'verbose_name_plural': 'location summaries',
+                'ordering': ['-latest_timestamp'],
+            },
+        ),
+        migrations.RunPython(backfill_location_summaries, migrations.RunPython.noop),
+    ]
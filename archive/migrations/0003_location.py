@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('archive', '0002_locationsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Location',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=360, unique=True)),
+                ('name', models.CharField(max_length=255)),
+                ('country', models.CharField(max_length=100)),
+                ('slug', models.SlugField(max_length=255, unique=True)),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='locationsummary',
+            name='location',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='archive.location'),
+        ),
+        migrations.AddField(
+            model_name='reportsnapshot',
+            name='location',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='snapshots', to='archive.location'),
+        ),
+        migrations.AddIndex(
+            model_name='reportsnapshot',
+            index=models.Index(fields=['location', '-timestamp'], name='snapshot_location_time_idx'),
+        ),
+    ]
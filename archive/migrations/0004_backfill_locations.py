@@ -0,0 +1,63 @@
+from django.db import migrations
+from django.utils.text import slugify
+
+
+def backfill_locations(apps, schema_editor):
+    Location = apps.get_model('archive', 'Location')
+    ReportSnapshot = apps.get_model('archive', 'ReportSnapshot')
+    LocationSummary = apps.get_model('archive', 'LocationSummary')
+
+    locations = {}
+    snapshot_ids = {}
+    used_slugs = set()
+
+    # Oldest first, so the place that was analysed first keeps the plain slug;
+    # coordinates are overwritten as we go and end up from the latest report.
+    for snapshot in ReportSnapshot.objects.order_by('timestamp').iterator(chunk_size=2000):
+        key = f"{snapshot.location_name.strip().lower()}|{snapshot.country.strip().lower()}"
+        snapshot_ids.setdefault(key, []).append(snapshot.id)
+        if key in locations:
+            locations[key].latitude = snapshot.latitude
+            locations[key].longitude = snapshot.longitude
+            continue
+
+        name = snapshot.location_name.strip()
+        country = snapshot.country.strip()
+        candidates = [slugify(name) or 'location', slugify(f"{name}-{country}")]
+        slug = next((candidate for candidate in candidates if candidate not in used_slugs), None)
+        if slug is None:
+            suffix = 2
+            while f"{candidates[-1]}-{suffix}" in used_slugs:
+                suffix += 1
+            slug = f"{candidates[-1]}-{suffix}"
+        used_slugs.add(slug)
+
+        locations[key] = Location(
+            key=key,
+            name=name,
+            country=country,
+            slug=slug,
+            latitude=snapshot.latitude,
+            longitude=snapshot.longitude,
+        )
+
+    Location.objects.bulk_create(locations.values(), batch_size=500)
+
+    for location in Location.objects.all().iterator(chunk_size=500):
+        ids = snapshot_ids.get(location.key, [])
+        for start in range(0, len(ids), 500):
+            ReportSnapshot.objects.filter(id__in=ids[start:start + 500]).update(location=location)
+        LocationSummary.objects.filter(location_key=location.key).update(
+            location=location, slug=location.slug
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('archive', '0003_location'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_locations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:31
+
+from django.db import OperationalError, migrations, models
+
+# Frozen copy of archive.search as of this migration, so later changes to that
+# module cannot change what this migration does.
+FTS_TABLE = 'archive_reportsnapshot_fts'
+SEARCH_COLUMNS = ('location_name', 'country')
+
+SQLITE_FTS_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        location_name, country,
+        content='archive_reportsnapshot', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON archive_reportsnapshot BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, location_name, country)
+        VALUES (new.id, new.location_name, new.country);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON archive_reportsnapshot BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, location_name, country)
+        VALUES ('delete', old.id, old.location_name, old.country);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF location_name, country ON archive_reportsnapshot BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, location_name, country)
+        VALUES ('delete', old.id, old.location_name, old.country);
+        INSERT INTO {FTS_TABLE}(rowid, location_name, country)
+        VALUES (new.id, new.location_name, new.country);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_DROP_FTS_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+POSTGRES_TRGM_SQL = ["CREATE EXTENSION IF NOT EXISTS pg_trgm"] + [
+    f"""CREATE INDEX IF NOT EXISTS snapshot_{column}_trgm_idx
+        ON archive_reportsnapshot USING gin ((UPPER({column}::text)) gin_trgm_ops)"""
+    for column in SEARCH_COLUMNS
+]
+
+POSTGRES_DROP_TRGM_SQL = [
+    f"DROP INDEX IF EXISTS snapshot_{column}_trgm_idx" for column in SEARCH_COLUMNS
+]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            schema_editor.execute(SQLITE_FTS_SQL[0])
+        except OperationalError:
+            # SQLite builds without FTS5 or the trigram tokenizer (< 3.34) keep the icontains scan.
+            return
+        statements = SQLITE_FTS_SQL[1:]
+    elif vendor == 'postgresql':
+        statements = POSTGRES_TRGM_SQL
+    else:
+        return
+
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_DROP_FTS_SQL, 'postgresql': POSTGRES_DROP_TRGM_SQL}
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('archive', '0004_backfill_locations'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reportsnapshot',
+            index=models.Index(fields=['-timestamp', '-id'], name='snapshot_time_id_idx'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,93 @@
+import html
+import re
+from django.db import migrations, models
+import archive.fields
+
+SECTIONS = (
+    ('assessment', 'Risk Assessment'),
+    ('sdg_15_compliance', 'SDG 15 Compliance Analysis'),
+    ('recommendations', 'Recommendations'),
+)
+
+
+def _text(fragment):
+    return html.unescape(re.sub(r'<[^>]+>', '', fragment)).strip()
+
+
+def parse_analysis_html(markup):
+    # Snapshots used to store the analysis pre-rendered by build_analysis_text.
+    header = re.search(r'<h3[^>]*>(.*?)</h3>\s*<p[^>]*>(.*?)</p>\s*<p[^>]*>(.*?)</p>', markup, re.S)
+    analysis = {
+        'title': _text(header.group(1)) if header else '',
+        'timestamp': _text(header.group(2)) if header else '',
+        'subject': _text(header.group(3)) if header else '',
+    }
+    for field, heading in SECTIONS:
+        match = re.search(rf'<h4[^>]*>\s*{re.escape(heading)}\s*</h4>\s*<p[^>]*>(.*?)</p>', markup, re.S)
+        analysis[field] = _text(match.group(1)) if match else ''
+    if not any(analysis.values()):
+        # Not in the expected layout: keep whatever text there was.
+        analysis['assessment'] = _text(markup)
+    return analysis
+
+
+def render_analysis_html(analysis):
+    sections = ''.join(
+        f'<div><h4 class="font-bold text-lg text-navy mb-2">{heading}</h4>'
+        f'<p class="text-gray-700 leading-relaxed">{html.escape(analysis.get(field, ""))}</p></div>'
+        for field, heading in SECTIONS
+    )
+    return (
+        '<div class="space-y-6"><div>'
+        f'<h3 class="text-2xl font-bold text-navy mb-4">{html.escape(analysis.get("title", ""))}</h3>'
+        f'<p class="text-sm text-gray-600 mb-2">{html.escape(analysis.get("timestamp", ""))}</p>'
+        f'<p class="text-md font-semibold text-gray-800 mb-4">{html.escape(analysis.get("subject", ""))}</p>'
+        f'</div>{sections}</div>'
+    )
+
+
+def convert_snapshots(apps, source, target, convert):
+    ReportSnapshot = apps.get_model('archive', 'ReportSnapshot')
+    batch = []
+    for snapshot in ReportSnapshot.objects.only('id', source).iterator(chunk_size=2000):
+        setattr(snapshot, target, convert(getattr(snapshot, source) or ({} if source == 'analysis' else '')))
+        batch.append(snapshot)
+        if len(batch) == 500:
+            ReportSnapshot.objects.bulk_update(batch, [target])
+            batch = []
+    if batch:
+        ReportSnapshot.objects.bulk_update(batch, [target])
+
+
+def html_to_fields(apps, schema_editor):
+    convert_snapshots(apps, 'ai_analysis_text', 'analysis', parse_analysis_html)
+
+
+def fields_to_html(apps, schema_editor):
+    convert_snapshots(apps, 'analysis', 'ai_analysis_text', render_analysis_html)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('archive', '0005_archive_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportsnapshot',
+            name='analysis',
+            field=archive.fields.CompressedJSONField(default=dict),
+        ),
+        # A default lets rolling back re-add the column before refilling it.
+        migrations.AlterField(
+            model_name='reportsnapshot',
+            name='ai_analysis_text',
+            field=models.TextField(default=''),
+        ),
+        migrations.RunPython(html_to_fields, fields_to_html),
+        migrations.RemoveField(
+            model_name='reportsnapshot',
+            name='ai_analysis_text',
+        ),
+    ]
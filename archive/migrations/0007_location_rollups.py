@@ -0,0 +1,86 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:02
+
+from datetime import datetime
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast, Floor, TruncDate, TruncWeek
+from django.db.models.lookups import Regex
+
+# Frozen copy of archive.rollups as of this migration.
+DIMENSIONS = ('flood', 'air', 'land_health')
+TRUNCATE = {'day': TruncDate, 'week': TruncWeek}
+NUMERIC_SCORE = r'^[0-9]+(\.[0-9]+)?$'
+
+
+def score(dimension):
+    # A missing or non-numeric score counts as 0 rather than failing the cast.
+    value = KT(f'risk_scores__{dimension}')
+    number = Cast(Floor(Cast(value, models.FloatField())), models.IntegerField())
+    return models.Case(
+        models.When(Regex(value, NUMERIC_SCORE), then=number),
+        default=models.Value(0),
+        output_field=models.IntegerField(),
+    )
+
+
+def backfill_rollups(apps, schema_editor):
+    ReportSnapshot = apps.get_model('archive', 'ReportSnapshot')
+    LocationRollup = apps.get_model('archive', 'LocationRollup')
+
+    aggregates = {'report_count': models.Count('id')}
+    for dimension in DIMENSIONS:
+        aggregates[f'{dimension}_min'] = models.Min(score(dimension))
+        aggregates[f'{dimension}_max'] = models.Max(score(dimension))
+        aggregates[f'{dimension}_sum'] = models.Sum(score(dimension))
+
+    for period, truncate in TRUNCATE.items():
+        rows = (
+            ReportSnapshot.objects.exclude(location=None).order_by()
+            .annotate(bucket=truncate('timestamp'))
+            .values('location_id', 'bucket')
+            .annotate(**aggregates)
+        )
+        batch = []
+        for row in rows.iterator(chunk_size=2000):
+            bucket = row.pop('bucket')
+            row['period_start'] = bucket.date() if isinstance(bucket, datetime) else bucket
+            batch.append(LocationRollup(period=period, **row))
+            if len(batch) == 1000:
+                LocationRollup.objects.bulk_create(batch)
+                batch = []
+        LocationRollup.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('archive', '0006_snapshot_analysis_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day'), ('week', 'Week')], max_length=4)),
+                ('period_start', models.DateField()),
+                ('report_count', models.PositiveIntegerField(default=0)),
+                ('flood_min', models.PositiveSmallIntegerField(default=0)),
+                ('flood_max', models.PositiveSmallIntegerField(default=0)),
+                ('flood_sum', models.PositiveIntegerField(default=0)),
+                ('air_min', models.PositiveSmallIntegerField(default=0)),
+                ('air_max', models.PositiveSmallIntegerField(default=0)),
+                ('air_sum', models.PositiveIntegerField(default=0)),
+                ('land_health_min', models.PositiveSmallIntegerField(default=0)),
+                ('land_health_max', models.PositiveSmallIntegerField(default=0)),
+                ('land_health_sum', models.PositiveIntegerField(default=0)),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='archive.location')),
+            ],
+            options={
+                'ordering': ['period_start'],
+                'constraints': [models.UniqueConstraint(fields=('location', 'period', 'period_start'), name='unique_location_rollup')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:15
+
+from django.db import migrations, models
+
+# Frozen copy of core.geo.geohash_encode as of this migration.
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash_encode(lat, lon, precision=9):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        target, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (target[0] + target[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            target[0] = mid
+        else:
+            bits = bits << 1
+            target[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def backfill_geohashes(apps, schema_editor):
+    ReportSnapshot = apps.get_model('archive', 'ReportSnapshot')
+    batch = []
+    for snapshot in ReportSnapshot.objects.only('id', 'latitude', 'longitude').iterator(chunk_size=2000):
+        snapshot.geohash = geohash_encode(snapshot.latitude, snapshot.longitude)
+        batch.append(snapshot)
+        if len(batch) == 500:
+            ReportSnapshot.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    if batch:
+        ReportSnapshot.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('archive', '0007_location_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportsnapshot',
+            name='geohash',
+            field=models.CharField(blank=True, default='', max_length=12),
+        ),
+        migrations.RunPython(backfill_geohashes, migrations.RunPython.noop),
+        # Built after the backfill so the rows are indexed once.
+        migrations.AddIndex(
+            model_name='reportsnapshot',
+            index=models.Index(fields=['geohash', 'timestamp'], name='snapshot_geohash_time_idx'),
+        ),
+    ]
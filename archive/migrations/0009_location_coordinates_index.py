@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 01:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('archive', '0008_snapshot_geohash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['latitude', 'longitude'], name='location_lat_lon_idx'),
+        ),
+    ]
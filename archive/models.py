@@ -1,25 +1,113 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models.functions import Greatest, Least
 from django.utils.text import slugify
+from archive.fields import CompressedJSONField
+from archive.rollups import DIMENSIONS, PERIODS, period_bounds, period_start, rollup_rows, score_value
+from core.geo import geohash_encode
+
+# About 5 m cells; radius queries search by prefix (archive.nearby).
+GEOHASH_PRECISION = 9
+
+
+def location_key(location_name, country):
+    return f"{location_name.strip().lower()}|{country.strip().lower()}"
+
+
+class Location(models.Model):
+    key = models.CharField(max_length=360, unique=True)
+    name = models.CharField(max_length=255)
+    country = models.CharField(max_length=100)
+    slug = models.SlugField(max_length=255, unique=True)
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def unique_slug(cls, name, country):
+        candidates = [slugify(name) or 'location', slugify(f"{name}-{country}")]
+        for candidate in candidates:
+            if not cls.objects.filter(slug=candidate).exists():
+                return candidate
+
+        suffix = 2
+        while cls.objects.filter(slug=f"{candidates[-1]}-{suffix}").exists():
+            suffix += 1
+        return f"{candidates[-1]}-{suffix}"
+
+    @classmethod
+    def resolve(cls, name, country, latitude=None, longitude=None):
+        key = location_key(name, country)
+        location = cls.objects.filter(key=key).first()
+        if location is not None:
+            return location
+
+        try:
+            with transaction.atomic():
+                return cls.objects.create(
+                    key=key,
+                    name=name.strip(),
+                    country=country.strip(),
+                    slug=cls.unique_slug(name, country),
+                    latitude=latitude,
+                    longitude=longitude,
+                )
+        except IntegrityError:
+            # Another request created the same location first.
+            return cls.objects.get(key=key)
+
+    def __str__(self):
+        return f"{self.name}, {self.country}"
+
+    class Meta:
+        ordering = ['name']
+        indexes = [
+            # Map tiles select locations by bounding box (archive.clustering).
+            models.Index(fields=['latitude', 'longitude'], name='location_lat_lon_idx'),
+        ]
+
 
 class ReportSnapshot(models.Model):
+    # Columns list views leave unloaded: only the snapshot page reads them.
+    DETAIL_FIELDS = ('analysis', 'raw_data')
+
+    location = models.ForeignKey(
+        Location, null=True, blank=True, on_delete=models.PROTECT, related_name='snapshots'
+    )
     location_name = models.CharField(max_length=255)
     country = models.CharField(max_length=100)
     latitude = models.FloatField()
     longitude = models.FloatField()
+    # Derived from latitude and longitude on save; bulk_create callers set it themselves.
+    geohash = models.CharField(max_length=12, blank=True, default='')
 
     risk_scores = models.JSONField()
-    ai_analysis_text = models.TextField()
+    # title, timestamp, subject, assessment, sdg_15_compliance and
+    # recommendations, rendered by the snapshot template.
+    analysis = CompressedJSONField(default=dict)
     raw_data = models.JSONField()
 
     timestamp = models.DateTimeField(auto_now_add=True)
     slug = models.SlugField(max_length=255, unique=True, blank=True)
 
+    @classmethod
+    def unique_slug(cls, location_name, timestamp, taken=()):
+        base_slug = slugify(f"{location_name}-{timestamp.strftime('%Y-%m-%d-%H%M')}")
+        slug = base_slug
+        suffix = 2
+        # Several reports for one place can land in the same minute.
+        while slug in taken or cls.objects.filter(slug=slug).exists():
+            slug = f"{base_slug}-{suffix}"
+            suffix += 1
+        return slug
+
     def save(self, *args, **kwargs):
         if not self.slug:
             from django.utils import timezone
-            timestamp_str = timezone.now().strftime('%Y-%m-%d-%H%M')
-            base_slug = slugify(f"{self.location_name}-{timestamp_str}")
-            self.slug = base_slug
+            self.slug = self.unique_slug(self.location_name, timezone.now())
+        self.geohash = geohash_encode(self.latitude, self.longitude, GEOHASH_PRECISION)
+        if self.location_id is None:
+            self.location = Location.resolve(self.location_name, self.country, self.latitude, self.longitude)
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -27,3 +115,154 @@ class ReportSnapshot(models.Model):
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['location', '-timestamp'], name='snapshot_location_time_idx'),
+            models.Index(fields=['-timestamp', '-id'], name='snapshot_time_id_idx'),
+            models.Index(fields=['geohash', 'timestamp'], name='snapshot_geohash_time_idx'),
+        ]
+
+
+class LocationSummary(models.Model):
+    location = models.OneToOneField(
+        Location, null=True, blank=True, on_delete=models.CASCADE, related_name='summary'
+    )
+    location_key = models.CharField(max_length=360, unique=True)
+    location_name = models.CharField(max_length=255)
+    country = models.CharField(max_length=100)
+    slug = models.SlugField(max_length=255)
+
+    latest_snapshot = models.ForeignKey(
+        ReportSnapshot, null=True, blank=True, on_delete=models.SET_NULL, related_name='+'
+    )
+    latest_timestamp = models.DateTimeField(db_index=True)
+    risk_scores = models.JSONField()
+    report_count = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def record_snapshot(cls, snapshot):
+        location = snapshot.location
+        with transaction.atomic():
+            summary, created = cls.objects.select_for_update().get_or_create(
+                location_key=location.key,
+                defaults={
+                    'location': location,
+                    'location_name': snapshot.location_name,
+                    'country': snapshot.country,
+                    'slug': location.slug,
+                    'latest_snapshot': snapshot,
+                    'latest_timestamp': snapshot.timestamp,
+                    'risk_scores': snapshot.risk_scores,
+                    'report_count': 1,
+                }
+            )
+            if created:
+                return summary
+
+            summary.report_count = models.F('report_count') + 1
+            if snapshot.timestamp >= summary.latest_timestamp:
+                summary.location_name = snapshot.location_name
+                summary.country = snapshot.country
+                summary.latest_snapshot = snapshot
+                summary.latest_timestamp = snapshot.timestamp
+                summary.risk_scores = snapshot.risk_scores
+            summary.save()
+        return summary
+
+    @classmethod
+    def rebuild(cls, location):
+        snapshots = location.snapshots.all()
+        latest = snapshots.first()
+
+        if latest is None:
+            cls.objects.filter(location_key=location.key).delete()
+            return None
+
+        summary, _ = cls.objects.update_or_create(
+            location_key=location.key,
+            defaults={
+                'location': location,
+                'location_name': latest.location_name,
+                'country': latest.country,
+                'slug': location.slug,
+                'latest_snapshot': latest,
+                'latest_timestamp': latest.timestamp,
+                'risk_scores': latest.risk_scores,
+                'report_count': snapshots.count(),
+            }
+        )
+        return summary
+
+    def __str__(self):
+        return f"{self.location_name}, {self.country} ({self.report_count} reports)"
+
+    class Meta:
+        ordering = ['-latest_timestamp']
+        verbose_name_plural = 'location summaries'
+
+
+class LocationRollup(models.Model):
+    """
+    Daily and weekly aggregates of a location's risk scores, kept up to date as
+    snapshots are saved so trend charts never read the snapshots themselves.
+    """
+
+    PERIOD_CHOICES = [('day', 'Day'), ('week', 'Week')]
+
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='rollups')
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    report_count = models.PositiveIntegerField(default=0)
+
+    flood_min = models.PositiveSmallIntegerField(default=0)
+    flood_max = models.PositiveSmallIntegerField(default=0)
+    flood_sum = models.PositiveIntegerField(default=0)
+    air_min = models.PositiveSmallIntegerField(default=0)
+    air_max = models.PositiveSmallIntegerField(default=0)
+    air_sum = models.PositiveIntegerField(default=0)
+    land_health_min = models.PositiveSmallIntegerField(default=0)
+    land_health_max = models.PositiveSmallIntegerField(default=0)
+    land_health_sum = models.PositiveIntegerField(default=0)
+
+    @classmethod
+    def record_snapshot(cls, snapshot):
+        scores = {dimension: score_value(snapshot.risk_scores.get(dimension)) for dimension in DIMENSIONS}
+        with transaction.atomic():
+            for period in PERIODS:
+                defaults = {'report_count': 1}
+                for dimension, value in scores.items():
+                    defaults.update({f'{dimension}_min': value, f'{dimension}_max': value, f'{dimension}_sum': value})
+                rollup, created = cls.objects.select_for_update().get_or_create(
+                    location=snapshot.location,
+                    period=period,
+                    period_start=period_start(snapshot.timestamp, period),
+                    defaults=defaults,
+                )
+                if created:
+                    continue
+
+                updates = {'report_count': models.F('report_count') + 1}
+                for dimension, value in scores.items():
+                    updates[f'{dimension}_min'] = Least(f'{dimension}_min', models.Value(value))
+                    updates[f'{dimension}_max'] = Greatest(f'{dimension}_max', models.Value(value))
+                    updates[f'{dimension}_sum'] = models.F(f'{dimension}_sum') + value
+                cls.objects.filter(pk=rollup.pk).update(**updates)
+
+    @classmethod
+    def rebuild_periods(cls, location, timestamp):
+        # Re-aggregate the day and week containing `timestamp`, e.g. after a snapshot is deleted.
+        with transaction.atomic():
+            for period in PERIODS:
+                start = period_start(timestamp, period)
+                cls.objects.filter(location=location, period=period, period_start=start).delete()
+                since, until = period_bounds(start, period)
+                snapshots = location.snapshots.filter(timestamp__gte=since, timestamp__lt=until)
+                cls.objects.bulk_create(cls(**row) for row in rollup_rows(snapshots, period))
+
+    def __str__(self):
+        return f"{self.location} {self.period} of {self.period_start} ({self.report_count} reports)"
+
+    class Meta:
+        ordering = ['period_start']
+        constraints = [
+            models.UniqueConstraint(fields=['location', 'period', 'period_start'], name='unique_location_rollup'),
+        ]
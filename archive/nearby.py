@@ -0,0 +1,57 @@
+import math
+from django.db.models import Q
+from archive.models import ReportSnapshot
+from core.geo import geohash_cover, geohash_prefix_end, haversine_km
+
+NEARBY_DEFAULT_RADIUS_KM = 5
+NEARBY_MAX_RADIUS_KM = 100
+NEARBY_DEFAULT_LIMIT = 20
+NEARBY_MAX_LIMIT = 100
+
+
+def parse_point(params) -> tuple:
+    """lat and lon from request GET parameters. Raises ValueError with a message fit for the caller."""
+    try:
+        lat, lon = float(params.get('lat', '')), float(params.get('lon', ''))
+    except ValueError:
+        raise ValueError('lat and lon must be numbers')
+    if not (math.isfinite(lat) and math.isfinite(lon)) or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError('lat must be within [-90, 90] and lon within [-180, 180]')
+    return lat, lon
+
+def geohash_filter(lat: float, lon: float, radius_km: float) -> Q:
+    # Prefix matches written as ranges, which a plain B-tree index serves on SQLite and PostgreSQL alike.
+    match = Q()
+    for cell in geohash_cover(lat, lon, radius_km):
+        end = geohash_prefix_end(cell)
+        match |= Q(geohash__gte=cell, geohash__lt=end) if end else Q(geohash__gte=cell)
+    return match
+
+def snapshots_near(lat: float, lon: float, radius_km: float, since=None, limit=NEARBY_DEFAULT_LIMIT, snapshots=None) -> list:
+    """
+    (distance_km, snapshot) pairs for the snapshots within radius_km of
+    (lat, lon), nearest first and newest first among equals. `since` keeps
+    only snapshots saved from then on; `snapshots` is the queryset to search,
+    by default every snapshot without its detail fields.
+    """
+    if snapshots is None:
+        snapshots = ReportSnapshot.objects.defer(*ReportSnapshot.DETAIL_FIELDS)
+    candidates = snapshots.filter(geohash_filter(lat, lon, radius_km))
+    if since is not None:
+        candidates = candidates.filter(timestamp__gte=since)
+
+    # Distances are measured on narrow rows, unordered so the default ordering cannot
+    # steer the planner off the geohash index; only the nearest rows are loaded whole.
+    rows = candidates.order_by().values_list('pk', 'latitude', 'longitude', 'timestamp')
+    found = []
+    for pk, latitude, longitude, timestamp in rows:
+        # The cells cover a square around the circle; the corners are dropped here.
+        distance = haversine_km(lat, lon, latitude, longitude)
+        if distance <= radius_km:
+            found.append((distance, timestamp, pk))
+    found.sort(key=lambda row: row[1], reverse=True)
+    found.sort(key=lambda row: row[0])
+    found = found[:limit]
+
+    loaded = snapshots.in_bulk([pk for _, _, pk in found])
+    return [(distance, loaded[pk]) for distance, _, pk in found if pk in loaded]
@@ -0,0 +1,86 @@
+import hashlib
+import time
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from core.cache import cache_get_or_compute
+
+PAGE_CACHE = 'pages'
+# Everything listing snapshots across locations: the hub list and the archive.
+ARCHIVE_SCOPE = 'archive'
+
+
+def location_scope(location_id) -> str:
+    return f"location_{location_id}"
+
+def _version_key(scope: str) -> str:
+    return f"page_version_{scope}"
+
+def _snapshot_key(slug: str) -> str:
+    return f"page_snapshot_{slug}"
+
+def bump_versions(*scopes) -> None:
+    # A version is the Unix time of the last change, so it doubles as Last-Modified.
+    now = time.time()
+    caches[PAGE_CACHE].set_many({_version_key(scope): now for scope in scopes}, None)
+
+def page_version(scope: str) -> float:
+    """The current version of `scope`, read from the shared table so every worker agrees on it."""
+    cache = caches[PAGE_CACHE]
+    key = _version_key(scope)
+    version = cache.get_shared(key)
+    if version is None:
+        # Never set, or culled: start a new version, which nothing is cached under yet.
+        cache.add(key, time.time(), None)
+        version = cache.get_shared(key, time.time())
+    return version
+
+def forget_snapshot(slug: str) -> None:
+    caches[PAGE_CACHE].delete(_snapshot_key(slug))
+
+def cached_snapshot_page(slug: str, build):
+    """
+    The rendered page entry for a snapshot, built once by `build()` (which
+    returns a dict, or None when there is no such snapshot) and then kept
+    until the snapshot is saved again or deleted.
+    """
+    cache = caches[PAGE_CACHE]
+    key = _snapshot_key(slug)
+    page = cache.get_shared(key)
+    if page is None:
+        page = build()
+        if page is not None:
+            cache.set(key, page, None)
+    return page
+
+def cached_fragment(name: str, versions: list, build, vary_on=()) -> str:
+    """
+    HTML rendered by `build()`, cached under the given scope versions (and any
+    `vary_on` values such as filters), so it is rebuilt only after a change.
+    Concurrent misses render once; `build()` may return None, which is not cached.
+    """
+    parts = [name, *(repr(version) for version in versions)]
+    if vary_on:
+        parts.append(hashlib.md5(repr(tuple(vary_on)).encode()).hexdigest())
+    key = 'page_' + '_'.join(parts)
+
+    cache = caches[PAGE_CACHE]
+    return cache_get_or_compute(key, build, cache.default_timeout, cache=cache)
+
+def conditional_page(request, tag: str, version: float, render_page):
+    """
+    Answer a conditional GET for a page last changed at Unix time `version`
+    with a 304, or call `render_page()` and add ETag and Last-Modified so the
+    browser can revalidate next time. Pages embed the visitor's CSRF token,
+    so they may only be kept by the browser.
+    """
+    etag = quote_etag(f"{tag}-{caches[PAGE_CACHE].version}-{version!r}")
+    last_modified = int(version)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = render_page()
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,53 @@
+import base64
+from datetime import datetime
+from django.db.models import Q
+
+
+def encode_cursor(snapshot):
+    raw = f"{snapshot.timestamp.isoformat()}|{snapshot.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(value):
+    if not value:
+        return None
+    try:
+        padded = value + '=' * (-len(value) % 4)
+        timestamp, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|', 1)
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def keyset_page(queryset, after=None, before=None, per_page=12):
+    """
+    Return one page of queryset ordered newest first on (timestamp, id).
+
+    Pages are addressed by the (timestamp, id) of their edge rows rather than
+    an offset, so every page is an index range read regardless of depth and
+    no COUNT(*) is needed.
+    """
+    after = decode_cursor(after)
+    before = decode_cursor(before)
+
+    if before:
+        timestamp, pk = before
+        rows = list(
+            queryset.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, pk__gt=pk))
+            .order_by('timestamp', 'pk')[:per_page + 1]
+        )
+        has_previous = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        has_next = True
+    else:
+        if after:
+            timestamp, pk = after
+            queryset = queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, pk__lt=pk))
+        rows = list(queryset.order_by('-timestamp', '-pk')[:per_page + 1])
+        has_next = len(rows) > per_page
+        items = rows[:per_page]
+        has_previous = after is not None
+
+    return {
+        'items': items,
+        'next_cursor': encode_cursor(items[-1]) if items and has_next else None,
+        'previous_cursor': encode_cursor(items[0]) if items and has_previous else None,
+    }
@@ -0,0 +1,110 @@
+import math
+from datetime import date, datetime, time, timedelta
+from django.db.models import Case, Count, FloatField, IntegerField, Max, Min, Sum, Value, When
+from django.db.models.fields.json import KT
+from django.db.models.functions import Cast, Floor, TruncDate, TruncWeek
+from django.db.models.lookups import Regex
+from django.utils import timezone
+
+PERIODS = ('day', 'week')
+DIMENSIONS = ('flood', 'air', 'land_health')
+TRUNCATE = {'day': TruncDate, 'week': TruncWeek}
+# Scores that may be cast to a count; anything else in the JSON (text, negative
+# numbers, null) counts as 0 rather than failing the cast.
+NUMERIC_SCORE = r'^[0-9]+(\.[0-9]+)?$'
+
+
+def period_start(timestamp, period: str) -> date:
+    # Buckets follow the site's local calendar; weeks start on Monday.
+    day = timezone.localtime(timestamp).date()
+    if period == 'week':
+        day -= timedelta(days=day.weekday())
+    return day
+
+def period_bounds(start: date, period: str) -> tuple:
+    end = start + timedelta(days=7 if period == 'week' else 1)
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.combine(start, time.min), tz),
+        timezone.make_aware(datetime.combine(end, time.min), tz),
+    )
+
+def score(dimension: str):
+    # Risk scores live in a JSON column; a missing or non-numeric score counts as 0.
+    value = KT(f'risk_scores__{dimension}')
+    return Case(
+        When(Regex(value, NUMERIC_SCORE), then=Cast(Floor(Cast(value, FloatField())), IntegerField())),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+def score_value(value) -> int:
+    # score() for a single snapshot's value, in Python.
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return 0
+    return math.floor(number) if math.isfinite(number) and number >= 0 else 0
+
+def rollup_rows(snapshots, period: str):
+    """
+    Aggregate a ReportSnapshot queryset into one row per location and period,
+    in the database: location_id, period_start, report_count and the min, max
+    and sum of each risk dimension.
+    """
+    aggregates = {'report_count': Count('id')}
+    for dimension in DIMENSIONS:
+        aggregates[f'{dimension}_min'] = Min(score(dimension))
+        aggregates[f'{dimension}_max'] = Max(score(dimension))
+        aggregates[f'{dimension}_sum'] = Sum(score(dimension))
+
+    rows = (
+        snapshots.order_by()
+        .annotate(bucket=TRUNCATE[period]('timestamp'))
+        .values('location_id', 'bucket')
+        .annotate(**aggregates)
+    )
+    for row in rows:
+        bucket = row.pop('bucket')
+        # TruncWeek yields a datetime; both periods are stored as dates.
+        row['period_start'] = bucket.date() if isinstance(bucket, datetime) else bucket
+        row['period'] = period
+        yield row
+
+def rebuild_rollups(rollup_model, snapshots, chunk_size: int = 1000) -> int:
+    """Replace the rollups of every location in `snapshots` with freshly aggregated ones."""
+    location_ids = snapshots.exclude(location=None).values('location_id').distinct()
+    rollup_model.objects.filter(location_id__in=location_ids).delete()
+
+    created = 0
+    for period in PERIODS:
+        batch = []
+        for row in rollup_rows(snapshots.exclude(location=None), period):
+            batch.append(rollup_model(**row))
+            if len(batch) >= chunk_size:
+                rollup_model.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        rollup_model.objects.bulk_create(batch)
+        created += len(batch)
+    return created
+
+def downsample(rollups: list, points: int) -> list:
+    """
+    Merge runs of adjacent rollups so at most `points` remain. Each merged point
+    keeps the overall min and max and the report-weighted mean of its run.
+    """
+    size = max(1, -(-len(rollups) // max(1, points)))
+    merged = []
+    for start in range(0, len(rollups), size):
+        run = rollups[start:start + size]
+        count = sum(rollup.report_count for rollup in run)
+        point = {'start': run[0].period_start.isoformat(), 'reports': count}
+        for dimension in DIMENSIONS:
+            point[dimension] = {
+                'min': min(getattr(rollup, f'{dimension}_min') for rollup in run),
+                'max': max(getattr(rollup, f'{dimension}_max') for rollup in run),
+                'mean': round(sum(getattr(rollup, f'{dimension}_sum') for rollup in run) / count, 2) if count else None,
+            }
+        merged.append(point)
+    return merged
@@ -0,0 +1,68 @@
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'archive_reportsnapshot_fts'
+SEARCH_COLUMNS = ('location_name', 'country')
+
+# FTS5's trigram tokenizer matches any substring of three or more characters,
+# which keeps the semantics of the icontains filters it replaces. The table and
+# PostgreSQL's trigram indexes are created by migration 0005; the triggers are
+# restored after every migrate by ensure_sqlite_triggers().
+SQLITE_FTS_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        location_name, country,
+        content='archive_reportsnapshot', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON archive_reportsnapshot BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, location_name, country)
+        VALUES (new.id, new.location_name, new.country);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON archive_reportsnapshot BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, location_name, country)
+        VALUES ('delete', old.id, old.location_name, old.country);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF location_name, country ON archive_reportsnapshot BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, location_name, country)
+        VALUES ('delete', old.id, old.location_name, old.country);
+        INSERT INTO {FTS_TABLE}(rowid, location_name, country)
+        VALUES (new.id, new.location_name, new.country);
+    END""",
+]
+
+def ensure_sqlite_triggers(using='default'):
+    # Django rebuilds SQLite tables for some schema changes, which drops their
+    # triggers; recreate them (idempotently) after every migrate.
+    from django.db import connections
+    conn = connections[using]
+    if conn.vendor != 'sqlite' or FTS_TABLE not in conn.introspection.table_names():
+        return
+    with conn.cursor() as cursor:
+        for statement in SQLITE_FTS_SQL[1:]:
+            cursor.execute(statement)
+
+_fts_ready = False
+
+def _fts_available():
+    global _fts_ready
+    if not _fts_ready:
+        _fts_ready = connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+    return _fts_ready
+
+def _fts_phrase(term):
+    return '"' + term.replace('"', '""') + '"'
+
+def filter_snapshots(queryset, location='', country=''):
+    terms = {column: term.strip() for column, term in zip(SEARCH_COLUMNS, (location, country)) if term.strip()}
+    if not terms:
+        return queryset
+
+    if _fts_available() and all(len(term) >= 3 for term in terms.values()):
+        query = ' AND '.join(f"{column} : {_fts_phrase(term)}" for column, term in terms.items())
+        return queryset.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [query])
+        )
+
+    # PostgreSQL serves these from the trigram indexes; other cases fall back to a scan.
+    for column, term in terms.items():
+        queryset = queryset.filter(**{f"{column}__icontains": term})
+    return queryset
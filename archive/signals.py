@@ -0,0 +1,43 @@
+from django.db.models.signals import post_save, post_delete, post_migrate
+from django.dispatch import receiver
+from archive.models import Location, ReportSnapshot, LocationSummary, LocationRollup
+from archive.page_cache import ARCHIVE_SCOPE, bump_versions, forget_snapshot, location_scope
+from archive.search import ensure_sqlite_triggers
+
+
+@receiver(post_save, sender=ReportSnapshot)
+def update_location_summary(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        LocationSummary.record_snapshot(instance)
+        LocationRollup.record_snapshot(instance)
+
+
+@receiver(post_delete, sender=ReportSnapshot)
+def rebuild_location_summary(sender, instance, **kwargs):
+    if instance.location_id is not None:
+        LocationSummary.rebuild(instance.location)
+        LocationRollup.rebuild_periods(instance.location, instance.timestamp)
+
+
+@receiver(post_save, sender=ReportSnapshot)
+@receiver(post_delete, sender=ReportSnapshot)
+def invalidate_snapshot_pages(sender, instance, created=False, **kwargs):
+    # A new snapshot has no cached page yet; an edited or deleted one must not be served again.
+    if not created:
+        forget_snapshot(instance.slug)
+    scopes = [ARCHIVE_SCOPE]
+    if instance.location_id is not None:
+        scopes.append(location_scope(instance.location_id))
+    bump_versions(*scopes)
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+def invalidate_location_pages(sender, instance, **kwargs):
+    bump_versions(ARCHIVE_SCOPE, location_scope(instance.id))
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using='default', **kwargs):
+    if sender.name == 'archive':
+        ensure_sqlite_triggers(using)
@@ -1,3 +1,489 @@
-from django.test import TestCase
+import csv
+import importlib
+import io
+import json
+import random
+from datetime import date, datetime, timedelta, timezone
+from unittest import mock
+from django.apps import apps
+from django.core import serializers
+from django.core.cache import cache, caches
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.utils.text import slugify
+from archive.clustering import build_tile_features, tiles_for_bbox
+from archive.fields import COMPRESSED, PLAIN, decode_json, encode_json
+from archive.export import ExportEncoder, export_queryset, iter_export, parse_export_filters
+from archive.models import Location, LocationRollup, LocationSummary, ReportSnapshot
+from archive.nearby import snapshots_near
+from archive.page_cache import ARCHIVE_SCOPE, PAGE_CACHE, page_version
+from archive.pagination import decode_cursor, encode_cursor, keyset_page
+from archive.rollups import downsample, rebuild_rollups, score_value
+from core.geo import haversine_km
 
-# Create your tests here.
+
+ROLLUP_FIELDS = ('period', 'period_start', 'report_count', 'flood_min', 'flood_max', 'flood_sum', 'land_health_sum')
+
+
+def make_snapshot(name='Kumasi', country='Ghana', latitude=6.69, longitude=-1.62, flood=4, air=3, land_health=6):
+    snapshot = ReportSnapshot(
+        location_name=name,
+        country=country,
+        latitude=latitude,
+        longitude=longitude,
+        risk_scores={'flood': flood, 'air': air, 'land_health': land_health},
+        analysis={'title': 'ANALYSIS'},
+        raw_data={'precipitation_forecast': 40, 'recent_rain': 1.2, 'elevation': 270, 'ndvi': 0.55},
+    )
+    snapshot.save()
+    return snapshot
+
+
+class ArchiveTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches[PAGE_CACHE].clear()
+
+
+class NearbyTests(ArchiveTestCase):
+    def test_matches_brute_force(self):
+        rng = random.Random(3)
+        points = []
+        for number in range(150):
+            # Clustered around Accra so every radius sees some reports.
+            lat, lon = 5.6 + rng.gauss(0, 0.3), -0.19 + rng.gauss(0, 0.3)
+            points.append((make_snapshot(f"Site {number}", latitude=lat, longitude=lon).pk, lat, lon))
+
+        for radius_km in (0.5, 5, 25, 100):
+            lat, lon = 5.6 + rng.gauss(0, 0.2), -0.19 + rng.gauss(0, 0.2)
+            expected = {pk for pk, a, b in points if haversine_km(lat, lon, a, b) <= radius_km}
+            found = snapshots_near(lat, lon, radius_km, limit=1000)
+            self.assertEqual({snapshot.pk for _, snapshot in found}, expected)
+            distances = [distance for distance, _ in found]
+            self.assertEqual(distances, sorted(distances))
+
+    def test_nearest_first_then_newest(self):
+        older = make_snapshot('Adum', latitude=6.691)
+        newer = make_snapshot('Adum', latitude=6.691)
+        nearest = make_snapshot('Kejetia', latitude=6.6901)
+
+        found = snapshots_near(6.69, -1.62, 1)
+
+        self.assertEqual([snapshot.pk for _, snapshot in found], [nearest.pk, newer.pk, older.pk])
+
+    def test_since_and_limit(self):
+        old = make_snapshot()
+        ReportSnapshot.objects.filter(pk=old.pk).update(timestamp=old.timestamp.replace(year=2020))
+        recent = make_snapshot()
+
+        self.assertEqual([s.pk for _, s in snapshots_near(6.69, -1.62, 1, since=recent.timestamp)], [recent.pk])
+        self.assertEqual(len(snapshots_near(6.69, -1.62, 1, limit=1)), 1)
+
+    def test_nearby_api(self):
+        snapshot = make_snapshot()
+        make_snapshot('Tamale', latitude=9.4, longitude=-0.85)
+
+        response = self.client.get('/archive/nearby.json', {'lat': 6.69, 'lon': -1.621, 'radius_km': 5})
+
+        self.assertEqual(response.status_code, 200)
+        reports = response.json()['reports']
+        self.assertEqual([report['url'] for report in reports], [f"/archive/{snapshot.slug}/"])
+        self.assertEqual(reports[0]['flood'], 4)
+        self.assertAlmostEqual(reports[0]['distance_km'], 0.11, places=2)
+
+    def test_nearby_api_rejects_bad_input(self):
+        for params in ({'lat': 'x', 'lon': 1}, {'lat': 91, 'lon': 1}, {'lat': 1, 'lon': 1, 'radius_km': 0},
+                       {'lat': 1, 'lon': 1, 'radius_km': 500}, {'lat': 1, 'lon': 1, 'limit': 'many'}):
+            self.assertEqual(self.client.get('/archive/nearby.json', params).status_code, 400, params)
+
+
+class LocationSummaryTests(ArchiveTestCase):
+    def test_tracks_count_and_latest_report(self):
+        make_snapshot(flood=2)
+        latest = make_snapshot(name='KUMASI ', flood=5)
+
+        summary = LocationSummary.objects.get()
+        self.assertEqual(summary.report_count, 2)
+        self.assertEqual(summary.latest_snapshot, latest)
+        self.assertEqual(summary.location_name, 'KUMASI ')
+        self.assertEqual(summary.risk_scores['flood'], 5)
+
+    def test_older_report_is_counted_without_replacing_latest(self):
+        latest = make_snapshot(flood=5)
+        # Imported history arrives through bulk_create, which skips the post_save signal.
+        older = ReportSnapshot(location=latest.location, location_name='Kumasi', country='Ghana', latitude=6.69,
+                               longitude=-1.62, risk_scores={'flood': 1}, raw_data={}, slug='kumasi-earlier')
+        ReportSnapshot.objects.bulk_create([older])
+        ReportSnapshot.objects.filter(pk=older.pk).update(timestamp=latest.timestamp - timedelta(days=3))
+        older.refresh_from_db()
+
+        LocationSummary.record_snapshot(older)
+
+        summary = LocationSummary.objects.get()
+        self.assertEqual(summary.report_count, 2)
+        self.assertEqual(summary.latest_snapshot, latest)
+        self.assertEqual(summary.risk_scores['flood'], 5)
+
+    def test_rebuilt_when_reports_are_deleted(self):
+        first = make_snapshot(flood=2)
+        make_snapshot(flood=5).delete()
+
+        summary = LocationSummary.objects.get()
+        self.assertEqual(summary.report_count, 1)
+        self.assertEqual(summary.latest_snapshot, first)
+        self.assertEqual(summary.risk_scores['flood'], 2)
+
+        first.delete()
+        self.assertFalse(LocationSummary.objects.exists())
+
+
+class LocationBackfillTests(ArchiveTestCase):
+    def legacy_snapshot(self, name, country, latitude, day):
+        # As saved before 0004: no location, which bulk_create leaves unset.
+        snapshot = ReportSnapshot(location_name=name, country=country, latitude=latitude, longitude=-1.62,
+                                  risk_scores={}, raw_data={}, slug=f"{slugify(name)}-{day}")
+        ReportSnapshot.objects.bulk_create([snapshot])
+        ReportSnapshot.objects.filter(pk=snapshot.pk).update(timestamp=datetime(2025, 1, day, tzinfo=timezone.utc))
+        return snapshot
+
+    def test_backfill_groups_reports_into_locations(self):
+        self.legacy_snapshot('Kumasi', 'USA', 40.0, 2)
+        self.legacy_snapshot('Kumasi', 'Ghana', 6.6, 1)
+        self.legacy_snapshot(' kumasi', 'GHANA ', 6.7, 3)
+        LocationSummary.objects.create(location_key='kumasi|ghana', location_name='Kumasi', country='Ghana',
+                                       slug='', latest_timestamp=datetime(2025, 1, 3, tzinfo=timezone.utc),
+                                       risk_scores={}, report_count=2)
+
+        migration = importlib.import_module('archive.migrations.0004_backfill_locations')
+        migration.backfill_locations(apps, None)
+
+        ghana, usa = Location.objects.get(key='kumasi|ghana'), Location.objects.get(key='kumasi|usa')
+        # The place reported first keeps the plain slug; coordinates come from the latest report.
+        self.assertEqual((ghana.slug, ghana.latitude), ('kumasi', 6.7))
+        self.assertEqual((usa.slug, usa.latitude), ('kumasi-usa', 40.0))
+        self.assertEqual(ghana.snapshots.count(), 2)
+        self.assertFalse(ReportSnapshot.objects.filter(location=None).exists())
+        self.assertEqual(LocationSummary.objects.values_list('location', 'slug').get(), (ghana.id, 'kumasi'))
+
+    def test_old_report_links_redirect_to_the_location_hub(self):
+        snapshot = make_snapshot()
+
+        response = self.client.get(f"/location/{snapshot.slug}/")
+
+        self.assertRedirects(response, f"/location/{snapshot.location.slug}/")
+        self.assertEqual(self.client.get('/location/nowhere/').status_code, 404)
+
+
+class CompressedJSONFieldTests(ArchiveTestCase):
+    analysis = {'title': 'ENVIRONMENTAL ANALYSIS', 'assessment': 'Flooding likely near the river. ' * 40,
+                'recommendations': 'Clear drains — déblayer les caniveaux.'}
+
+    def stored_bytes(self, snapshot):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT analysis FROM archive_reportsnapshot WHERE id = %s', [snapshot.id])
+            return bytes(cursor.fetchone()[0])
+
+    def test_encoding_compresses_only_when_smaller(self):
+        self.assertEqual(encode_json({'a': 1}), PLAIN + b'{"a":1}')
+        self.assertEqual(encode_json(self.analysis)[:1], COMPRESSED)
+        self.assertEqual(encode_json(self.analysis, compress=False)[:1], PLAIN)
+        for value in [{'a': 1}, self.analysis, [], 'text', None]:
+            self.assertEqual(decode_json(encode_json(value)), value)
+            self.assertEqual(decode_json(encode_json(value, compress=False)), value)
+
+    def test_snapshot_analysis_round_trips_through_the_database(self):
+        snapshot = make_snapshot()
+        snapshot.analysis = self.analysis
+        snapshot.save()
+
+        stored = self.stored_bytes(snapshot)
+        self.assertEqual(stored[:1], COMPRESSED)
+        self.assertLess(len(stored), len(json.dumps(self.analysis)) / 4)
+        self.assertEqual(ReportSnapshot.objects.get(pk=snapshot.pk).analysis, self.analysis)
+
+    def test_serializers_round_trip_the_value(self):
+        snapshot = make_snapshot()
+        snapshot.analysis = self.analysis
+        snapshot.save()
+
+        data = serializers.serialize('json', ReportSnapshot.objects.filter(pk=snapshot.pk))
+        self.assertEqual(json.loads(data)[0]['fields']['analysis'], self.analysis)
+        restored = next(serializers.deserialize('json', data)).object
+        self.assertEqual(restored.analysis, self.analysis)
+
+
+class AnalysisHtmlMigrationTests(SimpleTestCase):
+    # As build_analysis_text rendered it before 0006.
+    legacy_html = """
+        <div class="space-y-6">
+            <div>
+                <h3 class="text-2xl font-bold text-navy mb-4">ENVIRONMENTAL ANALYSIS</h3>
+                <p class="text-sm text-gray-600 mb-2">March 02, 2025 at 14:05 WAT</p>
+                <p class="text-md font-semibold text-gray-800 mb-4">ASSESSMENT (SDG 15)</p>
+            </div>
+            <div>
+                <h4 class="font-bold text-lg text-navy mb-2">Risk Assessment</h4>
+                <p class="text-gray-700 leading-relaxed">Rain &amp; runoff
+                    expected.</p>
+            </div>
+            <div>
+                <h4 class="font-bold text-lg text-navy mb-2">Recommendations</h4>
+                <p class="text-gray-700 leading-relaxed">Clear drains.</p>
+            </div>
+        </div>
+    """
+
+    def setUp(self):
+        self.migration = importlib.import_module('archive.migrations.0006_snapshot_analysis_fields')
+
+    def test_legacy_html_becomes_fields(self):
+        self.assertEqual(self.migration.parse_analysis_html(self.legacy_html), {
+            'title': 'ENVIRONMENTAL ANALYSIS',
+            'timestamp': 'March 02, 2025 at 14:05 WAT',
+            'subject': 'ASSESSMENT (SDG 15)',
+            'assessment': 'Rain & runoff\n                    expected.',
+            'sdg_15_compliance': '',
+            'recommendations': 'Clear drains.',
+        })
+
+    def test_fields_survive_rolling_back_and_forward(self):
+        analysis = {'title': 'T', 'timestamp': 'now', 'subject': 'S', 'assessment': '<b>5 > 3</b>',
+                    'sdg_15_compliance': 'Stable.', 'recommendations': 'Plant trees.'}
+
+        html = self.migration.render_analysis_html(analysis)
+
+        self.assertEqual(self.migration.parse_analysis_html(html), analysis)
+
+    def test_unrecognised_markup_keeps_its_text(self):
+        analysis = self.migration.parse_analysis_html('<div>Model output was <em>plain</em> text.</div>')
+
+        self.assertEqual(analysis['assessment'], 'Model output was plain text.')
+
+
+class RollupTests(ArchiveTestCase):
+    def rollups(self):
+        return list(LocationRollup.objects.order_by('period', 'period_start').values_list(*ROLLUP_FIELDS))
+
+    def test_saved_snapshots_match_a_rebuild(self):
+        for flood in (2, 9, 5):
+            make_snapshot(flood=flood)
+        make_snapshot('Tamale', flood=7)
+        recorded = self.rollups()
+
+        rebuild_rollups(LocationRollup, ReportSnapshot.objects.all())
+
+        self.assertEqual(self.rollups(), recorded)
+        day = LocationRollup.objects.get(location__name='Kumasi', period='day')
+        self.assertEqual((day.report_count, day.flood_min, day.flood_max, day.flood_sum), (3, 2, 9, 16))
+
+    def test_non_numeric_scores_count_as_zero(self):
+        make_snapshot(land_health=6.5)
+        make_snapshot(land_health='n/a')
+        make_snapshot(land_health=None)
+        recorded = self.rollups()
+
+        rebuild_rollups(LocationRollup, ReportSnapshot.objects.all())
+
+        self.assertEqual(self.rollups(), recorded)
+        self.assertEqual(LocationRollup.objects.get(period='day').land_health_sum, 6)
+        self.assertEqual([score_value(value) for value in (7, '3', 6.9, 'high', None, -2)], [7, 3, 6, 0, 0, 0])
+
+    def test_delete_rebuilds_its_periods(self):
+        make_snapshot(flood=2)
+        make_snapshot(flood=9).delete()
+
+        day = LocationRollup.objects.get(period='day')
+        self.assertEqual((day.report_count, day.flood_max), (1, 2))
+
+    def test_downsample_merges_runs(self):
+        make_snapshot(flood=2)
+        rollups = list(LocationRollup.objects.filter(period='day')) * 4
+
+        points = downsample(rollups, 2)
+
+        self.assertEqual(len(points), 2)
+        self.assertEqual(points[0]['reports'], 2)
+        self.assertEqual(points[0]['flood'], {'min': 2, 'max': 2, 'mean': 2.0})
+
+    def test_trend_endpoint(self):
+        make_snapshot(flood=2)
+        make_snapshot(flood=6)
+        location = Location.objects.get()
+
+        response = self.client.get(f"/location/{location.slug}/trend/", {'period': 'week'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['points'][0]['flood'], {'min': 2, 'max': 6, 'mean': 4.0})
+        self.assertEqual(self.client.get(f"/location/{location.slug}/trend/", {'period': 'year'}).status_code, 400)
+        self.assertEqual(self.client.get('/location/nowhere/trend/').status_code, 404)
+
+
+class KeysetPaginationTests(ArchiveTestCase):
+    def setUp(self):
+        super().setUp()
+        # Pairs of snapshots share a timestamp, so pages must break ties on id.
+        base = make_snapshot().timestamp
+        for number in range(1, 7):
+            snapshot = make_snapshot(f"Site {number}")
+            ReportSnapshot.objects.filter(pk=snapshot.pk).update(timestamp=base - timedelta(hours=number // 2))
+        self.expected = list(ReportSnapshot.objects.order_by('-timestamp', '-pk').values_list('pk', flat=True))
+
+    def walk(self, cursor_name, first_page):
+        pages = [first_page]
+        while pages[-1][cursor_name]:
+            pages.append(keyset_page(ReportSnapshot.objects.all(), per_page=3, **{
+                'after' if cursor_name == 'next_cursor' else 'before': pages[-1][cursor_name]
+            }))
+        return pages
+
+    def test_next_cursors_visit_every_row_once(self):
+        pages = self.walk('next_cursor', keyset_page(ReportSnapshot.objects.all(), per_page=3))
+
+        self.assertEqual([snapshot.pk for page in pages for snapshot in page['items']], self.expected)
+        self.assertEqual([len(page['items']) for page in pages], [3, 3, 1])
+        self.assertIsNone(pages[0]['previous_cursor'])
+
+    def test_previous_cursors_walk_back_to_the_first_page(self):
+        last = self.walk('next_cursor', keyset_page(ReportSnapshot.objects.all(), per_page=3))[-1]
+        pages = self.walk('previous_cursor', last)
+
+        self.assertEqual([snapshot.pk for page in reversed(pages) for snapshot in page['items']], self.expected)
+        self.assertIsNone(pages[-1]['previous_cursor'])
+        self.assertIsNotNone(pages[-1]['next_cursor'])
+
+    def test_cursor_round_trip_and_bad_cursors(self):
+        snapshot = ReportSnapshot.objects.first()
+
+        self.assertEqual(decode_cursor(encode_cursor(snapshot)), (snapshot.timestamp, snapshot.pk))
+        for value in ('', 'not-a-cursor', 'bm9waXBl'):
+            self.assertIsNone(decode_cursor(value))
+        page = keyset_page(ReportSnapshot.objects.all(), after='not-a-cursor', per_page=3)
+        self.assertEqual([snapshot.pk for snapshot in page['items']], self.expected[:3])
+
+
+class PageCacheTests(ArchiveTestCase):
+    def test_revalidation_until_a_snapshot_is_saved(self):
+        make_snapshot()
+        version = page_version(ARCHIVE_SCOPE)
+        response = self.client.get('/archive/')
+        self.assertContains(response, 'Kumasi')
+        self.assertIn('private', response['Cache-Control'])
+
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/archive/', headers={'If-None-Match': etag}).status_code, 304)
+
+        with mock.patch('archive.page_cache.time.time', return_value=version + 60):
+            make_snapshot('Tamale')
+        response = self.client.get('/archive/', headers={'If-None-Match': etag})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertContains(response, 'Tamale')
+
+    def test_cached_fragment_is_reused_within_a_version(self):
+        make_snapshot()
+        self.client.get('/archive/')
+        # Changed behind the signals' back, so only a rebuilt fragment would show it.
+        ReportSnapshot.objects.update(location_name='Renamed')
+
+        self.assertNotContains(self.client.get('/archive/'), 'Renamed')
+        self.assertContains(self.client.get('/archive/', {'location': 'Renamed'}), 'Renamed')
+
+    def test_deleted_snapshot_page_is_not_served(self):
+        snapshot = make_snapshot()
+        self.assertEqual(self.client.get(f"/archive/{snapshot.slug}/").status_code, 200)
+
+        snapshot.delete()
+
+        self.assertEqual(self.client.get(f"/archive/{snapshot.slug}/").status_code, 404)
+
+
+class ExportTests(ArchiveTestCase):
+    def setUp(self):
+        super().setUp()
+        self.kumasi = make_snapshot(flood=4)
+        self.tamale = make_snapshot('Tamale', latitude=9.4, longitude=-0.85, flood=7)
+        self.lagos = make_snapshot('Lagos', 'Nigeria', latitude=6.52, longitude=3.38)
+
+    def export(self, export_format, **filters):
+        encoder = ExportEncoder(export_format)
+        return ''.join(iter_export(export_queryset(**filters), encoder)), encoder
+
+    def test_parse_filters(self):
+        filters = parse_export_filters({'country': ' Ghana ', 'start': '2025-01-01', 'bbox': '-3,4,1,11'})
+
+        self.assertEqual(filters, {'country': 'Ghana', 'start': date(2025, 1, 1), 'end': None, 'bbox': (-3, 4, 1, 11)})
+        for params in ({'start': '01/01/2025'}, {'bbox': '1,2,3'}, {'bbox': '3,0,1,1'}, {'bbox': 'nan,0,1,1'}):
+            with self.assertRaises(ValueError):
+                parse_export_filters(params)
+
+    def test_csv(self):
+        text, encoder = self.export('csv', country='ghana')
+        rows = list(csv.DictReader(io.StringIO(text)))
+
+        self.assertEqual(encoder.rows, 2)
+        self.assertEqual([row['location_name'] for row in rows], ['Kumasi', 'Tamale'])
+        self.assertEqual((rows[0]['flood'], rows[0]['ndvi']), ('4', '0.55'))
+
+    def test_geojson_and_ndjson(self):
+        collection = json.loads(self.export('geojson', bbox=(-2, 5, 0, 10))[0])
+        lines = self.export('ndjson')[0].splitlines()
+
+        self.assertEqual([feature['properties']['slug'] for feature in collection['features']],
+                         [self.kumasi.slug, self.tamale.slug])
+        self.assertEqual(collection['features'][0]['geometry']['coordinates'], [-1.62, 6.69])
+        self.assertEqual([json.loads(line)['id'] for line in lines], [self.kumasi.pk, self.tamale.pk, self.lagos.pk])
+
+    def test_date_filters_are_inclusive_days(self):
+        today = self.kumasi.timestamp.date()
+
+        self.assertEqual(self.export('ndjson', start=today, end=today)[1].rows, 3)
+        self.assertEqual(self.export('ndjson', end=today - timedelta(days=1))[1].rows, 0)
+
+    async def test_export_view_streams(self):
+        response = await self.async_client.get('/archive/export.csv', {'country': 'Nigeria', 'analysis': '1'})
+        text = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        rows = list(csv.DictReader(io.StringIO(text)))
+
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual([(row['location_name'], row['title']) for row in rows], [('Lagos', 'ANALYSIS')])
+        self.assertEqual((await self.async_client.get('/archive/export.xml')).status_code, 404)
+        self.assertEqual((await self.async_client.get('/archive/export.csv', {'end': 'soon'})).status_code, 400)
+
+
+class MapClusteringTests(ArchiveTestCase):
+    def setUp(self):
+        super().setUp()
+        make_snapshot('Kumasi', flood=2)
+        make_snapshot('Ejisu', latitude=6.72, longitude=-1.47, flood=6)
+        make_snapshot('Lagos', 'Nigeria', latitude=6.52, longitude=3.38)
+
+    def features(self, zoom, bbox=(-5, 4, 5, 10)):
+        return [feature for x, y in tiles_for_bbox(bbox, zoom) for feature in build_tile_features(zoom, x, y)]
+
+    def test_nearby_locations_cluster_until_zoomed_in(self):
+        clusters = [feature['properties'] for feature in self.features(6) if feature['properties']['cluster']]
+        self.assertEqual([(cluster['count'], cluster['flood']) for cluster in clusters], [(2, 4.0)])
+
+        names = sorted(feature['properties']['name'] for feature in self.features(12, (-2, 6, -1, 7)))
+        self.assertEqual(names, ['Ejisu', 'Kumasi'])
+
+    def test_non_numeric_scores_count_as_zero_in_clusters(self):
+        make_snapshot('Ejisu', latitude=6.72, longitude=-1.47, flood='high', air=None)
+
+        cluster = [feature['properties'] for feature in self.features(6) if feature['properties']['cluster']][0]
+
+        self.assertEqual((cluster['flood'], cluster['air']), (1.0, 3.0))
+
+    def test_every_location_appears_once_across_tiles(self):
+        for zoom in range(4):
+            count = sum(feature['properties'].get('count', 1) for feature in self.features(zoom, (-180, -85, 180, 85)))
+            self.assertEqual(count, 3, zoom)
+
+    def test_map_api(self):
+        response = self.client.get('/archive/map.geojson', {'bbox': '-1.7,6.6,-1.4,6.8', 'zoom': 11})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(feature['properties']['name'] for feature in response.json()['features']), ['Ejisu', 'Kumasi'])
+        self.assertEqual(self.client.get('/archive/map.geojson', {'bbox': '-5,4,5,10', 'zoom': 30}).status_code, 400)
+        self.assertEqual(self.client.get('/archive/map.geojson', {'bbox': '-180,-85,180,85', 'zoom': 12}).status_code, 400)
@@ -5,5 +5,8 @@ app_name = 'archive'
 
 urlpatterns = [
     path('', views.archive_main, name='archive_main'),
+    path('export.<str:export_format>', views.export_archive, name='export'),
+    path('map.geojson', views.map_data, name='map_data'),
+    path('nearby.json', views.nearby_reports, name='nearby'),
     path('<slug:slug>/', views.snapshot_archive, name='snapshot'),
 ]
@@ -1,8 +1,30 @@
-from django.shortcuts import render, get_object_or_404
-from django.core.paginator import Paginator
-from archive.models import ReportSnapshot
+import time
+from datetime import date
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import render, redirect
+from django.template.loader import render_to_string
+from urllib.parse import urlencode
+from archive.clustering import MAX_ZOOM, tile_features, tiles_for_bbox
+from archive.export import (
+    EXPORT_FORMATS, ExportEncoder, aiter_export, export_queryset, parse_bbox, parse_export_filters
+)
+from archive.models import Location, ReportSnapshot, LocationSummary
+from archive.nearby import (
+    NEARBY_DEFAULT_LIMIT, NEARBY_DEFAULT_RADIUS_KM, NEARBY_MAX_LIMIT, NEARBY_MAX_RADIUS_KM, parse_point, snapshots_near
+)
+from archive.page_cache import (
+    ARCHIVE_SCOPE, cached_fragment, cached_snapshot_page, conditional_page, location_scope, page_version
+)
+from archive.pagination import keyset_page
+from archive.rollups import DIMENSIONS, PERIODS, downsample
+from archive.search import filter_snapshots
 from django.utils.text import slugify
 
+TREND_DEFAULT_POINTS = 180
+TREND_MAX_POINTS = 1000
+# A full-screen map spans about 40 tiles; anything wider should zoom out first.
+MAP_MAX_TILES = 64
+
 def get_risk_color(score):
     if score <= 3:
         return '#7cb342'
@@ -12,79 +34,67 @@ def get_risk_color(score):
         return '#EF5350'
 
 def locations_hub_list(request):
-    from django.db.models import Max
-    from django.db.models.functions import Lower, Trim
-    
-    locations_data = []
-    seen_locations = set()
-    
-    # Get all snapshots ordered by timestamp descending
-    all_snapshots = ReportSnapshot.objects.all().order_by('-timestamp')
-    
-    for snapshot in all_snapshots:
-        # Create a normalized key to prevent duplicates (case-insensitive, trimmed)
-        location_key = (snapshot.location_name.strip().lower(), snapshot.country.strip().lower())
-        
-        # Only add if we haven't seen this location yet
-        if location_key not in seen_locations:
-            seen_locations.add(location_key)
-            
-            locations_data.append({
-                'location_name': snapshot.location_name,
-                'country': snapshot.country,
-                'slug': slugify(snapshot.location_name),
-                'latest_timestamp': snapshot.timestamp,
-                'risk_scores': snapshot.risk_scores,
-                'report_count': ReportSnapshot.objects.filter(
-                    location_name__iexact=snapshot.location_name.strip(),
-                    country__iexact=snapshot.country.strip()
-                ).count()
-            })
-    
-    context = {
-        'locations': locations_data,
-    }
-    
-    return render(request, 'archive/locations_hub_list.html', context)
+    def render_page():
+        # One row per location, maintained by archive.signals as snapshots are saved.
+        content = cached_fragment('hub_list', [version], lambda: render_to_string(
+            'archive/fragments/locations_hub_list.html', {'locations': LocationSummary.objects.all()}
+        ))
+        return render(request, 'archive/locations_hub_list.html', {'content': content})
+
+    version = page_version(ARCHIVE_SCOPE)
+    return conditional_page(request, 'hub-list', version, render_page)
 
 def archive_main(request):
-    reports = ReportSnapshot.objects.all()
-    
     filter_location = request.GET.get('location', '')
     filter_country = request.GET.get('country', '')
-    
-    if filter_location:
-        reports = reports.filter(location_name__icontains=filter_location)
-    if filter_country:
-        reports = reports.filter(country__icontains=filter_country)
-    
-    paginator = Paginator(reports, 12)
-    page_number = request.GET.get('page', 1)
-    page_obj = paginator.get_page(page_number)
-    
-    context = {
-        'reports': page_obj,
-        'filter_location': filter_location,
-        'filter_country': filter_country,
-    }
-    
-    return render(request, 'archive/archive_main.html', context)
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+
+    def render_content():
+        reports = filter_snapshots(
+            ReportSnapshot.objects.defer(*ReportSnapshot.DETAIL_FIELDS), filter_location, filter_country
+        )
+        page = keyset_page(reports, after=after, before=before, per_page=12)
+
+        filters = {key: value for key, value in (('location', filter_location), ('country', filter_country)) if value}
+        next_url = f"?{urlencode({**filters, 'after': page['next_cursor']})}" if page['next_cursor'] else None
+        previous_url = f"?{urlencode({**filters, 'before': page['previous_cursor']})}" if page['previous_cursor'] else None
+
+        context = {
+            'reports': page['items'],
+            'next_url': next_url,
+            'previous_url': previous_url,
+            'filter_location': filter_location,
+            'filter_country': filter_country,
+        }
+        return render_to_string('archive/fragments/archive_main.html', context)
+
+    def render_page():
+        content = cached_fragment(
+            'archive', [version], render_content, vary_on=(filter_location, filter_country, after, before)
+        )
+        return render(request, 'archive/archive_main.html', {'content': content})
+
+    version = page_version(ARCHIVE_SCOPE)
+    return conditional_page(request, 'archive', version, render_page)
 
 def location_hub(request, location_slug):
-    snapshots = ReportSnapshot.objects.filter(
-        slug__icontains=location_slug.split('-')[0]
-    )
-    
-    if snapshots.exists():
+    location = Location.objects.filter(slug=location_slug).first()
+
+    if location is None:
+        # Older links pointed at a report slug; send them to that report's location.
+        snapshot = ReportSnapshot.objects.filter(slug=location_slug).select_related('location').first()
+        if snapshot and snapshot.location:
+            return redirect('location_hub', location_slug=snapshot.location.slug)
+        return render(request, '404.html', status=404)
+
+    def render_content():
+        snapshots = location.snapshots.defer(*ReportSnapshot.DETAIL_FIELDS)
         latest = snapshots.first()
-        
-        trend_data = []
-        for snapshot in snapshots:
-            trend_data.append({
-                'date': snapshot.timestamp.strftime('%Y-%m-%d'),
-                'score': snapshot.risk_scores.get('land_health', 0)
-            })
-        
+
+        if latest is None:
+            return None
+
         context = {
             'location_name': latest.location_name,
             'country': latest.country,
@@ -93,20 +103,163 @@ def location_hub(request, location_slug):
             'flood_color': get_risk_color(latest.risk_scores.get('flood', 5)),
             'air_color': get_risk_color(latest.risk_scores.get('air', 5)),
             'land_color': get_risk_color(latest.risk_scores.get('land_health', 5)),
-            'trend_data': trend_data,
+        }
+        return render_to_string('archive/fragments/location_hub.html', context)
+
+    def render_page():
+        # Scopes bumped together share a version, so the key must name the location too.
+        content = cached_fragment(f"location_{location.id}", [version], render_content)
+        if content is None:
+            return render(request, '404.html', status=404)
+        context = {
+            'location_name': location.name,
+            'country': location.country,
+            'content': content,
         }
         return render(request, 'archive/location_hub.html', context)
-    
-    return render(request, '404.html', status=404)
+
+    version = page_version(location_scope(location.id))
+    return conditional_page(request, f"location-{location.id}", version, render_page)
+
+def location_trend(request, location_slug):
+    """
+    Risk score trend for a location as JSON, read from its daily or weekly
+    rollups: ?period=day|week, optional ?start= and ?end= dates (YYYY-MM-DD)
+    and ?points= to cap how many points come back.
+    """
+    location = Location.objects.filter(slug=location_slug).first()
+    if location is None:
+        return JsonResponse({'error': 'Unknown location'}, status=404)
+
+    period = request.GET.get('period', 'day')
+    if period not in PERIODS:
+        return JsonResponse({'error': f"period must be one of: {', '.join(PERIODS)}"}, status=400)
+    try:
+        start = date.fromisoformat(request.GET['start']) if request.GET.get('start') else None
+        end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else None
+        points = min(TREND_MAX_POINTS, max(1, int(request.GET.get('points', TREND_DEFAULT_POINTS))))
+    except ValueError:
+        return JsonResponse({'error': 'start and end must be YYYY-MM-DD dates and points a number'}, status=400)
+
+    rollups = location.rollups.filter(period=period)
+    if start:
+        rollups = rollups.filter(period_start__gte=start)
+    if end:
+        rollups = rollups.filter(period_start__lte=end)
+
+    return JsonResponse({
+        'location': location.name,
+        'country': location.country,
+        'period': period,
+        'points': downsample(list(rollups), points),
+    })
+
+def map_data(request):
+    """
+    GeoJSON of the latest report per location within ?bbox= (min_lon,min_lat,
+    max_lon,max_lat), clustered for ?zoom=. Built from per-tile cached
+    features, so panning only computes the tiles that come into view.
+    """
+    try:
+        bbox = parse_bbox(request.GET.get('bbox', ''))
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    zoom = request.GET.get('zoom', '')
+    zoom = int(zoom) if zoom.isdigit() else -1
+    if not 0 <= zoom <= MAX_ZOOM:
+        return JsonResponse({'error': f"zoom must be between 0 and {MAX_ZOOM}"}, status=400)
+
+    # Leaflet reports longitudes past +-180 once the world wraps.
+    bbox = (max(bbox[0], -180), max(bbox[1], -90), min(bbox[2], 180), min(bbox[3], 90))
+    tiles = tiles_for_bbox(bbox, zoom)
+    if len(tiles) > MAP_MAX_TILES:
+        return JsonResponse({'error': 'bbox is too large for this zoom'}, status=400)
+
+    def render_data():
+        features = [feature for x, y in tiles for feature in tile_features(zoom, x, y, version)]
+        return JsonResponse({'type': 'FeatureCollection', 'features': features})
+
+    version = page_version(ARCHIVE_SCOPE)
+    return conditional_page(request, 'map', version, render_data)
+
+def nearby_reports(request):
+    """
+    Reports within ?radius_km= (default NEARBY_DEFAULT_RADIUS_KM) of ?lat= and
+    ?lon= as JSON, nearest first, at most ?limit= of them.
+    """
+    try:
+        lat, lon = parse_point(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    try:
+        radius_km = float(request.GET.get('radius_km', NEARBY_DEFAULT_RADIUS_KM))
+        limit = min(NEARBY_MAX_LIMIT, max(1, int(request.GET.get('limit', NEARBY_DEFAULT_LIMIT))))
+    except ValueError:
+        return JsonResponse({'error': 'radius_km and limit must be numbers'}, status=400)
+    if not 0 < radius_km <= NEARBY_MAX_RADIUS_KM:
+        return JsonResponse({'error': f"radius_km must be above 0 and at most {NEARBY_MAX_RADIUS_KM}"}, status=400)
+
+    def render_data():
+        reports = [{
+            'location_name': snapshot.location_name,
+            'country': snapshot.country,
+            'latitude': snapshot.latitude,
+            'longitude': snapshot.longitude,
+            'distance_km': round(distance, 3),
+            'timestamp': snapshot.timestamp.isoformat(),
+            'url': f"/archive/{snapshot.slug}/",
+            **{dimension: snapshot.risk_scores.get(dimension) for dimension in DIMENSIONS},
+        } for distance, snapshot in snapshots_near(lat, lon, radius_km, limit=limit)]
+        return JsonResponse({'latitude': lat, 'longitude': lon, 'radius_km': radius_km, 'reports': reports})
+
+    version = page_version(ARCHIVE_SCOPE)
+    return conditional_page(request, 'nearby', version, render_data)
+
+async def export_archive(request, export_format):
+    """
+    The archive as CSV, NDJSON or GeoJSON, streamed straight from a database
+    cursor. Takes the filters of archive.export.parse_export_filters, and
+    ?analysis=1 to include the written analysis.
+    """
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'error': f"format must be one of: {', '.join(EXPORT_FORMATS)}"}, status=404)
+    try:
+        filters = parse_export_filters(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+    analysis = request.GET.get('analysis') == '1'
+    encoder = ExportEncoder(export_format, analysis)
+    response = StreamingHttpResponse(
+        aiter_export(export_queryset(**filters, analysis=analysis), encoder),
+        content_type=f"{EXPORT_FORMATS[export_format]}; charset=utf-8",
+    )
+    response['Content-Disposition'] = f'attachment; filename="asase-archive.{export_format}"'
+    return response
 
 def snapshot_archive(request, slug):
-    snapshot = get_object_or_404(ReportSnapshot, slug=slug)
-    
-    context = {
-        'snapshot': snapshot,
-        'flood_color': get_risk_color(snapshot.risk_scores.get('flood', 5)),
-        'air_color': get_risk_color(snapshot.risk_scores.get('air', 5)),
-        'land_color': get_risk_color(snapshot.risk_scores.get('land_health', 5)),
-    }
-    
-    return render(request, 'archive/snapshot_archive.html', context)
+    def build():
+        snapshot = ReportSnapshot.objects.select_related('location').filter(slug=slug).first()
+        if snapshot is None:
+            return None
+        context = {
+            'snapshot': snapshot,
+            'flood_color': get_risk_color(snapshot.risk_scores.get('flood', 5)),
+            'air_color': get_risk_color(snapshot.risk_scores.get('air', 5)),
+            'land_color': get_risk_color(snapshot.risk_scores.get('land_health', 5)),
+        }
+        return {
+            'location_name': snapshot.location_name,
+            'timestamp': snapshot.timestamp,
+            'content': render_to_string('archive/fragments/snapshot_archive.html', context),
+            'rendered_at': time.time(),
+        }
+
+    # Snapshots do not change once saved, so each is rendered once and kept until it is deleted.
+    page = cached_snapshot_page(slug, build)
+    if page is None:
+        raise Http404('No such snapshot')
+
+    return conditional_page(request, f"snapshot-{slug}", page['rendered_at'], lambda: render(
+        request, 'archive/snapshot_archive.html', {'snapshot': page, 'content': page['content']}
+    ))
@@ -54,6 +54,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -162,12 +163,136 @@ STORAGES = {
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Shared across gunicorn workers and restarts via a database table (run
+# `manage.py createcachetable`), with a short-lived in-process L1 in front.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'asase-cache',
+        'BACKEND': 'core.cache.TieredDatabaseCache',
+        'LOCATION': 'asase_cache',
         'OPTIONS': {
-            'MAX_ENTRIES': 1000
+            'MAX_ENTRIES': 50000,
+            'L1_MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 30,
+        }
+    },
+    # Gemini analyses keyed on location and bucketed inputs; its own table so
+    # MAX_ENTRIES bounds the number of stored analyses independently.
+    'ai': {
+        'BACKEND': 'core.cache.TieredDatabaseCache',
+        'LOCATION': 'asase_ai_cache',
+        'TIMEOUT': int(os.environ.get('AI_ANALYSIS_CACHE_TIMEOUT', 6 * 3600)),
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+            'L1_MAX_ENTRIES': 200,
+            'L1_TIMEOUT': 30,
+        }
+    },
+    # Rendered archive page fragments, keyed on versions that archive.signals
+    # bumps whenever a snapshot is saved or deleted. Raise PAGE_CACHE_VERSION
+    # on deploys that change the archive templates.
+    'pages': {
+        'BACKEND': 'core.cache.TieredDatabaseCache',
+        'LOCATION': 'asase_page_cache',
+        'TIMEOUT': 24 * 3600,
+        'VERSION': int(os.environ.get('PAGE_CACHE_VERSION', 1)),
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+            'L1_MAX_ENTRIES': 500,
+            'L1_TIMEOUT': 30,
         }
     }
 }
+
+# Single-flight refresh: how long a worker holds the refresh lock for a key,
+# and how long other requests wait for it before fetching themselves.
+CACHE_REFRESH_LOCK_TIMEOUT = 60
+CACHE_REFRESH_WAIT = 10
+
+# Upstream data providers used by analysis.clients. Each entry overrides the
+# defaults in analysis.clients.DEFAULT_PROVIDER_CONFIG (timeout in seconds);
+# base_url can be pointed elsewhere, e.g. at the benchmark's local stand-ins.
+# rate_limit/burst set a per-process token bucket (requests per second, and
+# how many may go out back to back); callers queue for a token for at most
+# max_wait seconds before the call fails over to its fallback.
+# After failure_threshold failed calls in a row a provider's circuit opens and
+# calls fail immediately for reset_timeout seconds, then one probe is let through.
+UPSTREAM_PROVIDERS = {
+    'nominatim': {'base_url': os.environ.get('NOMINATIM_BASE_URL', 'https://nominatim.openstreetmap.org'),
+                  'timeout': 10, 'retries': 1, 'pool_size': 4, 'rate_limit': 1, 'burst': 1, 'max_wait': 5},
+    'openweather': {'base_url': os.environ.get('OPENWEATHER_BASE_URL', 'https://api.openweathermap.org'),
+                    'timeout': 8, 'retries': 2, 'rate_limit': 1, 'burst': 10, 'max_wait': 5},
+    'open_meteo': {'base_url': os.environ.get('OPEN_METEO_BASE_URL', 'https://api.open-meteo.com'),
+                   'timeout': 8, 'retries': 2, 'rate_limit': 10, 'burst': 20, 'max_wait': 3},
+    'gibs': {'base_url': os.environ.get('GIBS_BASE_URL', 'https://gibs.earthdata.nasa.gov'),
+             'timeout': 15, 'retries': 2, 'rate_limit': 20, 'burst': 40, 'max_wait': 3},
+    # An empty base_url keeps the Gemini SDK's default endpoint.
+    'gemini': {'base_url': os.environ.get('GEMINI_BASE_URL', ''),
+               'timeout': 60, 'retries': 2, 'backoff': 1, 'max_backoff': 8,
+               'rate_limit': 2, 'burst': 5, 'max_wait': 10},
+}
+
+# Geohash precision used to quantize provider cache keys, so nearby lookups in
+# the same cell share one upstream result (5 ~ 4.9 km, 6 ~ 1.2 km, 7 ~ 150 m).
+PROVIDER_CACHE_PRECISION = {
+    'weather': 5,
+    'elevation': 7,
+    'ndvi': 6,
+    'reverse': 6,
+}
+
+# How long provider data past its freshness window is still served (seconds)
+# while a background refresh replaces it; reports flag inputs served stale.
+PROVIDER_CACHE_STALE_FOR = {
+    'weather': 6 * 3600,
+    'elevation': 30 * 86400,
+    'ndvi': 7 * 86400,
+}
+CACHE_REFRESH_WORKERS = 4
+
+# NDVI tiles sampled from NASA GIBS (MODIS Terra 8-day composites). Decoded
+# tiles are kept in a content-addressed cache on local disk.
+NDVI_TILE_CACHE_DIR = Path(os.environ.get('NDVI_TILE_CACHE_DIR', BASE_DIR / 'var' / 'ndvi_tiles'))
+NDVI_TILE_LEVEL = 7
+NDVI_LAG_DAYS = 16
+
+# Live reports started from the map form run as background jobs (the search
+# form streams its report over SSE instead). 'thread' runs them in an
+# in-process worker pool; 'queue' leaves them for `manage.py process_report_jobs`.
+REPORT_JOB_BACKEND = os.environ.get('REPORT_JOB_BACKEND', 'thread')
+REPORT_JOB_WORKERS = int(os.environ.get('REPORT_JOB_WORKERS', 4))
+REPORT_JOB_STALE_AFTER = 300
+
+# A live report for a location that already has a snapshot from the last
+# LIVE_REPORT_REUSE_SECONDS returns that snapshot instead of a new analysis
+# (0 disables this). Identical requests that arrive while a report is running
+# always share it. Map clicks, and searches once geocoded, match any snapshot
+# within LIVE_REPORT_REUSE_RADIUS_M metres instead (0 disables that match).
+LIVE_REPORT_REUSE_SECONDS = int(os.environ.get('LIVE_REPORT_REUSE_SECONDS', 300))
+LIVE_REPORT_REUSE_RADIUS_M = int(os.environ.get('LIVE_REPORT_REUSE_RADIUS_M', 300))
+
+# Batch analysis (`manage.py analyze_locations` and POST /analysis/batches/).
+# The API is disabled unless BATCH_API_TOKEN is set; clients send it as a
+# bearer token.
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 4))
+BATCH_API_TOKEN = os.environ.get('BATCH_API_TOKEN', '')
+
+# Per-request stage timings are sent as Server-Timing headers and, with the
+# cache, upstream and rate limit counters, served in Prometheus format at
+# /metrics (per process). Scrapers send METRICS_TOKEN as a bearer token; with
+# it unset the endpoint is only served when DEBUG is on.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {'format': '%(asctime)s %(levelname)s %(name)s: %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'simple'},
+    },
+    'loggers': {
+        app: {'handlers': ['console'], 'level': os.environ.get('LOG_LEVEL', 'INFO')}
+        for app in ('analysis', 'archive', 'core')
+    },
+}
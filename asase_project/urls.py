@@ -17,12 +17,15 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from archive import views as archive_views
+from core import views as core_views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', core_views.metrics, name='metrics'),
     path('', archive_views.locations_hub_list, name='home'),
     path('search/', include('core.urls')),
     path('analysis/', include('analysis.urls')),
     path('archive/', include('archive.urls')),
     path('location/<slug:location_slug>/', archive_views.location_hub, name='location_hub'),
+    path('location/<slug:location_slug>/trend/', archive_views.location_trend, name='location_trend'),
 ]
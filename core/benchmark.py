@@ -0,0 +1,320 @@
+import math
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import django
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min
+from django.test import Client
+from django.utils.text import slugify
+from analysis.fake_upstreams import FAKE_ANALYSIS
+from analysis.pipeline import build_analysis_fields
+from archive.models import GEOHASH_PRECISION, Location, LocationRollup, LocationSummary, ReportSnapshot, location_key
+from archive.page_cache import PAGE_CACHE
+from archive.rollups import rebuild_rollups
+from core.african_countries import AFRICAN_COUNTRIES
+from core.gazetteer import get_gazetteer
+from core.geo import geohash_encode
+
+# Seeded rows are recognisable by name, so they can be topped up or left alone by other code.
+BENCH_PREFIX = 'Bench Site'
+SNAPSHOTS_PER_LOCATION = 20
+BENCH_START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+# One seeded report every 30s: a million rows span just under a year.
+BENCH_INTERVAL = timedelta(seconds=30)
+
+ENDPOINTS = (
+    'live_report', 'locations_hub_list', 'archive_main', 'location_hub', 'location_trend', 'snapshot_archive',
+    'nearby_reports',
+)
+
+
+def _bench_location(number: int) -> Location:
+    rng = random.Random(number)
+    name = f"{BENCH_PREFIX} {number:06d}"
+    country = AFRICAN_COUNTRIES[number % len(AFRICAN_COUNTRIES)]
+    return Location(
+        key=location_key(name, country),
+        name=name,
+        country=country,
+        slug=slugify(name),
+        latitude=round(rng.uniform(-34, 35), 4),
+        longitude=round(rng.uniform(-17, 51), 4),
+    )
+
+def _bench_snapshot(index: int, location_id: int, location: tuple, analysis: dict) -> ReportSnapshot:
+    name, country, slug, latitude, longitude = location
+    rng = random.Random(index)
+    return ReportSnapshot(
+        location_id=location_id,
+        location_name=name,
+        country=country,
+        latitude=latitude,
+        longitude=longitude,
+        geohash=geohash_encode(latitude, longitude, GEOHASH_PRECISION),
+        risk_scores={'flood': rng.randint(1, 10), 'air': rng.randint(1, 10), 'land_health': rng.randint(1, 10)},
+        analysis=analysis,
+        raw_data={
+            'precipitation_forecast': rng.randint(20, 100),
+            'recent_rain': round(rng.uniform(0, 5), 1),
+            'elevation': rng.randint(0, 2000),
+            'ndvi': round(rng.uniform(-0.1, 0.9), 3),
+        },
+        timestamp=BENCH_START + index * BENCH_INTERVAL,
+        slug=f"{slug}-{index}",
+    )
+
+@contextmanager
+def _explicit_timestamps():
+    # bulk_create would otherwise stamp every seeded row with the current time.
+    field = ReportSnapshot._meta.get_field('timestamp')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+def _rebuild_bench_summaries(chunk_size: int) -> None:
+    # Seeded ids grow with their timestamps, so each location's highest id is its latest report.
+    stats = list(
+        ReportSnapshot.objects.filter(location_name__startswith=BENCH_PREFIX)
+        .values('location_id').annotate(count=Count('id'), latest_id=Max('id'))
+    )
+    LocationSummary.objects.filter(location_name__startswith=BENCH_PREFIX).delete()
+
+    for start in range(0, len(stats), chunk_size):
+        chunk = stats[start:start + chunk_size]
+        latest = ReportSnapshot.objects.select_related('location').in_bulk([row['latest_id'] for row in chunk])
+        summaries = []
+        for row in chunk:
+            snapshot = latest[row['latest_id']]
+            summaries.append(LocationSummary(
+                location=snapshot.location,
+                location_key=snapshot.location.key,
+                location_name=snapshot.location_name,
+                country=snapshot.country,
+                slug=snapshot.location.slug,
+                latest_snapshot=snapshot,
+                latest_timestamp=snapshot.timestamp,
+                risk_scores=snapshot.risk_scores,
+                report_count=row['count'],
+            ))
+        LocationSummary.objects.bulk_create(summaries)
+
+def seed_snapshots(rows: int, chunk_size: int = 5000, progress=None) -> int:
+    """
+    Top the database up to `rows` seeded ReportSnapshots (SNAPSHOTS_PER_LOCATION
+    per location on average) and rebuild their location summaries and rollups. Seeding is
+    deterministic, so every run at a given size sees the same data. Returns
+    the number of rows added.
+    """
+    existing = ReportSnapshot.objects.filter(location_name__startswith=BENCH_PREFIX).count()
+    if existing >= rows:
+        return 0
+
+    location_count = max(1, rows // SNAPSHOTS_PER_LOCATION)
+    for start in range(0, location_count, chunk_size):
+        Location.objects.bulk_create(
+            [_bench_location(number) for number in range(start, min(location_count, start + chunk_size))],
+            ignore_conflicts=True,
+        )
+    locations = {
+        int(name.rsplit(' ', 1)[1]): (location_id, (name, country, slug, latitude, longitude))
+        for location_id, name, country, slug, latitude, longitude in Location.objects.filter(
+            name__startswith=BENCH_PREFIX
+        ).values_list('id', 'name', 'country', 'slug', 'latitude', 'longitude')
+    }
+
+    analysis = build_analysis_fields({
+        'title': 'ENVIRONMENTAL ANALYSIS', 'timestamp': '', 'subject': 'ASSESSMENT (SDG 15)', **FAKE_ANALYSIS,
+    })
+    with _explicit_timestamps():
+        for start in range(existing, rows, chunk_size):
+            batch = []
+            for index in range(start, min(rows, start + chunk_size)):
+                location_id, location = locations[index % location_count]
+                batch.append(_bench_snapshot(index, location_id, location, analysis))
+            with transaction.atomic():
+                ReportSnapshot.objects.bulk_create(batch)
+            if progress:
+                progress(start + len(batch), rows)
+
+    _rebuild_bench_summaries(chunk_size)
+    rebuild_rollups(LocationRollup, ReportSnapshot.objects.filter(location_name__startswith=BENCH_PREFIX), chunk_size)
+    # bulk_create skips the signals that invalidate cached pages.
+    caches[PAGE_CACHE].clear()
+    return rows - existing
+
+
+def _percentile(ordered: list, percent: float) -> float:
+    # Nearest-rank percentile of an already sorted list.
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+def summarize(latencies: list, elapsed: float, errors: int) -> dict:
+    ordered = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(_percentile(ordered, 50) * 1000, 2),
+        'p95_ms': round(_percentile(ordered, 95) * 1000, 2),
+        'p99_ms': round(_percentile(ordered, 99) * 1000, 2),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 2),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+    }
+
+def run_requests(requests: list, concurrency: int = 1) -> dict:
+    """
+    Issue (method, path, data) requests through the full middleware stack with
+    `concurrency` client threads, and summarize their latencies. Responses
+    other than 2xx/3xx are counted as errors.
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    queue = iter(requests)
+
+    def worker():
+        client = Client()
+        while True:
+            with lock:
+                request = next(queue, None)
+            if request is None:
+                return
+            method, path, data = request
+            start = time.perf_counter()
+            response = client.post(path, data) if method == 'POST' else client.get(path, data)
+            if hasattr(response, 'streaming_content'):
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code >= 400:
+                    errors.append(response.status_code)
+
+    threads = [threading.Thread(target=worker) for _ in range(max(1, concurrency))]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, time.perf_counter() - start, len(errors))
+
+def endpoint_requests(endpoint: str, count: int, seed: int = 0) -> list:
+    """Build a deterministic request mix for one benchmarked view."""
+    rng = random.Random(f"{seed}-{endpoint}")
+    if endpoint == 'live_report':
+        # Alternate gazetteer towns with names only the (fake) Nominatim knows.
+        places = get_gazetteer().places
+        requests = []
+        for i in range(count):
+            if i % 2:
+                requests.append(('POST', '/analysis/live-report/', {
+                    'location': f"Bench Village {seed}-{i}", 'country': '',
+                }))
+            else:
+                place = places[rng.randrange(len(places))]
+                requests.append(('POST', '/analysis/live-report/', {
+                    'location': place.name, 'country': place.country,
+                }))
+        return requests
+
+    if endpoint == 'locations_hub_list':
+        return [('GET', '/', {})] * count
+
+    if endpoint == 'archive_main':
+        # First pages plus location/country searches, the archive's common entry points.
+        location_total = max(1, Location.objects.filter(name__startswith=BENCH_PREFIX).count())
+        requests = []
+        for i in range(count):
+            if i % 3 == 0:
+                requests.append(('GET', '/archive/', {}))
+            elif i % 3 == 1:
+                requests.append(('GET', '/archive/', {'location': f"Site {rng.randrange(location_total):06d}"}))
+            else:
+                requests.append(('GET', '/archive/', {'country': rng.choice(AFRICAN_COUNTRIES)}))
+        return requests
+
+    if endpoint == 'location_hub':
+        slugs = list(Location.objects.filter(name__startswith=BENCH_PREFIX).values_list('slug', flat=True)[:5000])
+        return [('GET', f"/location/{rng.choice(slugs)}/", {}) for _ in range(count)] if slugs else []
+
+    if endpoint == 'location_trend':
+        slugs = list(Location.objects.filter(name__startswith=BENCH_PREFIX).values_list('slug', flat=True)[:5000])
+        return [
+            ('GET', f"/location/{rng.choice(slugs)}/trend/", {'period': rng.choice(('day', 'week'))})
+            for _ in range(count)
+        ] if slugs else []
+
+    if endpoint == 'snapshot_archive':
+        seeded = ReportSnapshot.objects.filter(location_name__startswith=BENCH_PREFIX)
+        bounds = seeded.aggregate(low=Min('id'), high=Max('id'))
+        if bounds['low'] is None:
+            return []
+        ids = [rng.randint(bounds['low'], bounds['high']) for _ in range(count * 2)]
+        slugs = list(seeded.filter(id__in=ids).values_list('slug', flat=True))
+        return [('GET', f"/archive/{rng.choice(slugs)}/", {}) for _ in range(count)] if slugs else []
+
+    if endpoint == 'nearby_reports':
+        points = list(
+            Location.objects.filter(name__startswith=BENCH_PREFIX).values_list('latitude', 'longitude')[:5000]
+        )
+        if not points:
+            return []
+        requests = []
+        for _ in range(count):
+            lat, lon = rng.choice(points)
+            requests.append(('GET', '/archive/nearby.json', {'lat': lat, 'lon': lon, 'radius_km': rng.choice((1, 5, 25))}))
+        return requests
+
+    raise ValueError(f"Unknown endpoint: {endpoint}")
+
+
+def git_revision() -> dict:
+    def git(*args):
+        try:
+            return subprocess.run(
+                ['git', *args], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=30
+            ).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ''
+
+    return {
+        'commit': git('rev-parse', 'HEAD'),
+        'describe': git('describe', '--always', '--dirty'),
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+    }
+
+def environment() -> dict:
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+def compare(current: dict, baseline: dict) -> list:
+    """Rows of (endpoint, metric, baseline, current, change %) for the percentile and throughput metrics."""
+    rows = []
+    for endpoint, result in current['results'].items():
+        before = baseline.get('results', {}).get(endpoint)
+        if not before:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps'):
+            old, new = before.get(metric), result.get(metric)
+            if old and new is not None:
+                rows.append((endpoint, metric, old, new, round((new - old) / old * 100, 1)))
+    return rows
+
+def default_output_path(revision: dict, rows: int) -> Path:
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')
+    return Path(settings.BASE_DIR) / 'var' / 'benchmarks' / f"{stamp}-{revision['describe'] or 'unknown'}-{rows}.json"
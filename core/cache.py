@@ -0,0 +1,372 @@
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+from django.conf import settings
+from django.core.cache import cache as default_cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import close_old_connections
+from core.metrics import record_cache_lookup
+
+_MISSING = object()
+
+logger = logging.getLogger(__name__)
+
+
+class TieredDatabaseCache(DatabaseCache):
+    """
+    Database-table cache shared by every worker, with a small per-process
+    LocMemCache in front of it.
+
+    L1 entries live for at most L1_TIMEOUT seconds, which bounds how long a
+    worker can serve a value that another worker has since replaced.
+    """
+
+    def __init__(self, table, params):
+        super().__init__(table, params)
+        options = params.get('OPTIONS', {})
+        self._l1_timeout = options.get('L1_TIMEOUT', 30)
+        self._l1 = LocMemCache(f'{table}-l1', {
+            'TIMEOUT': self._l1_timeout,
+            'OPTIONS': {'MAX_ENTRIES': options.get('L1_MAX_ENTRIES', 1000)},
+        })
+
+    def _l1_timeout_for(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        if timeout is None:
+            return self._l1_timeout
+        return min(timeout, self._l1_timeout)
+
+    def get(self, key, default=None, version=None):
+        value = self._l1.get(key, _MISSING, version=version)
+        if value is not _MISSING:
+            return value
+        value = super().get(key, _MISSING, version=version)
+        if value is _MISSING:
+            return default
+        self._l1.set(key, value, self._l1_timeout, version=version)
+        return value
+
+    def get_shared(self, key, default=None, version=None):
+        # Skips L1, for values another worker may have just changed (e.g. page versions).
+        return super().get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        found = {}
+        remaining = []
+        for key in keys:
+            value = self._l1.get(key, _MISSING, version=version)
+            if value is _MISSING:
+                remaining.append(key)
+            else:
+                found[key] = value
+        if remaining:
+            fetched = super().get_many(remaining, version=version)
+            for key, value in fetched.items():
+                self._l1.set(key, value, self._l1_timeout, version=version)
+            found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        super().set(key, value, timeout, version=version)
+        self._l1.set(key, value, self._l1_timeout_for(timeout), version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # add() is used for cross-worker locks, so it must always be decided by the shared table.
+        self._l1.delete(key, version=version)
+        return super().add(key, value, timeout, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l1.touch(key, self._l1_timeout_for(timeout), version=version)
+        return super().touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._l1.delete(key, version=version)
+        return super().incr(key, delta, version=version)
+
+    def delete(self, key, version=None):
+        self._l1.delete(key, version=version)
+        return super().delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        self._l1.delete_many(keys, version=version)
+        return super().delete_many(keys, version=version)
+
+    def clear(self):
+        self._l1.clear()
+        return super().clear()
+
+
+class CachedValue(NamedTuple):
+    # Envelope stored by the stale-while-revalidate helpers; fetched_at is a Unix timestamp.
+    value: object
+    fetched_at: float
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+_async_flights = weakref.WeakKeyDictionary()
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+_refresh_executor = None
+_refresh_tasks = set()
+
+
+def _lock_key(key):
+    return f"{key}:refresh-lock"
+
+def _stampede_settings():
+    return (
+        getattr(settings, 'CACHE_REFRESH_LOCK_TIMEOUT', 60),
+        getattr(settings, 'CACHE_REFRESH_WAIT', 10),
+    )
+
+def _compute_and_store(cache, key, compute, timeout):
+    lock_timeout, wait = _stampede_settings()
+    locked = cache.add(_lock_key(key), True, lock_timeout)
+
+    if not locked:
+        # Another worker is already refreshing this key; give it a bounded time to finish.
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            time.sleep(0.1)
+            value = cache.get(key)
+            if value is not None:
+                return value
+            if not cache.has_key(_lock_key(key)):
+                break
+
+    try:
+        value = compute()
+        if value is not None:
+            cache.set(key, value, timeout)
+        return value
+    finally:
+        if locked:
+            cache.delete(_lock_key(key))
+
+def cache_get_or_compute(key, compute, timeout, cache=None):
+    """
+    Return the cached value for key, or call compute() to fill it.
+
+    Concurrent misses for the same key share one compute() call: threads in
+    this process wait on the first caller, and other workers wait on a lock
+    row in the shared cache. None results are returned but never cached.
+    """
+    cache = cache or default_cache
+    value = cache.get(key)
+    record_cache_lookup(key, 'hit' if value is not None else 'miss')
+    if value is not None:
+        return value
+    return _single_flight(cache, key, compute, timeout)
+
+def _single_flight(cache, key, compute, timeout):
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        _, wait = _stampede_settings()
+        if flight.done.wait(wait):
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        return compute()
+
+    try:
+        flight.value = _compute_and_store(cache, key, compute, timeout)
+        return flight.value
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        flight.done.set()
+        with _flights_lock:
+            _flights.pop(key, None)
+
+async def _acompute_and_store(cache, key, compute, timeout):
+    lock_timeout, wait = _stampede_settings()
+    locked = await cache.aadd(_lock_key(key), True, lock_timeout)
+
+    if not locked:
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+            value = await cache.aget(key)
+            if value is not None:
+                return value
+            if not await cache.ahas_key(_lock_key(key)):
+                break
+
+    try:
+        value = await compute()
+        if value is not None:
+            await cache.aset(key, value, timeout)
+        return value
+    finally:
+        if locked:
+            await cache.adelete(_lock_key(key))
+
+async def acache_get_or_compute(key, compute, timeout, cache=None):
+    """Async counterpart of cache_get_or_compute(); compute must be a coroutine function."""
+    cache = cache or default_cache
+    value = await cache.aget(key)
+    record_cache_lookup(key, 'hit' if value is not None else 'miss')
+    if value is not None:
+        return value
+    return await _asingle_flight(cache, key, compute, timeout)
+
+async def _asingle_flight(cache, key, compute, timeout):
+    flights = _async_flights.setdefault(asyncio.get_running_loop(), {})
+    task = flights.get(key)
+    if task is None:
+        # Detached from the request that started it, so that request being cancelled
+        # (e.g. its client disconnecting) does not fail everyone waiting on the result.
+        task = flights[key] = asyncio.get_running_loop().create_task(
+            _acompute_and_store(cache, key, compute, timeout)
+        )
+        task.add_done_callback(lambda done: _end_async_flight(flights, key, done))
+    return await asyncio.shield(task)
+
+def _end_async_flight(flights, key, task):
+    if flights.get(key) is task:
+        del flights[key]
+    if not task.cancelled():
+        # Mark the exception as retrieved in case every waiter was cancelled.
+        task.exception()
+
+def _unwrap(entry):
+    # Entries written before values were wrapped count as stale, so they get refreshed.
+    if isinstance(entry, CachedValue):
+        return entry
+    return CachedValue(entry, 0.0)
+
+def _wrap(value):
+    return CachedValue(value, time.time()) if value is not None else None
+
+def _get_refresh_executor():
+    global _refresh_executor
+    with _refreshing_lock:
+        if _refresh_executor is None:
+            _refresh_executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'CACHE_REFRESH_WORKERS', 4),
+                thread_name_prefix='cache-refresh',
+            )
+        return _refresh_executor
+
+def _claim_refresh(key):
+    # One refresh per key: per process through _refreshing, across workers through the lock row.
+    with _refreshing_lock:
+        if key in _refreshing:
+            return False
+        _refreshing.add(key)
+    return True
+
+def _release_refresh(key):
+    with _refreshing_lock:
+        _refreshing.discard(key)
+
+def _refresh(cache, key, compute, timeout):
+    lock_timeout, _ = _stampede_settings()
+    try:
+        if not cache.add(_lock_key(key), True, lock_timeout):
+            return
+        try:
+            entry = _wrap(compute())
+            if entry is not None:
+                cache.set(key, entry, timeout)
+        finally:
+            cache.delete(_lock_key(key))
+    except Exception as e:
+        logger.warning("Cache refresh error for %s: %s", key, e)
+    finally:
+        _release_refresh(key)
+        close_old_connections()
+
+async def _arefresh(cache, key, compute, timeout):
+    lock_timeout, _ = _stampede_settings()
+    try:
+        if not await cache.aadd(_lock_key(key), True, lock_timeout):
+            return
+        try:
+            entry = _wrap(await compute())
+            if entry is not None:
+                await cache.aset(key, entry, timeout)
+        finally:
+            await cache.adelete(_lock_key(key))
+    except Exception as e:
+        logger.warning("Cache refresh error for %s: %s", key, e)
+    finally:
+        _release_refresh(key)
+
+def cache_get_or_refresh(key, compute, fresh_for, stale_for, cache=None):
+    """
+    Stale-while-revalidate lookup. Returns (value, fetched_at, stale).
+
+    Values are kept for fresh_for + stale_for seconds. Within fresh_for they
+    are returned as they are; after that they are still returned at once, but
+    compute() runs in a background thread to replace them. A missing key is
+    filled the way cache_get_or_compute() fills it. (None, None, False) means
+    compute() returned None, which is never cached.
+    """
+    cache = cache or default_cache
+    timeout = fresh_for + stale_for
+    entry = cache.get(key)
+
+    if entry is None:
+        record_cache_lookup(key, 'miss')
+        entry = _single_flight(cache, key, lambda: _wrap(compute()), timeout)
+        if entry is None:
+            return None, None, False
+        return entry.value, entry.fetched_at, False
+
+    entry = _unwrap(entry)
+    stale = time.time() - entry.fetched_at > fresh_for
+    record_cache_lookup(key, 'stale' if stale else 'hit')
+    if stale and _claim_refresh(key):
+        try:
+            _get_refresh_executor().submit(_refresh, cache, key, compute, timeout)
+        except RuntimeError:
+            # The executor is shutting down with the process.
+            _release_refresh(key)
+    return entry.value, entry.fetched_at, stale
+
+async def acache_get_or_refresh(key, compute, fresh_for, stale_for, cache=None):
+    """Async counterpart of cache_get_or_refresh(); the refresh runs as a task on the running loop."""
+    cache = cache or default_cache
+    timeout = fresh_for + stale_for
+    entry = await cache.aget(key)
+
+    if entry is None:
+        async def fill():
+            return _wrap(await compute())
+
+        record_cache_lookup(key, 'miss')
+        entry = await _asingle_flight(cache, key, fill, timeout)
+        if entry is None:
+            return None, None, False
+        return entry.value, entry.fetched_at, False
+
+    entry = _unwrap(entry)
+    stale = time.time() - entry.fetched_at > fresh_for
+    record_cache_lookup(key, 'stale' if stale else 'hit')
+    if stale and _claim_refresh(key):
+        task = asyncio.get_running_loop().create_task(_arefresh(cache, key, compute, timeout))
+        _refresh_tasks.add(task)
+        task.add_done_callback(_refresh_tasks.discard)
+    return entry.value, entry.fetched_at, stale
@@ -0,0 +1,95 @@
+import threading
+import time
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+    def __init__(self, name, retry_in):
+        super().__init__(f"{name} circuit open: retrying in {retry_in:.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker shared by every thread and event loop
+    in the process.
+
+    After failure_threshold failures in a row the circuit opens and calls fail
+    immediately with CircuitOpen. Once reset_timeout has passed, a single
+    probe call is let through: success closes the circuit, failure reopens it.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+        self.stats = {
+            'successes': 0,
+            'failures': 0,
+            'short_circuited': 0,
+            'opened': 0,
+        }
+
+    def before_call(self):
+        with self.lock:
+            if self.state == CLOSED:
+                return
+            retry_in = self.opened_at + self.reset_timeout - time.monotonic()
+            if self.state == OPEN and retry_in <= 0:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return
+            self.stats['short_circuited'] += 1
+            raise CircuitOpen(self.name, max(0.0, retry_in))
+
+    def record(self, success):
+        """Record the outcome of a call let through by before_call(); None means it never reached the upstream."""
+        with self.lock:
+            self.probing = False
+            if success is None:
+                return
+            if success:
+                self.stats['successes'] += 1
+                self.failures = 0
+                self.state = CLOSED
+                return
+
+            self.stats['failures'] += 1
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.stats['opened'] += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+
+def get_breaker(name, failure_threshold=5, reset_timeout=30):
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None or (breaker.failure_threshold, breaker.reset_timeout) != (max(1, failure_threshold), reset_timeout):
+            breaker = _breakers[name] = CircuitBreaker(name, failure_threshold, reset_timeout)
+        return breaker
+
+def circuit_stats():
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    stats = {}
+    for breaker in breakers:
+        with breaker.lock:
+            stats[breaker.name] = dict(breaker.stats, state=breaker.state)
+    return stats
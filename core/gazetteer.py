@@ -0,0 +1,154 @@
+import bisect
+import csv
+import heapq
+import math
+import re
+import unicodedata
+from functools import lru_cache
+from pathlib import Path
+from typing import NamedTuple
+from core.african_countries import AFRICAN_COUNTRIES
+from core.geo import haversine_km
+
+GAZETTEER_PATH = Path(__file__).resolve().parent / 'data' / 'african_places.csv'
+# Cell size, in degrees, of the grid used for nearest-place lookups.
+GRID_DEGREES = 1.0
+KM_PER_DEGREE = 111.32
+
+# Other spellings of the AFRICAN_COUNTRIES names, including those Nominatim returns.
+COUNTRY_ALIASES = {
+    "cote d'ivoire": 'Ivory Coast',
+    'democratic republic of the congo': 'Congo (Kinshasa)',
+    'dr congo': 'Congo (Kinshasa)',
+    'drc': 'Congo (Kinshasa)',
+    'republic of the congo': 'Congo (Brazzaville)',
+    'congo': 'Congo (Brazzaville)',
+    'cape verde': 'Cabo Verde',
+    'swaziland': 'Eswatini',
+    'the gambia': 'Gambia',
+    'sao tome': 'Sao Tome and Principe',
+}
+
+
+class Place(NamedTuple):
+    name: str
+    country: str
+    latitude: float
+    longitude: float
+    population: int
+
+
+def normalize(text: str) -> str:
+    # Case-, accent- and punctuation-insensitive: "San-Pédro" and "san pedro" match.
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    text = text.replace("'", '')
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', text.lower()).split())
+
+_COUNTRIES = {normalize(country): country for country in AFRICAN_COUNTRIES}
+_COUNTRIES.update({normalize(alias): country for alias, country in COUNTRY_ALIASES.items()})
+
+def resolve_country(text: str) -> str | None:
+    return _COUNTRIES.get(normalize(text))
+
+
+class Gazetteer:
+    """
+    In-memory index of populated places.
+
+    Places are ranked by population, so ids double as ranks. Exact lookups go
+    through a dict; prefix matches bisect a sorted list of every word-start
+    suffix of each name ("dar es salaam", "es salaam", "salaam"); nearest-place
+    queries only measure places in the grid cells within reach.
+    """
+
+    def __init__(self, places):
+        self.places = sorted(places, key=lambda place: -place.population)
+        self._by_name = {}
+        self._grid = {}
+        prefix_entries = []
+
+        for place_id, place in enumerate(self.places):
+            key = normalize(place.name)
+            self._by_name.setdefault(key, []).append(place_id)
+            self._grid.setdefault(self._cell(place.latitude, place.longitude), []).append(place_id)
+            words = key.split()
+            for start in range(len(words)):
+                prefix_entries.append((' '.join(words[start:]), place_id))
+
+        prefix_entries.sort()
+        self._prefix_keys = [key for key, _ in prefix_entries]
+        self._prefix_ids = [place_id for _, place_id in prefix_entries]
+
+    @staticmethod
+    def _cell(lat: float, lon: float) -> tuple:
+        return math.floor(lat / GRID_DEGREES), math.floor(lon / GRID_DEGREES)
+
+    @classmethod
+    def load(cls, path=GAZETTEER_PATH):
+        with open(path, newline='', encoding='utf-8') as f:
+            places = [
+                Place(row['name'], row['country'], float(row['latitude']),
+                      float(row['longitude']), int(row['population']))
+                for row in csv.DictReader(f)
+            ]
+        return cls(places)
+
+    def lookup(self, name: str, country: str = '') -> Place | None:
+        """Return the most populous place called name (in country, if given)."""
+        for place_id in self._by_name.get(normalize(name), ()):
+            place = self.places[place_id]
+            if not country or place.country == country:
+                return place
+        return None
+
+    def complete(self, prefix: str, country: str = '', limit: int = 8) -> list:
+        """Return up to limit places with a word starting with prefix, most populous first."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+
+        start = bisect.bisect_left(self._prefix_keys, prefix)
+        end = bisect.bisect_left(self._prefix_keys, prefix + '\uffff', lo=start)
+        place_ids = {
+            place_id for place_id in self._prefix_ids[start:end]
+            if not country or self.places[place_id].country == country
+        }
+        return [self.places[place_id] for place_id in heapq.nsmallest(limit, place_ids)]
+
+    def nearest(self, lat: float, lon: float, max_km: float) -> tuple:
+        """Return (place, distance_km) for the closest place within max_km, or (None, None)."""
+        lat_cells = math.ceil(max_km / KM_PER_DEGREE / GRID_DEGREES)
+        lon_scale = max(math.cos(math.radians(min(abs(lat) + lat_cells * GRID_DEGREES, 89))), 0.01)
+        lon_cells = math.ceil(max_km / (KM_PER_DEGREE * lon_scale) / GRID_DEGREES)
+        row, col = self._cell(lat, lon)
+
+        best, best_km = None, max_km
+        for cell_row in range(row - lat_cells, row + lat_cells + 1):
+            for cell_col in range(col - lon_cells, col + lon_cells + 1):
+                for place_id in self._grid.get((cell_row, cell_col), ()):
+                    place = self.places[place_id]
+                    distance = haversine_km(lat, lon, place.latitude, place.longitude)
+                    if distance <= best_km:
+                        best, best_km = place, distance
+        return (best, best_km) if best else (None, None)
+
+
+@lru_cache(maxsize=1)
+def get_gazetteer() -> Gazetteer:
+    return Gazetteer.load()
+
+def lookup_place(query: str) -> Place | None:
+    """
+    Resolve "Town" or "Town, Country" against the gazetteer. A trailing part
+    that is not a known country means the query is more specific than the
+    gazetteer (e.g. "Ikeja, Lagos"), so it is left to the online geocoder.
+    """
+    name, _, country = query.rpartition(',')
+    if not name:
+        return get_gazetteer().lookup(country)
+
+    country = resolve_country(country)
+    if country is None:
+        return None
+    return get_gazetteer().lookup(name, country)
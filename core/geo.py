@@ -0,0 +1,115 @@
+import math
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+BASE32_INDEX = {char: index for index, char in enumerate(BASE32)}
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def geohash_encode(lat: float, lon: float, precision: int = 9) -> str:
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if lon >= mid:
+                bits = (bits << 1) | 1
+                lon_range[0] = mid
+            else:
+                bits = bits << 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if lat >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits = bits << 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(chars)
+
+def geohash_bounds(geohash: str) -> tuple:
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+
+    for char in geohash:
+        value = BASE32_INDEX[char]
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            target = lon_range if even else lat_range
+            mid = (target[0] + target[1]) / 2
+            if bit:
+                target[0] = mid
+            else:
+                target[1] = mid
+            even = not even
+
+    return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
+
+def geohash_prefix_end(prefix: str) -> str | None:
+    """
+    The first geohash past every hash that starts with `prefix`, or None when
+    no hash comes after them. Built from geohash characters only, so the
+    bound holds under any collation that orders digits before letters.
+    """
+    prefix = prefix.rstrip(BASE32[-1])
+    if not prefix:
+        return None
+    return prefix[:-1] + BASE32[BASE32_INDEX[prefix[-1]] + 1]
+
+def geohash_center(geohash: str) -> tuple:
+    lat_min, lat_max, lon_min, lon_max = geohash_bounds(geohash)
+    return (lat_min + lat_max) / 2, (lon_min + lon_max) / 2
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+def geohash_cell_size(precision: int) -> tuple:
+    """(height, width) in degrees of a geohash cell of this precision."""
+    bits = 5 * precision
+    return 180 / 2 ** (bits // 2), 360 / 2 ** (bits - bits // 2)
+
+def geohash_cover(lat: float, lon: float, radius_km: float, max_precision: int = 9) -> list:
+    """
+    Geohash prefixes whose cells hold every point within radius_km of
+    (lat, lon): the cell of the point and its eight neighbours, at the finest
+    precision whose cells are at least radius_km across. [''] (every hash)
+    when even single-character cells are too small, i.e. near the poles.
+    """
+    lat_span = radius_km / KM_PER_DEGREE
+    # Measured at the circle's edge nearest a pole, where a degree of longitude is shortest.
+    edge_cos = math.cos(math.radians(min(abs(lat) + lat_span, 90)))
+    lon_span = lat_span / edge_cos if edge_cos > 1e-9 else 360
+
+    for precision in range(max_precision, 0, -1):
+        height, width = geohash_cell_size(precision)
+        if height >= lat_span and width >= lon_span:
+            break
+    else:
+        return ['']
+
+    cells = set()
+    for dlat in (-height, 0, height):
+        for dlon in (-width, 0, width):
+            cell_lat = min(max(lat + dlat, -90), 90)
+            cell_lon = (lon + dlon + 180) % 360 - 180
+            cells.add(geohash_encode(cell_lat, cell_lon, precision))
+    return sorted(cells)
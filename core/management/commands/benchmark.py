@@ -0,0 +1,151 @@
+import json
+import os
+import tempfile
+import warnings
+from datetime import datetime, timezone
+from pathlib import Path
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import CacheKeyWarning
+from django.core.management.base import BaseCommand, CommandError
+from analysis.fake_upstreams import FAKE_PROVIDERS, FakeUpstreams
+from core.benchmark import (
+    ENDPOINTS, compare, default_output_path, endpoint_requests, environment, git_revision,
+    run_requests, seed_snapshots
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed ReportSnapshot rows and measure p50/p95/p99 latency and throughput of the main '
+        'views against local stand-ins for every upstream API. Seeds and clears the caches of '
+        'the configured database, so point DATABASE_URL at a dedicated one.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000,
+                            help='Seeded snapshots to benchmark against, e.g. 10000, 100000 or 1000000.')
+        parser.add_argument('--seed-only', action='store_true', help='Seed the rows and exit.')
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                            help=f"Comma-separated views to measure (default: {','.join(ENDPOINTS)}).")
+        parser.add_argument('--requests', type=int, default=200, help='Requests per archive view.')
+        parser.add_argument('--live-requests', type=int, default=50, help='Requests to live_report.')
+        parser.add_argument('--concurrency', type=int, default=1, help='Client threads per view.')
+        parser.add_argument('--latency', action='append', default=[],
+                            help='Fake upstream latency in seconds: "0.05" for all, or provider=seconds '
+                                 f"({', '.join(FAKE_PROVIDERS)}). May be repeated.")
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the request mix.')
+        parser.add_argument('--keep-cache', action='store_true',
+                            help='Do not clear the caches first (results then depend on earlier runs).')
+        parser.add_argument('--output', help='Where to write the JSON results (default: var/benchmarks/).')
+        parser.add_argument('--compare', help='Earlier results file to report changes against.')
+
+    def _parse_latency(self, values):
+        latency = {}
+        for value in values:
+            for part in value.split(','):
+                provider, _, seconds = part.rpartition('=')
+                try:
+                    seconds = float(seconds)
+                except ValueError:
+                    raise CommandError(f"Invalid --latency value: {part}")
+                if not provider:
+                    latency.update({name: seconds for name in FAKE_PROVIDERS})
+                elif provider in FAKE_PROVIDERS:
+                    latency[provider] = seconds
+                else:
+                    raise CommandError(f"Unknown provider in --latency: {provider}")
+        return latency
+
+    def _use_fakes(self, fakes):
+        # Point every provider at its stand-in. Rate limits are lifted: they would
+        # measure the upstream's quota rather than this code.
+        providers = {name: dict(config) for name, config in settings.UPSTREAM_PROVIDERS.items()}
+        for name in FAKE_PROVIDERS:
+            providers.setdefault(name, {}).update({'base_url': fakes.base_url(name), 'rate_limit': None})
+        settings.UPSTREAM_PROVIDERS = providers
+        os.environ['GEMINI_API_KEY'] = 'benchmark'
+        os.environ['OPENWEATHER_API_KEY'] = 'benchmark'
+
+    def handle(self, *args, **options):
+        endpoints = [name.strip() for name in options['endpoints'].split(',') if name.strip()]
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoint(s): {', '.join(sorted(unknown))}")
+        latency = self._parse_latency(options['latency'])
+
+        # Query logging under DEBUG would be measured along with the views.
+        settings.DEBUG = False
+        # Free-text geocode keys are fine for the database cache but warn on every lookup.
+        warnings.simplefilter('ignore', CacheKeyWarning)
+
+        def progress(done, total):
+            self.stdout.write(f"  seeded {done}/{total}")
+
+        added = seed_snapshots(options['rows'], progress=progress)
+        self.stdout.write(f"Seeded {added} snapshot(s); {options['rows']} in the benchmark set")
+        if options['seed_only']:
+            return
+
+        if not options['keep_cache']:
+            for alias in settings.CACHES:
+                caches[alias].clear()
+
+        fakes = FakeUpstreams(latency).start()
+        self._use_fakes(fakes)
+        # Decoded NDVI tiles persist on disk, so each run starts from an empty tile store.
+        tile_dir = tempfile.TemporaryDirectory(prefix='asase-bench-tiles-')
+        if not options['keep_cache']:
+            settings.NDVI_TILE_CACHE_DIR = Path(tile_dir.name)
+        results = {}
+        try:
+            for endpoint in endpoints:
+                count = options['live_requests'] if endpoint == 'live_report' else options['requests']
+                requests = endpoint_requests(endpoint, count, options['seed'])
+                if not requests:
+                    self.stderr.write(f"{endpoint}: nothing to request, skipped")
+                    continue
+                results[endpoint] = run_requests(requests, options['concurrency'])
+                result = results[endpoint]
+                self.stdout.write(
+                    f"{endpoint:<20} p50 {result['p50_ms']:>9.2f}ms  p95 {result['p95_ms']:>9.2f}ms  "
+                    f"p99 {result['p99_ms']:>9.2f}ms  {result['throughput_rps']:>8.2f} req/s"
+                    + (f"  {result['errors']} error(s)" if result['errors'] else '')
+                )
+        finally:
+            fakes.stop()
+            tile_dir.cleanup()
+
+        revision = git_revision()
+        report = {
+            'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'revision': revision,
+            'environment': environment(),
+            'config': {
+                'rows': options['rows'],
+                'requests': options['requests'],
+                'live_requests': options['live_requests'],
+                'concurrency': options['concurrency'],
+                'latency': latency,
+                'seed': options['seed'],
+                'cold_cache': not options['keep_cache'],
+            },
+            'upstream_requests': fakes.requests,
+            'results': results,
+        }
+
+        output = Path(options['output']) if options['output'] else default_output_path(revision, options['rows'])
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2) + '\n')
+        self.stdout.write(f"Results written to {output}")
+
+        if options['compare']:
+            try:
+                baseline = json.loads(Path(options['compare']).read_text())
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Cannot read {options['compare']}: {e}")
+            if baseline.get('config', {}).get('rows') != options['rows']:
+                self.stderr.write('Baseline was measured with a different --rows; changes are not comparable.')
+            self.stdout.write(f"Compared with {baseline.get('revision', {}).get('describe', options['compare'])}:")
+            for endpoint, metric, old, new, change in compare(report, baseline):
+                self.stdout.write(f"  {endpoint:<20} {metric:<15} {old:>10} -> {new:>10}  ({change:+.1f}%)")
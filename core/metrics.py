@@ -0,0 +1,173 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from core.circuit import circuit_stats
+from core.ratelimit import rate_limit_stats
+
+# Histogram buckets in seconds, from a cached lookup up to a slow model call.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Cache key prefixes reported as separate families, longest first.
+CACHE_KEY_FAMILIES = (
+    'ai_analysis', 'ndvi_tile', 'map_tile', 'live_report', 'geocode', 'reverse', 'weather', 'elevation', 'ndvi', 'page',
+)
+
+CIRCUIT_STATE_VALUES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_help = {}
+_stage_timings = ContextVar('stage_timings', default=None)
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+def inc(name, amount=1, help_text='', **labels):
+    with _lock:
+        _help.setdefault(name, ('counter', help_text))
+        key = (name, _labels_key(labels))
+        _counters[key] = _counters.get(key, 0) + amount
+
+def observe(name, seconds, help_text='', **labels):
+    with _lock:
+        _help.setdefault(name, ('histogram', help_text))
+        key = (name, _labels_key(labels))
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0, 'count': 0}
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                histogram['buckets'][index] += 1
+        histogram['sum'] += seconds
+        histogram['count'] += 1
+
+def cache_family(key):
+    for family in CACHE_KEY_FAMILIES:
+        if key.startswith(family + '_'):
+            return family
+    return 'other'
+
+def record_cache_lookup(key, result):
+    # result is 'hit', 'stale' or 'miss'.
+    inc('asase_cache_lookups_total', help_text='Cache lookups by key family and result.',
+        family=cache_family(key), result=result)
+
+
+@contextmanager
+def collect_stage_timings():
+    """Collect the stages timed in this context (including tasks it starts) into a list of (stage, seconds)."""
+    timings = []
+    token = _stage_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _stage_timings.reset(token)
+
+@contextmanager
+def stage(name):
+    """Time a stage of report generation, for the Server-Timing header and the stage histogram."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        observe('asase_stage_seconds', elapsed, help_text='Time spent in each report stage.', stage=name)
+        timings = _stage_timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+def server_timing_header(timings, total=None):
+    # Stages that ran more than once (e.g. two DB writes) are summed.
+    durations = {}
+    for name, seconds in timings:
+        durations[name] = durations.get(name, 0.0) + seconds
+    if total is not None:
+        durations['total'] = total
+    return ', '.join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in durations.items())
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + pairs + '}'
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+def _sample_lines(name, kind, help_text, samples):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{_format_labels(_labels_key(labels))} {_format_value(value)}")
+    return lines
+
+def cache_hit_ratios():
+    # (hits + stale hits) / lookups for each cache key family seen so far.
+    totals = {}
+    with _lock:
+        for (metric, labels), value in _counters.items():
+            if metric != 'asase_cache_lookups_total':
+                continue
+            labels = dict(labels)
+            hits, total = totals.get(labels['family'], (0, 0))
+            if labels['result'] != 'miss':
+                hits += value
+            totals[labels['family']] = (hits, total + value)
+    return {family: round(hits / total, 4) for family, (hits, total) in totals.items() if total}
+
+def _scrape_time_metrics():
+    # Read from the rate limiters, circuit breakers and cache counters when scraped.
+    rate_limits = rate_limit_stats()
+    circuits = circuit_stats()
+    yield ('asase_cache_hit_ratio', 'gauge', 'Share of cache lookups served from cache (fresh or stale).',
+           [({'family': family}, ratio) for family, ratio in sorted(cache_hit_ratios().items())])
+    yield ('asase_rate_limit_waiting', 'gauge', 'Callers currently queued for a provider token.',
+           [({'provider': name}, stats['waiting']) for name, stats in sorted(rate_limits.items())])
+    for stat in ('requests', 'throttled', 'rejected', 'upstream_throttled'):
+        yield (f'asase_rate_limit_{stat}_total', 'counter', f'Rate limiter {stat.replace("_", " ")} count.',
+               [({'provider': name}, stats[stat]) for name, stats in sorted(rate_limits.items())])
+    yield ('asase_rate_limit_wait_seconds_total', 'counter', 'Total time callers spent queued for a token.',
+           [({'provider': name}, stats['wait_seconds']) for name, stats in sorted(rate_limits.items())])
+    yield ('asase_circuit_state', 'gauge', 'Circuit state per provider (0 closed, 1 half open, 2 open).',
+           [({'provider': name}, CIRCUIT_STATE_VALUES[stats['state']]) for name, stats in sorted(circuits.items())])
+    yield ('asase_circuit_short_circuited_total', 'counter', 'Calls refused while the circuit was open.',
+           [({'provider': name}, stats['short_circuited']) for name, stats in sorted(circuits.items())])
+
+def render_prometheus():
+    """Render every metric in the Prometheus text exposition format. Values are per process."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: dict(value, buckets=list(value['buckets'])) for key, value in _histograms.items()}
+        help_entries = dict(_help)
+
+    lines = []
+    for name in sorted(help_entries):
+        kind, help_text = help_entries[name]
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+            continue
+
+        for (metric, labels), histogram in sorted(histograms.items()):
+            if metric != name:
+                continue
+            for bound, count in zip(LATENCY_BUCKETS, histogram['buckets']):
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram['sum'])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+
+    for name, kind, help_text, samples in _scrape_time_metrics():
+        lines.extend(_sample_lines(name, kind, help_text, samples))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,44 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from core import metrics
+
+
+class ServerTimingMiddleware:
+    """
+    Time every request, add the report stages it ran (geocode, weather, ...)
+    as a Server-Timing header, and record the total in the request latency
+    histogram labelled by URL name.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with metrics.collect_stage_timings() as timings:
+            response = self.get_response(request)
+        return self._finish(request, response, timings, start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with metrics.collect_stage_timings() as timings:
+            response = await self.get_response(request)
+        return self._finish(request, response, timings, start)
+
+    def _finish(self, request, response, timings, start):
+        elapsed = time.perf_counter() - start
+        match = request.resolver_match
+        metrics.observe(
+            'asase_request_seconds', elapsed, help_text='Request latency by URL name.',
+            view=match.view_name if match else 'unmatched', method=request.method,
+        )
+        # Streamed responses are timed up to the point the stream starts.
+        response['Server-Timing'] = metrics.server_timing_header(timings, elapsed)
+        return response
@@ -0,0 +1,129 @@
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+_DEFAULT_PATIENCE = object()
+_patience = ContextVar('rate_limit_patience', default=_DEFAULT_PATIENCE)
+
+
+class RateLimited(Exception):
+    """Raised when a call would have to wait longer than its allowed queueing time."""
+
+    def __init__(self, name, wait):
+        super().__init__(f"{name} rate limit: next slot in {wait:.1f}s")
+        self.name = name
+        self.wait = wait
+
+
+class TokenBucket:
+    """
+    Token bucket shared by every thread and event loop in the process.
+
+    A caller that finds the bucket empty reserves the next token anyway (the
+    balance goes negative) and is told how long to sleep, so waiting callers
+    are served in arrival order at exactly `rate` per second. Reservations
+    that would wait longer than max_wait are refused instead.
+    """
+
+    def __init__(self, name, rate, burst=1):
+        self.name = name
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+        self.stats = {
+            'requests': 0,
+            'throttled': 0,
+            'rejected': 0,
+            'waiting': 0,
+            'wait_seconds': 0.0,
+            'upstream_throttled': 0,
+        }
+
+    def reserve(self, max_wait):
+        """Take a token and return how long to wait for it, or None if that exceeds max_wait."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            wait = max(0.0, (1 - self.tokens) / self.rate, self.blocked_until - now)
+            if max_wait is not None and wait > max_wait:
+                self.stats['rejected'] += 1
+                return None
+
+            self.tokens -= 1
+            self.stats['requests'] += 1
+            if wait:
+                self.stats['throttled'] += 1
+                self.stats['wait_seconds'] += wait
+            return wait
+
+    def penalize(self, seconds):
+        # The upstream told us to back off (429 + Retry-After): hold every caller until then.
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.stats['upstream_throttled'] += 1
+
+    def _reserve_or_raise(self, max_wait):
+        override = _patience.get()
+        if override is not _DEFAULT_PATIENCE:
+            max_wait = override
+        wait = self.reserve(max_wait)
+        if wait is None:
+            raise RateLimited(self.name, max(0.0, (1 - self.tokens) / self.rate))
+        return wait
+
+    def _set_waiting(self, delta):
+        with self.lock:
+            self.stats['waiting'] += delta
+
+    def acquire(self, max_wait=None):
+        wait = self._reserve_or_raise(max_wait)
+        if wait:
+            self._set_waiting(1)
+            try:
+                time.sleep(wait)
+            finally:
+                self._set_waiting(-1)
+
+    async def aacquire(self, max_wait=None):
+        wait = self._reserve_or_raise(max_wait)
+        if wait:
+            self._set_waiting(1)
+            try:
+                await asyncio.sleep(wait)
+            finally:
+                self._set_waiting(-1)
+
+
+def get_bucket(name, rate, burst=1):
+    with _buckets_lock:
+        bucket = _buckets.get(name)
+        if bucket is None or (bucket.rate, bucket.capacity) != (rate, max(1, burst)):
+            bucket = _buckets[name] = TokenBucket(name, rate, burst)
+        return bucket
+
+def rate_limit_stats():
+    with _buckets_lock:
+        buckets = list(_buckets.values())
+    stats = {}
+    for bucket in buckets:
+        with bucket.lock:
+            stats[bucket.name] = dict(bucket.stats, rate=bucket.rate, burst=bucket.capacity)
+    return stats
+
+@contextmanager
+def rate_limit_patience(seconds):
+    """Let calls in this context queue for up to `seconds` (None: indefinitely), e.g. for batch jobs."""
+    token = _patience.set(seconds)
+    try:
+        yield
+    finally:
+        _patience.reset(token)
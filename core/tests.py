@@ -1,3 +1,419 @@
-from django.test import TestCase
+import asyncio
+import math
+import random
+import threading
+import time
+from unittest import mock
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import SimpleTestCase, TestCase, override_settings
+from core.cache import (
+    CachedValue, acache_get_or_compute, acache_get_or_refresh, cache_get_or_compute, cache_get_or_refresh,
+)
+from core.circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+from core.gazetteer import Gazetteer, Place, lookup_place, normalize, resolve_country
+from core.geo import (
+    KM_PER_DEGREE, geohash_bounds, geohash_cover, geohash_encode, geohash_prefix_end, haversine_km,
+)
+from core.ratelimit import RateLimited, TokenBucket, rate_limit_patience
 
-# Create your tests here.
+PLACES = [
+    Place('Kumasi', 'Ghana', 6.69, -1.62, 2000000),
+    Place('Accra', 'Ghana', 5.56, -0.2, 2500000),
+    Place('San-Pédro', 'Ivory Coast', 4.75, -6.64, 200000),
+    Place('San Pedro', 'Nigeria', 7.0, 3.0, 1000),
+    Place('Dar es Salaam', 'Tanzania', -6.8, 39.28, 4000000),
+    Place('Salaga', 'Ghana', 8.55, -0.52, 20000),
+]
+
+
+def local_cache(name) -> LocMemCache:
+    return LocMemCache(name, {})
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('condition not met in time')
+        time.sleep(0.01)
+
+def fake_clock(now=100.0):
+    return mock.patch('core.ratelimit.time', monotonic=mock.Mock(return_value=now), sleep=mock.Mock())
+
+
+class GeohashTests(SimpleTestCase):
+    def test_encode_known_point(self):
+        self.assertEqual(geohash_encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+
+    def test_bounds_contain_point(self):
+        lat_min, lat_max, lon_min, lon_max = geohash_bounds(geohash_encode(6.69, -1.62))
+        self.assertTrue(lat_min <= 6.69 <= lat_max and lon_min <= -1.62 <= lon_max)
+
+    def test_prefix_end_bounds_every_hash_with_the_prefix(self):
+        rng = random.Random(1)
+        hashes = sorted(geohash_encode(rng.uniform(-90, 90), rng.uniform(-180, 180), 6) for _ in range(2000))
+        for prefix in ('s', 'ez', 'kz', '7zz', '0'):
+            end = geohash_prefix_end(prefix)
+            in_range = [value for value in hashes if value >= prefix and value < end]
+            self.assertEqual(in_range, [value for value in hashes if value.startswith(prefix)])
+
+    def test_prefix_end_of_last_prefixes(self):
+        self.assertEqual(geohash_prefix_end('s0'), 's1')
+        self.assertEqual(geohash_prefix_end('bz'), 'c')
+        self.assertIsNone(geohash_prefix_end('zz'))
+        self.assertIsNone(geohash_prefix_end(''))
+
+    def test_cover_holds_every_point_within_radius(self):
+        rng = random.Random(2)
+        centres = [(rng.uniform(-80, 80), rng.uniform(-180, 180)) for _ in range(50)]
+        # The antimeridian and the edges of cells at the equator and prime meridian.
+        centres += [(0.0, 179.999), (0.0, -179.999), (0.0, 0.0), (45.0, 0.0)]
+        for lat, lon in centres:
+            for radius_km in (0.3, 5, 80):
+                cells = geohash_cover(lat, lon, radius_km)
+                for _ in range(30):
+                    bearing = rng.uniform(0, 2 * math.pi)
+                    distance = radius_km * rng.uniform(0.5, 1) / KM_PER_DEGREE
+                    point_lat = lat + distance * math.cos(bearing)
+                    point_lon = lon + distance * math.sin(bearing) / math.cos(math.radians(point_lat))
+                    point_lon = (point_lon + 180) % 360 - 180
+                    if haversine_km(lat, lon, point_lat, point_lon) > radius_km:
+                        continue
+                    point = geohash_encode(point_lat, point_lon)
+                    self.assertTrue(any(point.startswith(cell) for cell in cells), (lat, lon, radius_km))
+
+    def test_cover_near_the_poles_is_everything(self):
+        self.assertEqual(geohash_cover(89.9, 10, 50), [''])
+
+
+class MetricsAccessTests(SimpleTestCase):
+    @override_settings(METRICS_TOKEN='', DEBUG=False)
+    def test_refused_without_token_outside_debug(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+
+    @override_settings(METRICS_TOKEN='', DEBUG=True)
+    def test_open_without_token_under_debug(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='secret', DEBUG=False)
+    def test_requires_bearer_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code, 401)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+
+class TieredCacheTests(TestCase):
+    def setUp(self):
+        self.cache = caches['default']
+        self.cache.clear()
+
+    def test_reads_are_served_from_the_local_tier(self):
+        self.cache.set('key', 'first')
+        # Another worker replaces the shared row.
+        DatabaseCache.set(self.cache, 'key', 'second')
+
+        self.assertEqual(self.cache.get('key'), 'first')
+        self.assertEqual(self.cache.get_shared('key'), 'second')
+        self.assertEqual(self.cache.get_many(['key']), {'key': 'first'})
+
+    def test_misses_fill_the_local_tier(self):
+        DatabaseCache.set(self.cache, 'key', 'shared')
+
+        self.assertEqual(self.cache.get('key'), 'shared')
+        DatabaseCache.delete(self.cache, 'key')
+        self.assertEqual(self.cache.get('key'), 'shared')
+        self.assertIsNone(self.cache.get_shared('key'))
+
+    def test_add_and_delete_go_through_the_shared_table(self):
+        self.assertTrue(self.cache.add('lock', 1))
+        self.assertFalse(self.cache.add('lock', 2))
+        DatabaseCache.delete(self.cache, 'lock')
+        self.assertTrue(self.cache.add('lock', 3))
+
+        self.cache.delete('lock')
+        self.assertIsNone(self.cache.get('lock'))
+
+
+class CacheGetOrComputeTests(SimpleTestCase):
+    def test_concurrent_misses_compute_once(self):
+        cache = local_cache('single-flight')
+        started, release = threading.Event(), threading.Event()
+        calls, results = [], []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(2)
+            return 'value'
+
+        def get():
+            results.append(cache_get_or_compute('key', compute, 60, cache=cache))
+
+        leader = threading.Thread(target=get)
+        leader.start()
+        started.wait(2)
+        followers = [threading.Thread(target=get) for _ in range(4)]
+        for thread in followers:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in [leader, *followers]:
+            thread.join(2)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['value'] * 5)
+        self.assertEqual(cache.get('key'), 'value')
+        self.assertIsNone(cache.get('key:refresh-lock'))
+
+    def test_none_is_not_cached(self):
+        cache = local_cache('none')
+        compute = mock.Mock(return_value=None)
+
+        self.assertIsNone(cache_get_or_compute('key', compute, 60, cache=cache))
+        self.assertIsNone(cache_get_or_compute('key', compute, 60, cache=cache))
+        self.assertEqual(compute.call_count, 2)
+
+    async def test_async_misses_compute_once(self):
+        cache = local_cache('async-single-flight')
+        release = asyncio.Event()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await release.wait()
+            return 'value'
+
+        tasks = [asyncio.create_task(acache_get_or_compute('key', compute, 60, cache=cache)) for _ in range(5)]
+        await asyncio.sleep(0.05)
+        release.set()
+
+        self.assertEqual(await asyncio.gather(*tasks), ['value'] * 5)
+        self.assertEqual(len(calls), 1)
+
+    async def test_async_waiters_survive_the_leader_being_cancelled(self):
+        cache = local_cache('async-cancel')
+        release = asyncio.Event()
+
+        async def compute():
+            await release.wait()
+            return 'value'
+
+        leader = asyncio.create_task(acache_get_or_compute('key', compute, 60, cache=cache))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(acache_get_or_compute('key', compute, 60, cache=cache))
+        await asyncio.sleep(0.01)
+        # The leading request's client disconnects.
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        self.assertEqual(await follower, 'value')
+        self.assertTrue(leader.cancelled())
+        self.assertEqual(cache.get('key'), 'value')
+
+    async def test_async_errors_reach_every_waiter(self):
+        cache = local_cache('async-errors')
+
+        async def compute():
+            await asyncio.sleep(0.01)
+            raise ValueError('upstream down')
+
+        results = await asyncio.gather(
+            *(acache_get_or_compute('key', compute, 60, cache=cache) for _ in range(3)), return_exceptions=True
+        )
+
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertIsNone(cache.get('key:refresh-lock'))
+
+
+class CacheGetOrRefreshTests(SimpleTestCase):
+    def test_fresh_value_is_returned_as_is(self):
+        cache = local_cache('fresh')
+        compute = mock.Mock(return_value='value')
+
+        first = cache_get_or_refresh('key', compute, 60, 600, cache=cache)
+        second = cache_get_or_refresh('key', compute, 60, 600, cache=cache)
+
+        self.assertEqual((first[0], first[2]), ('value', False))
+        self.assertEqual(second, first)
+        self.assertEqual(compute.call_count, 1)
+
+    def test_stale_value_is_returned_and_refreshed_in_background(self):
+        cache = local_cache('stale')
+        cache.set('key', CachedValue('old', time.time() - 120), 660)
+
+        value, fetched_at, stale = cache_get_or_refresh('key', lambda: 'new', 60, 600, cache=cache)
+
+        self.assertEqual((value, stale), ('old', True))
+        wait_for(lambda: cache.get('key').value == 'new')
+        self.assertGreater(cache.get('key').fetched_at, fetched_at)
+
+    def test_failed_refresh_keeps_the_stale_value(self):
+        cache = local_cache('failed-refresh')
+        cache.set('key', CachedValue('old', time.time() - 120), 660)
+        compute = mock.Mock(side_effect=ValueError('upstream down'))
+
+        with self.assertLogs('core.cache', 'WARNING'):
+            cache_get_or_refresh('key', compute, 60, 600, cache=cache)
+            wait_for(lambda: compute.called and cache.get('key:refresh-lock') is None)
+            time.sleep(0.05)
+
+        self.assertEqual(cache.get('key').value, 'old')
+
+    async def test_async_unwrapped_entries_count_as_stale(self):
+        cache = local_cache('legacy')
+        cache.set('key', 'legacy')
+
+        async def compute():
+            return 'new'
+
+        value, fetched_at, stale = await acache_get_or_refresh('key', compute, 60, 600, cache=cache)
+
+        self.assertEqual((value, fetched_at, stale), ('legacy', 0.0, True))
+        for _ in range(100):
+            if isinstance(cache.get('key'), CachedValue):
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(cache.get('key').value, 'new')
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_burst_then_one_token_per_interval(self):
+        with fake_clock():
+            bucket = TokenBucket('test', rate=2, burst=2)
+            waits = [bucket.reserve(None) for _ in range(4)]
+
+        # Callers past the burst queue in arrival order, one every 1/rate seconds.
+        self.assertEqual(waits, [0.0, 0.0, 0.5, 1.0])
+        self.assertEqual(bucket.stats['throttled'], 2)
+
+    def test_tokens_refill_over_time(self):
+        with fake_clock(100.0) as clock:
+            bucket = TokenBucket('test', rate=2, burst=2)
+            bucket.reserve(None)
+            bucket.reserve(None)
+            clock.monotonic.return_value = 100.5
+            self.assertEqual(bucket.reserve(None), 0.0)
+            clock.monotonic.return_value = 110.0
+            self.assertEqual([bucket.reserve(None), bucket.reserve(None)], [0.0, 0.0])
+
+    def test_refuses_waits_past_max_wait(self):
+        with fake_clock():
+            bucket = TokenBucket('test', rate=1)
+            bucket.reserve(None)
+
+            self.assertIsNone(bucket.reserve(0.5))
+            self.assertEqual(bucket.reserve(1), 1.0)
+        self.assertEqual(bucket.stats['rejected'], 1)
+
+    def test_penalize_holds_every_caller(self):
+        with fake_clock():
+            bucket = TokenBucket('test', rate=10, burst=5)
+            bucket.penalize(30)
+
+            self.assertEqual(bucket.reserve(None), 30)
+
+    def test_acquire_sleeps_or_raises(self):
+        with fake_clock() as clock:
+            bucket = TokenBucket('test', rate=1)
+            bucket.acquire(5)
+            bucket.acquire(5)
+            clock.sleep.assert_called_once_with(1.0)
+
+            with self.assertRaises(RateLimited):
+                bucket.acquire(0.5)
+            # Batch jobs may queue for longer than interactive requests.
+            with rate_limit_patience(None):
+                bucket.acquire(0.5)
+            self.assertEqual(clock.sleep.call_args, mock.call(2.0))
+
+    async def test_aacquire_raises_past_max_wait(self):
+        with fake_clock():
+            bucket = TokenBucket('test', rate=1)
+            await bucket.aacquire(0)
+
+            with self.assertRaises(RateLimited):
+                await bucket.aacquire(0)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker('test', failure_threshold=3, reset_timeout=30)
+        for success in (False, False, True, False, False):
+            breaker.before_call()
+            breaker.record(success)
+        self.assertEqual(breaker.state, CLOSED)
+
+        breaker.before_call()
+        breaker.record(False)
+
+        self.assertEqual(breaker.state, OPEN)
+        with self.assertRaises(CircuitOpen):
+            breaker.before_call()
+        self.assertEqual(breaker.stats['short_circuited'], 1)
+
+    def test_single_probe_after_reset_timeout(self):
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=30)
+        with mock.patch('core.circuit.time.monotonic', return_value=100.0):
+            breaker.before_call()
+            breaker.record(False)
+
+        with mock.patch('core.circuit.time.monotonic', return_value=131.0):
+            breaker.before_call()
+            self.assertEqual(breaker.state, HALF_OPEN)
+            with self.assertRaises(CircuitOpen):
+                breaker.before_call()
+            breaker.record(False)
+        self.assertEqual(breaker.state, OPEN)
+
+        with mock.patch('core.circuit.time.monotonic', return_value=162.0):
+            breaker.before_call()
+            breaker.record(True)
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertEqual(breaker.stats['opened'], 2)
+
+    def test_calls_that_never_reached_the_upstream_do_not_count(self):
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=30)
+        breaker.before_call()
+        breaker.record(None)
+
+        self.assertEqual((breaker.state, breaker.failures), (CLOSED, 0))
+
+
+class GazetteerTests(SimpleTestCase):
+    def setUp(self):
+        self.gazetteer = Gazetteer(PLACES)
+
+    def test_lookup_prefers_most_populous_match(self):
+        self.assertEqual(normalize("San-Pédro"), 'san pedro')
+        self.assertEqual(self.gazetteer.lookup('san pedro').country, 'Ivory Coast')
+        self.assertEqual(self.gazetteer.lookup('SAN PEDRO', 'Nigeria').population, 1000)
+        self.assertIsNone(self.gazetteer.lookup('Kumasi', 'Nigeria'))
+
+    def test_complete_matches_word_starts_by_population(self):
+        self.assertEqual([place.name for place in self.gazetteer.complete('sala')], ['Dar es Salaam', 'Salaga'])
+        self.assertEqual([place.name for place in self.gazetteer.complete('sala', 'Ghana')], ['Salaga'])
+        self.assertEqual([place.name for place in self.gazetteer.complete('a', limit=1)], ['Accra'])
+        self.assertEqual(self.gazetteer.complete('  '), [])
+
+    def test_nearest_within_reach(self):
+        place, distance = self.gazetteer.nearest(6.7, -1.6, 10)
+
+        self.assertEqual(place.name, 'Kumasi')
+        self.assertAlmostEqual(distance, haversine_km(6.7, -1.6, 6.69, -1.62))
+        self.assertEqual(self.gazetteer.nearest(6.7, -1.6, 1), (None, None))
+        self.assertEqual(self.gazetteer.nearest(7.6, -1.62, 120)[0].name, 'Kumasi')
+
+    def test_resolves_country_aliases(self):
+        self.assertEqual(resolve_country("Côte d'Ivoire"), 'Ivory Coast')
+        self.assertEqual(resolve_country('DRC'), 'Congo (Kinshasa)')
+        self.assertIsNone(resolve_country('Lagos'))
+
+    def test_lookup_place_leaves_unknown_qualifiers_to_the_geocoder(self):
+        with mock.patch('core.gazetteer.get_gazetteer', return_value=self.gazetteer):
+            self.assertEqual(lookup_place('Kumasi, Ghana').name, 'Kumasi')
+            self.assertEqual(lookup_place('Kumasi').name, 'Kumasi')
+            self.assertIsNone(lookup_place('Ikeja, Lagos'))
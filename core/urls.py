@@ -8,4 +8,5 @@ urlpatterns = [
     path('map/', views.map_view, name='map'),
     path('about/', views.about, name='about'),
     path('privacy/', views.privacy_policy, name='privacy'),
+    path('autocomplete/', views.autocomplete, name='autocomplete'),
 ]
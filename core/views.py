@@ -1,5 +1,9 @@
+from django.conf import settings
+from django.http import HttpResponse
 from django.shortcuts import render
 from core.african_countries import AFRICAN_COUNTRIES
+from core.gazetteer import get_gazetteer, resolve_country
+from core.metrics import render_prometheus
 
 def search(request):
     context = {
@@ -15,3 +19,17 @@ def about(request):
 
 def privacy_policy(request):
     return render(request, 'core/privacy_policy.html')
+
+def autocomplete(request):
+    query = request.GET.get('location', '')
+    country = resolve_country(request.GET.get('country', '')) or ''
+    places = get_gazetteer().complete(query, country) if len(query.strip()) >= 2 else []
+    return render(request, 'core/autocomplete.html', {'places': places})
+
+def metrics(request):
+    # The scraper sends METRICS_TOKEN as a bearer token; without one the endpoint is only open under DEBUG.
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorized = request.headers.get('Authorization', '') == f"Bearer {token}" if token else settings.DEBUG
+    if not authorized:
+        return HttpResponse('Unauthorized', status=401)
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')